@@ -1,9 +1,13 @@
 import os
+import re
 import json
 import time
 import logging
-from typing import Dict, Any, Optional, List
+from collections import Counter
+from typing import Dict, Any, Optional, List, AsyncIterator
 import requests
+import httpx
+import numpy as np
 from openai import OpenAI
 import anthropic
 
@@ -22,6 +26,8 @@ from langchain.schema import BaseMessage
 from langchain_community.callbacks.manager import get_openai_callback
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from pydantic import BaseModel, Field
+from usage_writer import usage_writer
+from prompt_builder import build_email_reply_messages, cache_read_tokens
 
 # Pydantic models for structured LangChain output
 class EmailAnalysisResult(BaseModel):
@@ -85,6 +91,60 @@ if 'OPENROUTER_MODELS' not in globals():
         'gpt-4o': 'gpt-4o'
     }
 
+# Keyword lexicons for the fallback email analysis, built once at import.
+# Each sentiment term has a (positive, negative) weight; phrases count double.
+_POSITIVE_WORDS = ('thank', 'great', 'excellent', 'wonderful', 'amazing', 'appreciate', 'pleased', 'happy', 'perfect', 'fantastic')
+_POSITIVE_PHRASES = ('thank you', 'well done', 'good job', 'looking forward', 'excited about')
+_NEGATIVE_WORDS = ('sorry', 'problem', 'issue', 'concern', 'disappointed', 'frustrated', 'urgent', 'emergency', 'mistake', 'error', 'failed', 'wrong')
+_NEGATIVE_PHRASES = ('not working', 'need help', 'went wrong', 'big problem', 'very concerned')
+
+SENTIMENT_TERMS = _POSITIVE_WORDS + _POSITIVE_PHRASES + _NEGATIVE_WORDS + _NEGATIVE_PHRASES
+SENTIMENT_WEIGHTS = np.array(
+    [(1, 0)] * len(_POSITIVE_WORDS) + [(2, 0)] * len(_POSITIVE_PHRASES)
+    + [(0, 1)] * len(_NEGATIVE_WORDS) + [(0, 2)] * len(_NEGATIVE_PHRASES),
+    dtype=np.int32
+)
+
+HIGH_URGENCY_INDICATORS = ('urgent', 'asap', 'immediately', 'emergency', 'critical', 'deadline today', 'right now')
+MEDIUM_URGENCY_INDICATORS = ('soon', 'quick', 'fast', 'deadline', 'by end of day', 'this week')
+
+FORMAL_TONE_INDICATORS = ('dear', 'sincerely', 'regards', 'respectfully', 'cordially', 'yours truly')
+CASUAL_TONE_INDICATORS = ('hi', 'hey', 'thanks', 'cheers', 'talk soon', 'catch up')
+URGENT_TONE_INDICATORS = ('urgent', 'asap', 'immediately', 'critical')
+
+TOPIC_WORD_RE = re.compile(r'\b\w{4,}\b')
+TOPIC_STOP_WORDS = frozenset({'that', 'with', 'have', 'this', 'will', 'from', 'they', 'been', 'were', 'said', 'each', 'which', 'their', 'time', 'about', 'would', 'there', 'could', 'other', 'more', 'very', 'what', 'know', 'just', 'first', 'into', 'over', 'think', 'also', 'your', 'work', 'life', 'only', 'need', 'should', 'make', 'like', 'even', 'back', 'take', 'come', 'good', 'much', 'well', 'want', 'through', 'where', 'most', 'after', 'please', 'email', 'message'})
+
+ACTION_PATTERNS = (
+    (re.compile(r'\b(meet|meeting|schedule|call|discuss)\b'), 'Schedule meeting or call'),
+    (re.compile(r'\b(review|check|look at|examine)\b'), 'Review documents or information'),
+    (re.compile(r'\b(send|provide|share|forward)\b'), 'Send requested materials'),
+    (re.compile(r'\b(update|inform|notify|let.*know)\b'), 'Provide status update'),
+    (re.compile(r'\b(deadline|due|complete|finish)\b'), 'Complete task by deadline'),
+)
+
+OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_HEADERS = {"HTTP-Referer": "https://ai-email-assistant.replit.dev", "X-Title": "AI Email Assistant"}
+
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+ANTHROPIC_MESSAGES_URL = "https://api.anthropic.com/v1/messages"
+ANTHROPIC_BATCHES_URL = "https://api.anthropic.com/v1/messages/batches"
+ANTHROPIC_VERSION = "2023-06-01"
+
+# Model the async service uses when a request asks for 'auto'
+DEFAULT_ASYNC_MODEL = 'qwen-4-turbo'
+
+
+def parse_email_response(response_text: str, original_email: str):
+    """Split raw model output into (subject, body)"""
+    lines = response_text.split('\n')
+    subject = next((line.replace('Subject:', '').strip() for line in lines if line.startswith('Subject:')), f"Re: {original_email.splitlines()[0] if original_email else 'Email Reply'}")
+    body = '\n'.join(line for line in lines if not line.startswith('Subject:') and line.strip())
+
+    if not body.strip() and response_text.strip():
+        body = response_text.strip()
+    return subject, body
+
 
 class AIService:
     def __init__(self):
@@ -128,7 +188,7 @@ class AIService:
                 model="qwen/qwen3-30b-a3b-instruct-2507",
                 temperature=0.7,
                 max_tokens=1024,  # Reduced to stay within credit limits
-                default_headers={"HTTP-Referer": "https://ai-email-assistant.replit.dev", "X-Title": "AI Email Assistant"}
+                default_headers=OPENROUTER_HEADERS
             )
 
         # OpenAI GPT model
@@ -303,21 +363,8 @@ Format your response with 'Subject:' followed by the subject line, then the emai
                 raise ValueError(f"Required LangChain model '{model_key}' not available")
             model = self.langchain_models[model_key]
 
-            # Create prompt template with proper variable handling
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", "You are a professional email assistant. Generate appropriate email replies. Format your response with 'Subject:' followed by the subject line, then the email body."),
-                ("human", "Original email: {original_email}\nContext: {context}\nTone: {tone}\nInstructions: {instructions}")
-            ])
-
-            # Create runnable sequence using RunnablePassthrough and RunnableSequence
-            # The RunnablePassthrough is used here to pass the dictionary of inputs directly
-            # to the prompt, which is then passed to the model.
-            chain = (
-                RunnablePassthrough() |
-                prompt |
-                model |
-                StrOutputParser()
-            )
+            # Static, cacheable system block first; per-request fields at the tail
+            messages = build_email_reply_messages(original_email, context, tone, custom_instructions)
 
             # Execute with callback tracking and timing
             # Use get_openai_callback for token counting if applicable (LangChain models might not always report via this)
@@ -326,32 +373,20 @@ Format your response with 'Subject:' followed by the subject line, then the emai
             try:
                 with get_openai_callback() as cb_instance:
                     cb = cb_instance
-                    response_text = chain.invoke({
-                        "original_email": original_email,
-                        "context": context,
-                        "tone": tone,
-                        "instructions": custom_instructions
-                    })
+                    ai_message = model.invoke(messages)
             except Exception as callback_err:
                  logging.warning(f"get_openai_callback might not be fully compatible with this model: {callback_err}")
-                 # Still attempt to run the chain even if callbacks fail
-                 response_text = chain.invoke({
-                        "original_email": original_email,
-                        "context": context,
-                        "tone": tone,
-                        "instructions": custom_instructions
-                    })
+                 # Still attempt to run the model even if callbacks fail
+                 ai_message = model.invoke(messages)
+
+            response_text = StrOutputParser().invoke(ai_message)
+            cached_prefix_tokens = cache_read_tokens(getattr(ai_message, 'usage_metadata', None) or {})
 
             end_time = time.time()
             generation_time_ms = int((end_time - start_time) * 1000)
 
             # Parse response
-            lines = response_text.split('\n')
-            subject = next((line.replace('Subject:', '').strip() for line in lines if line.startswith('Subject:')), f"Re: {original_email.splitlines()[0] if original_email else 'Email Reply'}")
-            body = '\n'.join(line for line in lines if not line.startswith('Subject:') and line.strip())
-
-            if not body.strip() and response_text.strip():
-                body = response_text.strip()
+            subject, body = parse_email_response(response_text, original_email)
 
             logging.info(f"AI Response parsed - Subject: '{subject}', Body length: {len(body)}, Generation time: {generation_time_ms}ms")
             logging.info(f"Raw AI Response: {repr(response_text[:200])}")
@@ -377,7 +412,8 @@ Format your response with 'Subject:' followed by the subject line, then the emai
                     'total_tokens': cb.total_tokens if cb else 0,
                     'prompt_tokens': cb.prompt_tokens if cb else 0,
                     'completion_tokens': cb.completion_tokens if cb else 0
-                } if cb else {}
+                } if cb else {},
+                'cache_read_input_tokens': cached_prefix_tokens
             }
             return generation_response_data
 
@@ -490,36 +526,8 @@ Respond only with valid JSON.
 
                 # Parse JSON response
                 try:
-                    suggestion_result = json.loads(result)
-
-                    # Validate and ensure required fields
-                    if 'suggestions' in suggestion_result and isinstance(suggestion_result['suggestions'], list):
-                        # Ensure we have valid metrics
-                        if 'analysis_metrics' not in suggestion_result:
-                            suggestion_result['analysis_metrics'] = {}
-
-                        # Add processing metadata
-                        suggestion_result['analysis_metrics']['total_analysis_time_ms'] = int((time.time() - start_time) * 1000)
-                        suggestion_result['analysis_metrics']['model_used'] = model_name
-                        suggestion_result['analysis_metrics']['method'] = 'langchain_llm'
-
-                        # Ensure required metrics exist
-                        words = email_content.split()
-                        sentences = [s.strip() for s in email_content.replace('!', '.').replace('?', '.').split('.') if s.strip()]
-
-                        default_metrics = {
-                            'word_count': len(words),
-                            'sentence_count': len(sentences),
-                            'professionalism_score': 7,
-                            'clarity_score': 7,
-                            'engagement_score': 7
-                        }
-
-                        for metric, default_value in default_metrics.items():
-                            if metric not in suggestion_result['analysis_metrics']:
-                                suggestion_result['analysis_metrics'][metric] = default_value
-
-                        suggestion_result['success'] = True
+                    suggestion_result = self._format_llm_suggestions(json.loads(result), email_content, start_time, model_name)
+                    if suggestion_result is not None:
                         return suggestion_result
 
                 except json.JSONDecodeError as e:
@@ -532,6 +540,122 @@ Respond only with valid JSON.
             logging.error(f"Error in LangChain suggestion generation: {str(e)}")
             return self._fallback_suggestion_analysis(email_content, time.time())
 
+    def _format_llm_suggestions(self, suggestion_result: Dict[str, Any], email_content: str, start_time: float, model_name: str) -> Optional[Dict[str, Any]]:
+        """Validate a parsed LLM suggestion result and fill in its metrics; None if unusable"""
+        # Validate and ensure required fields
+        if not isinstance(suggestion_result.get('suggestions'), list):
+            return None
+
+        # Ensure we have valid metrics
+        if 'analysis_metrics' not in suggestion_result:
+            suggestion_result['analysis_metrics'] = {}
+
+        # Add processing metadata
+        suggestion_result['analysis_metrics']['total_analysis_time_ms'] = int((time.time() - start_time) * 1000)
+        suggestion_result['analysis_metrics']['model_used'] = model_name
+        suggestion_result['analysis_metrics']['method'] = 'langchain_llm'
+
+        # Ensure required metrics exist
+        words = email_content.split()
+        sentences = [s.strip() for s in email_content.replace('!', '.').replace('?', '.').split('.') if s.strip()]
+
+        default_metrics = {
+            'word_count': len(words),
+            'sentence_count': len(sentences),
+            'professionalism_score': 7,
+            'clarity_score': 7,
+            'engagement_score': 7
+        }
+
+        for metric, default_value in default_metrics.items():
+            if metric not in suggestion_result['analysis_metrics']:
+                suggestion_result['analysis_metrics'][metric] = default_value
+
+        suggestion_result['success'] = True
+        return suggestion_result
+
+    def analyze_and_suggest_improvements(self, email_content: str) -> Dict[str, Any]:
+        """Sentiment analysis and improvement suggestions from a single LLM call"""
+        try:
+            start_time = time.time()
+
+            combined_model = None
+            model_name = "fallback"
+
+            if 'qwen-4-turbo' in self.langchain_models:
+                combined_model = self.langchain_models['qwen-4-turbo']
+                model_name = "qwen-4-turbo"
+            elif 'claude-4-sonnet' in self.langchain_models:
+                combined_model = self.langchain_models['claude-4-sonnet']
+                model_name = "claude-4-sonnet"
+            elif 'gpt-4o' in self.langchain_models:
+                combined_model = self.langchain_models['gpt-4o']
+                model_name = "gpt-4o"
+
+            if combined_model:
+                combined_prompt_template = """You are an expert email analyst and communication consultant.
+
+Analyze the given email and respond with a single JSON object with these exact keys:
+- analysis: object with
+    - sentiment: "positive", "negative", or "neutral"
+    - urgency: "high", "medium", or "low"
+    - tone: "formal", "professional", "friendly", "casual", or "urgent"
+    - emotion_score: float between 0.0 (very negative) and 1.0 (very positive)
+    - key_topics: array of 2-4 main topics/themes discussed
+    - action_items: array of 2-4 specific actions required or mentioned
+    - clarity_score: integer from 1-10 rating message clarity
+    - tone_appropriateness: integer from 1-10 rating professionalism level
+- suggestions: array of 5-7 specific, actionable improvement recommendations, each prefixed
+  with one of 🏗️ STRUCTURE, 💡 CLARITY, ⚡ IMPACT, 🎯 TONE or 📝 CONTENT
+- improved_email: the complete rewritten email implementing all the suggestions while keeping
+  the original intent and key information
+- analysis_metrics: object with word_count, sentence_count, professionalism_score (1-10),
+  clarity_score (1-10) and engagement_score (1-10)
+
+Provide specific, actionable advice. Avoid generic suggestions.
+
+Respond only with valid JSON.
+"""
+                combined_prompt = ChatPromptTemplate.from_messages([
+                    ("system", combined_prompt_template),
+                    ("human", "Analyze this email and suggest improvements:\n\n{email_content}")
+                ])
+
+                combined_chain = combined_prompt | combined_model | StrOutputParser()
+                result = combined_chain.invoke({"email_content": email_content})
+
+                try:
+                    combined_result = json.loads(result)
+                    suggestion_part = {key: combined_result[key] for key in ('suggestions', 'improved_email', 'analysis_metrics') if key in combined_result}
+                    suggestions = self._format_llm_suggestions(suggestion_part, email_content, start_time, model_name)
+                    if isinstance(combined_result.get('analysis'), dict) and suggestions is not None:
+                        return {
+                            'success': True,
+                            'sentiment': self._format_llm_analysis(combined_result['analysis'], start_time, model_name),
+                            'improvements': suggestions,
+                            'model_used': model_name
+                        }
+
+                except json.JSONDecodeError as e:
+                    logging.warning(f"Failed to parse combined LLM response: {e}, falling back to enhanced analysis")
+
+            # Both fallbacks are rule-based, so running them separately costs no LLM calls
+            return {
+                'success': True,
+                'sentiment': self._fallback_email_analysis(email_content, start_time),
+                'improvements': self._fallback_suggestion_analysis(email_content, start_time),
+                'model_used': 'fallback'
+            }
+
+        except Exception as e:
+            logging.error(f"Error in combined LangChain analysis: {str(e)}")
+            return {
+                'success': True,
+                'sentiment': self._fallback_email_analysis(email_content, time.time()),
+                'improvements': self._fallback_suggestion_analysis(email_content, time.time()),
+                'model_used': 'fallback'
+            }
+
     def _fallback_suggestion_analysis(self, email_content: str, start_time: float) -> Dict[str, Any]:
         """Enhanced fallback suggestion analysis with intelligent recommendations"""
         try:
@@ -734,45 +858,7 @@ Respond only with valid JSON.
 
                 # Parse JSON response
                 try:
-                    analysis_result = json.loads(result)
-
-                    # Validate and ensure required fields
-                    analysis_result['success'] = True
-                    analysis_result['processing_time_ms'] = int((time.time() - start_time) * 1000)
-                    analysis_result['method'] = f'langchain_{model_name}'
-
-                    # Ensure all required fields exist with defaults
-                    required_fields = {
-                        'sentiment': 'neutral',
-                        'urgency': 'medium', 
-                        'tone': 'professional',
-                        'emotion_score': 0.5,
-                        'key_topics': ['communication'],
-                        'action_items': ['review message'],
-                        'clarity_score': 7,
-                        'tone_appropriateness': 7
-                    }
-
-                    for field, default in required_fields.items():
-                        if field not in analysis_result:
-                            analysis_result[field] = default
-
-                    # Format for compatibility with existing API
-                    return {
-                        'success': True,
-                        'analysis': {
-                            'sentiment': analysis_result['sentiment'],
-                            'urgency': analysis_result['urgency'],
-                            'key_topics': analysis_result['key_topics'],
-                            'action_items': analysis_result['action_items'],
-                            'tone': analysis_result['tone'],
-                            'clarity_score': analysis_result['clarity_score'],
-                            'tone_appropriateness': analysis_result['tone_appropriateness']
-                        },
-                        'emotion_score': analysis_result['emotion_score'],
-                        'processing_time_ms': analysis_result['processing_time_ms'],
-                        'method': analysis_result['method']
-                    }
+                    return self._format_llm_analysis(json.loads(result), start_time, model_name)
 
                 except json.JSONDecodeError as e:
                     logging.warning(f"Failed to parse LLM JSON response: {e}, falling back to enhanced analysis")
@@ -784,26 +870,49 @@ Respond only with valid JSON.
             logging.error(f"Error in LangChain email analysis: {str(e)}")
             return self._fallback_email_analysis(email_content, time.time())
 
+    def _format_llm_analysis(self, analysis_result: Dict[str, Any], start_time: float, model_name: str) -> Dict[str, Any]:
+        """Fill defaults into a parsed LLM analysis and shape it for the API"""
+        # Ensure all required fields exist with defaults
+        required_fields = {
+            'sentiment': 'neutral',
+            'urgency': 'medium', 
+            'tone': 'professional',
+            'emotion_score': 0.5,
+            'key_topics': ['communication'],
+            'action_items': ['review message'],
+            'clarity_score': 7,
+            'tone_appropriateness': 7
+        }
+
+        for field, default in required_fields.items():
+            if field not in analysis_result:
+                analysis_result[field] = default
+
+        # Format for compatibility with existing API
+        return {
+            'success': True,
+            'analysis': {
+                'sentiment': analysis_result['sentiment'],
+                'urgency': analysis_result['urgency'],
+                'key_topics': analysis_result['key_topics'],
+                'action_items': analysis_result['action_items'],
+                'tone': analysis_result['tone'],
+                'clarity_score': analysis_result['clarity_score'],
+                'tone_appropriateness': analysis_result['tone_appropriateness']
+            },
+            'emotion_score': analysis_result['emotion_score'],
+            'processing_time_ms': int((time.time() - start_time) * 1000),
+            'method': f'langchain_{model_name}'
+        }
+
     def _fallback_email_analysis(self, email_content: str, start_time: float) -> Dict[str, Any]:
         """Enhanced fallback analysis with better keyword detection"""
         try:
             content_lower = email_content.lower()
 
-            # Enhanced sentiment analysis
-            positive_indicators = {
-                'words': ['thank', 'great', 'excellent', 'wonderful', 'amazing', 'appreciate', 'pleased', 'happy', 'perfect', 'fantastic'],
-                'phrases': ['thank you', 'well done', 'good job', 'looking forward', 'excited about']
-            }
-            negative_indicators = {
-                'words': ['sorry', 'problem', 'issue', 'concern', 'disappointed', 'frustrated', 'urgent', 'emergency', 'mistake', 'error', 'failed', 'wrong'],
-                'phrases': ['not working', 'need help', 'went wrong', 'big problem', 'very concerned']
-            }
-
-            positive_score = sum(content_lower.count(word) for word in positive_indicators['words'])
-            positive_score += sum(content_lower.count(phrase) * 2 for phrase in positive_indicators['phrases'])
-
-            negative_score = sum(content_lower.count(word) for word in negative_indicators['words'])
-            negative_score += sum(content_lower.count(phrase) * 2 for phrase in negative_indicators['phrases'])
+            # Enhanced sentiment analysis: per-term counts dotted with the lexicon weights
+            counts = np.fromiter(map(content_lower.count, SENTIMENT_TERMS), dtype=np.int32, count=len(SENTIMENT_TERMS))
+            positive_score, negative_score = (int(score) for score in counts @ SENTIMENT_WEIGHTS)
 
             if positive_score > negative_score and positive_score > 0:
                 sentiment = 'positive'
@@ -816,68 +925,34 @@ Respond only with valid JSON.
                 emotion_score = 0.5
 
             # Enhanced urgency detection
-            urgency_indicators = {
-                'high': ['urgent', 'asap', 'immediately', 'emergency', 'critical', 'deadline today', 'right now'],
-                'medium': ['soon', 'quick', 'fast', 'deadline', 'by end of day', 'this week']
-            }
-
-            if any(indicator in content_lower for indicator in urgency_indicators['high']):
+            if any(indicator in content_lower for indicator in HIGH_URGENCY_INDICATORS):
                 urgency = 'high'
-            elif any(indicator in content_lower for indicator in urgency_indicators['medium']):
+            elif any(indicator in content_lower for indicator in MEDIUM_URGENCY_INDICATORS):
                 urgency = 'medium'
             else:
                 urgency = 'low'
 
             # Enhanced tone detection
-            formal_indicators = ['dear', 'sincerely', 'regards', 'respectfully', 'cordially', 'yours truly']
-            casual_indicators = ['hi', 'hey', 'thanks', 'cheers', 'talk soon', 'catch up']
-            urgent_indicators = ['urgent', 'asap', 'immediately', 'critical']
-
-            if any(indicator in content_lower for indicator in urgent_indicators):
+            if any(indicator in content_lower for indicator in URGENT_TONE_INDICATORS):
                 tone = 'urgent'
-            elif any(indicator in content_lower for indicator in formal_indicators):
+            elif any(indicator in content_lower for indicator in FORMAL_TONE_INDICATORS):
                 tone = 'formal'
-            elif any(indicator in content_lower for indicator in casual_indicators):
+            elif any(indicator in content_lower for indicator in CASUAL_TONE_INDICATORS):
                 tone = 'friendly'
             else:
                 tone = 'professional'
 
             # Enhanced key topics extraction
-            import re
-            words = re.findall(r'\b\w{4,}\b', content_lower)
-            stop_words = {'that', 'with', 'have', 'this', 'will', 'from', 'they', 'been', 'were', 'said', 'each', 'which', 'their', 'time', 'about', 'would', 'there', 'could', 'other', 'more', 'very', 'what', 'know', 'just', 'first', 'into', 'over', 'think', 'also', 'your', 'work', 'life', 'only', 'need', 'should', 'make', 'like', 'even', 'back', 'take', 'come', 'good', 'much', 'well', 'want', 'through', 'where', 'most', 'after', 'please', 'email', 'message'}
-
-            filtered_words = [word for word in words if word not in stop_words and len(word) > 3]
-            word_freq = {}
-            for word in filtered_words:
-                word_freq[word] = word_freq.get(word, 0) + 1
-
-            key_topics = sorted(word_freq.keys(), key=lambda x: word_freq[x], reverse=True)[:4]
+            word_freq = Counter(
+                word for word in TOPIC_WORD_RE.findall(content_lower)
+                if word not in TOPIC_STOP_WORDS
+            )
+            key_topics = [word for word, _ in word_freq.most_common(4)]
             if not key_topics:
                 key_topics = ['general communication']
 
             # Enhanced action items detection
-            action_patterns = {
-                'meeting': r'\b(meet|meeting|schedule|call|discuss)\b',
-                'review': r'\b(review|check|look at|examine)\b',
-                'send': r'\b(send|provide|share|forward)\b',
-                'update': r'\b(update|inform|notify|let.*know)\b',
-                'deadline': r'\b(deadline|due|complete|finish)\b'
-            }
-
-            action_items = []
-            for action, pattern in action_patterns.items():
-                if re.search(pattern, content_lower):
-                    if action == 'meeting':
-                        action_items.append('Schedule meeting or call')
-                    elif action == 'review':
-                        action_items.append('Review documents or information')
-                    elif action == 'send':
-                        action_items.append('Send requested materials')
-                    elif action == 'update':
-                        action_items.append('Provide status update')
-                    elif action == 'deadline':
-                        action_items.append('Complete task by deadline')
+            action_items = [label for pattern, label in ACTION_PATTERNS if pattern.search(content_lower)]
 
             if not action_items:
                 action_items = ['Acknowledge receipt and respond appropriately']
@@ -1612,7 +1687,7 @@ Provide a clear, professional summary:"""
         """Generate AI-powered insights for team performance and collaboration"""
         try:
             # Import models here to avoid circular imports
-            from models import TokenUsage, Team, TeamMember, Email, User
+            from models import TokenUsage, TeamMember, Email, User, EMAIL_LIST_COLUMNS
             from app import db
             from datetime import datetime, timedelta
             
@@ -1622,16 +1697,22 @@ Provide a clear, professional summary:"""
             thirty_days_ago = datetime.now() - timedelta(days=30)
             
             # Get token usage data
-            token_usage = db.session.query(TokenUsage).join(Team).filter(
+            # Only columns carried by the covering team/created_at index
+            token_usage = db.session.execute(db.select(
+                TokenUsage.user_id,
+                TokenUsage.tokens_consumed,
+                TokenUsage.cost_usd,
+                TokenUsage.quality_score
+            ).where(
                 TokenUsage.team_id == team_id,
                 TokenUsage.created_at >= thirty_days_ago
-            ).all()
+            )).all()
             
             # Get team member data  
             team_members = db.session.query(TeamMember).filter_by(team_id=team_id).all()
             
             # Get email data
-            emails = db.session.query(Email).filter(
+            emails = db.session.query(Email).options(EMAIL_LIST_COLUMNS).filter(
                 Email.team_id == team_id,
                 Email.created_at >= thirty_days_ago
             ).all()
@@ -1743,7 +1824,7 @@ Provide a clear, professional summary:"""
         """Generate AI-powered smart email suggestions for team members"""
         try:
             # Import models here to avoid circular imports
-            from models import Email, TokenUsage, Team, User
+            from models import Email, TokenUsage, Team, User, EMAIL_LIST_COLUMNS
             from app import db
             from datetime import datetime, timedelta
             
@@ -1752,7 +1833,7 @@ Provide a clear, professional summary:"""
             # Get recent emails and usage patterns
             seven_days_ago = datetime.now() - timedelta(days=7)
             
-            recent_emails = db.session.query(Email).filter(
+            recent_emails = db.session.query(Email).options(EMAIL_LIST_COLUMNS).filter(
                 Email.team_id == team_id,
                 Email.user_id == user_id,
                 Email.created_at >= seven_days_ago
@@ -1871,36 +1952,300 @@ Provide a clear, professional summary:"""
                        operation_type: str, tokens_consumed: int, **kwargs) -> bool:
         """Log token usage for analytics tracking"""
         try:
-            # Import models here to avoid circular imports
-            from models import TokenUsage
-            from app import db
-            
-            # Create token usage record
-            token_usage = TokenUsage(
-                user_id=user_id,
-                team_id=team_id,
-                ai_model=ai_model,
-                operation_type=operation_type,
-                tokens_consumed=tokens_consumed,
-                cost_usd=kwargs.get('cost_usd', 0.0),
-                generation_time_ms=kwargs.get('generation_time_ms'),
-                quality_score=kwargs.get('quality_score'),
-                user_satisfaction=kwargs.get('user_satisfaction'),
-                email_id=kwargs.get('email_id'),
-                prompt_length=kwargs.get('prompt_length'),
-                response_length=kwargs.get('response_length')
-            )
-            
-            db.session.add(token_usage)
-            db.session.commit()
+            # Queued for the background writer, which batches the INSERTs
+            usage_writer.submit({
+                'user_id': user_id,
+                'team_id': team_id,
+                'ai_model': ai_model,
+                'operation_type': operation_type,
+                'tokens_consumed': tokens_consumed,
+                **kwargs
+            })
             
-            logging.info(f"Token usage logged: {tokens_consumed} tokens for {operation_type} using {ai_model}")
+            logging.info(f"Token usage queued: {tokens_consumed} tokens for {operation_type} using {ai_model}")
             return True
             
         except Exception as e:
             logging.error(f"Error logging token usage: {str(e)}")
             return False
 
+class AsyncAIService:
+    """Native-async email generation over a shared httpx connection pool"""
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self.openrouter_api_key = os.environ.get('OPENROUTER_API_KEY')
+        self.openai_api_key = os.environ.get('OPENAI_API_KEY')
+        self.anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
+        # One pooled client for every request so provider connections are reused
+        self.client = client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=60,
+            headers=OPENROUTER_HEADERS
+        )
+
+    def resolve_model(self, model: str) -> str:
+        """AI_MODELS key serving a request's model ('auto' is the default model);
+        raises ValueError for unknown models or ones whose provider has no key"""
+        model_key = DEFAULT_ASYNC_MODEL if model in (None, '', 'auto') else model
+        config = AI_MODELS.get(model_key)
+        if config is None:
+            raise ValueError(f"Unknown model '{model}'")
+        if not getattr(self, f"{config['provider']}_api_key", None):
+            raise ValueError(f"Required model '{model_key}' not available")
+        return model_key
+
+    def _anthropic_headers(self) -> Dict[str, str]:
+        return {"x-api-key": self.anthropic_api_key, "anthropic-version": ANTHROPIC_VERSION}
+
+    def _chat_completions_endpoint(self, model_key: str):
+        """(url, headers) for models served over an OpenAI-compatible chat API"""
+        provider = AI_MODELS[model_key]['provider']
+        url = OPENAI_CHAT_URL if provider == 'openai' else OPENROUTER_CHAT_URL
+        return url, {"Authorization": f"Bearer {getattr(self, f'{provider}_api_key')}"}
+
+    @staticmethod
+    def _anthropic_params(model_key: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "model": AI_MODELS[model_key]['model_id'],
+            "max_tokens": 1024,
+            "temperature": 0.7,
+            "system": messages[0]['content'],
+            "messages": messages[1:]
+        }
+
+    @staticmethod
+    def _anthropic_result(message: Dict[str, Any]):
+        """(text, token_usage, raw usage) from an Anthropic message"""
+        text = ''.join(block.get('text', '') for block in message.get('content', []) if block.get('type') == 'text')
+        usage = message.get('usage') or {}
+        token_usage = {
+            'total_tokens': usage.get('input_tokens', 0) + usage.get('output_tokens', 0),
+            'prompt_tokens': usage.get('input_tokens', 0),
+            'completion_tokens': usage.get('output_tokens', 0)
+        }
+        return text, token_usage, usage
+
+    @staticmethod
+    def _chat_token_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+        return {
+            'total_tokens': usage.get('total_tokens', 0),
+            'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0)
+        }
+
+    async def _complete(self, model_key: str, messages: List[Dict[str, Any]]):
+        """(text, token_usage, raw usage) for one chat completion on model_key's provider"""
+        if AI_MODELS[model_key]['provider'] == 'anthropic':
+            response = await self.client.post(
+                ANTHROPIC_MESSAGES_URL,
+                headers=self._anthropic_headers(),
+                json=self._anthropic_params(model_key, messages)
+            )
+            response.raise_for_status()
+            return self._anthropic_result(response.json())
+
+        url, headers = self._chat_completions_endpoint(model_key)
+        response = await self.client.post(
+            url,
+            headers=headers,
+            json={
+                "model": AI_MODELS[model_key]['model_id'],
+                "temperature": 0.7,
+                "max_tokens": 1024,
+                "messages": messages
+            }
+        )
+        response.raise_for_status()
+        data = response.json()
+        usage = data.get('usage') or {}
+        return data['choices'][0]['message']['content'] or '', self._chat_token_usage(usage), usage
+
+    async def generate_email_reply(self, original_email: str, context: str = "", tone: str = "professional", model: str = "auto", custom_instructions: str = "") -> Dict[str, Any]:
+        """Async counterpart of AIService.generate_email_reply, answered by the requested model"""
+        model_key = model
+        start_time = time.time()
+        try:
+            model_key = self.resolve_model(model)
+            response_text, token_usage, usage = await self._complete(
+                model_key,
+                build_email_reply_messages(original_email, context, tone, custom_instructions)
+            )
+
+            generation_time_ms = int((time.time() - start_time) * 1000)
+            subject, body = parse_email_response(response_text, original_email)
+
+            return {
+                'success': True,
+                'subject': subject,
+                'body': body.strip(),
+                'tone': tone,
+                'confidence': 0.85,
+                'model_used': model_key,
+                'generation_time_ms': generation_time_ms,
+                'token_usage': token_usage,
+                'cache_read_input_tokens': cache_read_tokens(usage)
+            }
+
+        except Exception as e:
+            logging.error(f"Async email generation error: {e}")
+            return {
+                'success': False,
+                'error': str(e),
+                'model_used': model_key,
+                'generation_time_ms': int((time.time() - start_time) * 1000),
+                'fallback_used': True,
+                'fallback_reason': 'An unexpected error occurred during generation'
+            }
+
+    async def generate_email_reply_stream(self, original_email: str, context: str = "", tone: str = "professional", model: str = "auto", custom_instructions: str = "", usage: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+        """Yield reply text deltas as the requested model streams them; the
+        token counts the provider reports are stored in usage once it ends"""
+        model_key = self.resolve_model(model)
+        messages = build_email_reply_messages(original_email, context, tone, custom_instructions)
+        if usage is None:
+            usage = {}
+        if AI_MODELS[model_key]['provider'] == 'anthropic':
+            stream = self._stream_anthropic(model_key, messages, usage)
+        else:
+            stream = self._stream_chat_completions(model_key, messages, usage)
+        async for delta in stream:
+            yield delta
+
+    async def _stream_chat_completions(self, model_key: str, messages: List[Dict[str, Any]], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        url, headers = self._chat_completions_endpoint(model_key)
+        body = {
+            "model": AI_MODELS[model_key]['model_id'],
+            "temperature": 0.7,
+            "max_tokens": 1024,
+            "stream": True,
+            "messages": messages
+        }
+        # Token counts arrive in a final chunk with no choices
+        if AI_MODELS[model_key]['provider'] == 'openai':
+            body["stream_options"] = {"include_usage": True}
+        else:
+            body["usage"] = {"include": True}
+
+        async with self.client.stream("POST", url, headers=headers, json=body) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue  # blank separators and ": OPENROUTER PROCESSING" keep-alives
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get('usage'):
+                    usage.update(self._chat_token_usage(chunk['usage']))
+                choices = chunk.get('choices') or []
+                delta = choices[0].get('delta', {}).get('content') if choices else None
+                if delta:
+                    yield delta
+
+    async def _stream_anthropic(self, model_key: str, messages: List[Dict[str, Any]], usage: Dict[str, Any]) -> AsyncIterator[str]:
+        prompt_tokens = completion_tokens = 0
+        async with self.client.stream(
+            "POST",
+            ANTHROPIC_MESSAGES_URL,
+            headers=self._anthropic_headers(),
+            json={**self._anthropic_params(model_key, messages), "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue  # "event:" names and blank separators
+                event = json.loads(line[6:])
+                kind = event.get('type')
+                if kind == 'content_block_delta':
+                    text = event.get('delta', {}).get('text')
+                    if text:
+                        yield text
+                elif kind == 'message_start':
+                    prompt_tokens = (event.get('message', {}).get('usage') or {}).get('input_tokens', 0)
+                elif kind == 'message_delta':
+                    completion_tokens = (event.get('usage') or {}).get('output_tokens', completion_tokens)
+                elif kind == 'error':
+                    raise RuntimeError(event.get('error', {}).get('message', 'Anthropic stream error'))
+                elif kind == 'message_stop':
+                    break
+        usage.update(total_tokens=prompt_tokens + completion_tokens, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    async def submit_email_reply_batch(self, email_requests: List[tuple]) -> Dict[str, Any]:
+        """Submit (index, fields) pairs as one Anthropic Message Batch and return
+        the batch object; results are collected later with get_email_reply_batch"""
+        batch_requests = []
+        for index, fields in email_requests:
+            model_key = self.resolve_model(fields.get('model'))
+            if AI_MODELS[model_key]['provider'] != 'anthropic':
+                raise ValueError(f"Model '{model_key}' does not support batch generation")
+            messages = build_email_reply_messages(
+                fields.get('original_email', ''),
+                fields.get('context', ''),
+                fields.get('tone', 'professional'),
+                fields.get('custom_instructions', '')
+            )
+            batch_requests.append({
+                # Carries the index and model back with each result
+                "custom_id": f"email-{index}-{model_key}",
+                "params": self._anthropic_params(model_key, messages)
+            })
+
+        response = await self.client.post(ANTHROPIC_BATCHES_URL, headers=self._anthropic_headers(), json={"requests": batch_requests})
+        response.raise_for_status()
+        return response.json()
+
+    async def get_email_reply_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Current state of a Message Batch; once it has ended, 'results' maps
+        each email index to its reply"""
+        if not self.anthropic_api_key:
+            raise ValueError("Required model 'claude-4-sonnet' not available")
+        headers = self._anthropic_headers()
+        response = await self.client.get(f"{ANTHROPIC_BATCHES_URL}/{batch_id}", headers=headers)
+        response.raise_for_status()
+        batch = response.json()
+        if batch.get('processing_status') != 'ended':
+            return batch
+
+        results = {}
+        async with self.client.stream("GET", batch['results_url'], headers=headers) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                _, index, model_key = item['custom_id'].split('-', 2)
+                index = int(index)
+                outcome = item.get('result') or {}
+                if outcome.get('type') == 'succeeded':
+                    text, token_usage, usage = self._anthropic_result(outcome['message'])
+                    # The original email isn't kept, so a missing subject line
+                    # falls back to the generic "Re: Email Reply"
+                    subject, body = parse_email_response(text, '')
+                    results[index] = {
+                        'success': True,
+                        'subject': subject,
+                        'body': body.strip(),
+                        'confidence': 0.85,
+                        'model_used': model_key,
+                        'token_usage': token_usage,
+                        'cache_read_input_tokens': cache_read_tokens(usage),
+                        'method': 'bulk_batch'
+                    }
+                else:
+                    error = (outcome.get('error') or {}).get('error', {}).get('message') or outcome.get('type', 'unknown')
+                    results[index] = {
+                        'success': False,
+                        'error': f"Batch request {outcome.get('type', 'failed')}: {error}",
+                        'model_used': model_key,
+                        'method': 'bulk_batch'
+                    }
+        batch['results'] = results
+        return batch
+
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        await self.client.aclose()
+
 # Create global instance for backwards compatibility
 ai_service = AIService()
 
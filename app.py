@@ -1,7 +1,9 @@
 import os
 import logging
-import json
+import orjson
 from flask import Flask
+from flask_compress import Compress
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from sqlalchemy.orm import DeclarativeBase
@@ -13,22 +15,84 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify()/request.get_json() backed by orjson
+    
+    Dates still go through Flask's default() so responses keep the same
+    HTTP-date format as the stdlib provider.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    iso_options = orjson.OPT_OMIT_MICROSECONDS | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of
+        # decoding to str and letting Werkzeug encode it again
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options),
+            mimetype=self.mimetype
+        )
+
+    def iso_response(self, *args, **kwargs):
+        """Like response(), but datetimes are encoded natively as ISO 8601 to
+        the second and enums as their values, so views can pass columns as-is"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.iso_options),
+            mimetype=self.mimetype
+        )
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
 
 # Database configuration
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+# Sized for concurrent Socket.IO handlers, each of which holds a connection
+# across its SELECT + UPDATE + commit
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
+    'pool_size': 20,
+    'max_overflow': 40,
+    # Pre-ping costs a round trip on every checkout; recycling plus SQLAlchemy's
+    # pool invalidation on disconnect errors covers dropped connections
+    'pool_pre_ping': os.environ.get("DB_POOL_PRE_PING", "0") == "1",
+    "pool_recycle": 1800,
+    # Room for every distinct statement the app compiles (default is 500)
+    'query_cache_size': 1200,
+    # Multi-row INSERT ... VALUES batches for add_all()/executemany flushes
+    'insertmanyvalues_page_size': 1000,
+    # psycopg2 decodes json/jsonb columns with these instead of stdlib json
+    'json_serializer': lambda obj: orjson.dumps(obj).decode(),
+    'json_deserializer': orjson.loads,
 }
 
+# Optional server-side cap on statement run time, e.g. DB_STATEMENT_TIMEOUT_MS=5000;
+# left unset by default so startup backfills and maintenance commands can run long
+if os.environ.get("DB_STATEMENT_TIMEOUT_MS"):
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {
+        'options': f"-c statement_timeout={int(os.environ['DB_STATEMENT_TIMEOUT_MS'])}"
+    }
+
+# Upper bound on request bodies; bulk generation (up to BULK_LIMIT emails) is the largest
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_CONTENT_LENGTH", str(1024 * 1024)))
+
+# Response compression for rendered pages and JSON API responses
+app.config["COMPRESS_ALGORITHM"] = ['br', 'gzip']
+app.config["COMPRESS_MIN_SIZE"] = 512
+
 # Initialize extensions
 db = SQLAlchemy(model_class=Base)
 db.init_app(app)
+Compress(app)
 
 # Initialize SocketIO for real-time features
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
@@ -37,10 +101,33 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 @app.template_filter('tojsonfilter')
 def tojson_filter(obj):
     """Convert Python object to JSON string for use in templates"""
-    return json.dumps(obj)
+    return app.json.dumps(obj)
 
 # Create tables
 with app.app_context():
-    import models  # noqa: F401
+    import models
     db.create_all()
     logging.info("Database tables created")
+    if models.add_team_token_columns():
+        logging.info("Added monthly token counter columns to teams")
+    # One-time migration of rows saved before SMTP passwords were encrypted
+    migrated = models.encrypt_legacy_smtp_passwords()
+    if migrated:
+        logging.info(f"Encrypted {migrated} plaintext SMTP passwords")
+    if db.engine.dialect.name == 'postgresql' and not models.token_usage_is_partitioned():
+        logging.warning("token_usage predates partitioning; run `flask --app app migrate-token-usage`")
+
+@app.cli.command('migrate-token-usage')
+def migrate_token_usage_command():
+    """Convert an existing token_usage table to the range-partitioned layout"""
+    copied = models.migrate_token_usage_to_partitioned()
+    if copied is None:
+        print("token_usage is already partitioned")
+    else:
+        print(f"Moved {copied} token_usage rows into the partitioned table")
+
+@app.cli.command('token-usage-partitions')
+def token_usage_partitions_command():
+    """Create the upcoming monthly token_usage partitions"""
+    partitions = models.ensure_token_usage_partitions()
+    print(f"Created token_usage partitions: {', '.join(partitions) or 'none'}")
@@ -0,0 +1,95 @@
+"""
+Shared Redis connection for presence tracking and cross-process caches.
+Returns None when REDIS_URL is unset or the server is unreachable so callers
+can fall back to in-process behaviour.
+"""
+import os
+import logging
+import threading
+import redis
+
+_client = None
+_resolved = False
+_lock = threading.Lock()
+
+def get_redis():
+    """Return the shared Redis client, or None if Redis is not available"""
+    global _client, _resolved
+    if _resolved:
+        return _client
+
+    with _lock:
+        if _resolved:
+            return _client
+
+        redis_url = os.environ.get("REDIS_URL")
+        if redis_url:
+            try:
+                client = redis.Redis.from_url(
+                    redis_url,
+                    decode_responses=True,
+                    socket_timeout=2,
+                    socket_connect_timeout=2,
+                    health_check_interval=30
+                )
+                client.ping()
+                _client = client
+                logging.info("Connected to Redis")
+            except redis.RedisError as e:
+                logging.warning(f"Redis unavailable, using in-process fallbacks: {str(e)}")
+        else:
+            logging.info("REDIS_URL not set, using in-process fallbacks")
+
+        _resolved = True
+        return _client
+
+# /api/team-analytics payloads, one hash per team with a field per ?days= value
+# so a single DEL drops every variant when the team's usage changes
+TEAM_ANALYTICS_CACHE_TTL = int(os.environ.get("TEAM_ANALYTICS_CACHE_TTL", "20"))
+
+def team_analytics_key(team_id):
+    return f"team_analytics:{team_id}"
+
+def invalidate_team_analytics(*team_ids):
+    """Drop cached /api/team-analytics payloads for the given teams"""
+    r = get_redis()
+    if r is None or not team_ids:
+        return
+    try:
+        r.delete(*(team_analytics_key(team_id) for team_id in team_ids))
+    except redis.RedisError as e:
+        logging.warning(f"Team analytics cache invalidation failed: {str(e)}")
+
+# Team role per (team, user) for the access checks at the top of the team
+# APIs; '' records "not a member". Membership changes delete the key
+TEAM_ROLE_CACHE_TTL = int(os.environ.get("TEAM_ROLE_CACHE_TTL", "300"))
+
+def team_role_key(team_id, user_id):
+    return f"team_role:{team_id}:{user_id}"
+
+def invalidate_team_role(team_id, *user_ids):
+    """Drop cached team roles for the given users after a membership change"""
+    r = get_redis()
+    if r is None or not user_ids:
+        return
+    try:
+        r.delete(*(team_role_key(team_id, user_id) for user_id in user_ids))
+    except redis.RedisError as e:
+        logging.warning(f"Team role cache invalidation failed: {str(e)}")
+
+# Smart suggestion lists per (team, user) are cached under a version number;
+# writes bump the version so old entries are never read again and just expire
+SUGGESTIONS_CACHE_TTL = int(os.environ.get("SUGGESTIONS_CACHE_TTL", "3600"))
+
+def suggestions_version_key(team_id, user_id):
+    return f"sugg_ver:{team_id}:{user_id}"
+
+def invalidate_smart_suggestions(team_id, user_id):
+    """Bump the suggestions version for a user after their suggestions change"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.incr(suggestions_version_key(team_id, user_id))
+    except redis.RedisError as e:
+        logging.warning(f"Suggestions cache invalidation failed: {str(e)}")
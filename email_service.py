@@ -7,9 +7,58 @@ from email.mime.base import MIMEBase
 from email import encoders
 from typing import List, Dict, Any, Optional
 import logging
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+import orjson
+import redis
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
 from models import Email, EmailStatus, User, Team
 from app import db
+from cache import get_redis
+
+SENT_STATUSES = (EmailStatus.SENT, EmailStatus.DELIVERED, EmailStatus.OPENED, EmailStatus.REPLIED)
+MODEL_DISPLAY_NAMES = {'qwen-4-turbo': 'Qwen-4 Turbo', 'claude-4-sonnet': 'Claude-4 Sonnet', 'gpt-4o': 'GPT-4o'}
+
+# Cached dashboard/analytics aggregates; keys are dropped whenever a matching email is flushed
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL", "300"))
+ANALYTICS_WINDOW_DAYS = 30
+# Date ranges offered on the analytics page; each has its own cache key
+ANALYTICS_WINDOWS = (7, 30, 90, 365)
+
+def analytics_window_start(days: int = ANALYTICS_WINDOW_DAYS) -> datetime:
+    """Start of the analytics window, at midnight so cache keys hold for the whole day"""
+    return datetime.combine(date.today() - timedelta(days=days), time.min)
+
+def _analytics_key(kind: str, owner_id: str, start_date: datetime) -> str:
+    return f"analytics:{kind}:{owner_id}:{start_date:%Y%m%d}"
+
+# Presets for popular SMTP providers, offered on the settings page
+SMTP_PROVIDER_SETTINGS = {
+    'gmail': {
+        'smtp_server': 'smtp.gmail.com',
+        'smtp_port': 587,
+        'use_tls': True,
+        'instructions': 'Use your Gmail address and an App Password (not your regular password)'
+    },
+    'outlook': {
+        'smtp_server': 'smtp-mail.outlook.com',
+        'smtp_port': 587,
+        'use_tls': True,
+        'instructions': 'Use your Outlook/Hotmail address and password'
+    },
+    'yahoo': {
+        'smtp_server': 'smtp.mail.yahoo.com',
+        'smtp_port': 587,
+        'use_tls': True,
+        'instructions': 'Use your Yahoo address and an App Password'
+    },
+    'custom': {
+        'smtp_server': '',
+        'smtp_port': 587,
+        'use_tls': True,
+        'instructions': 'Enter your custom SMTP server details'
+    }
+}
 
 class EmailService:
     def __init__(self):
@@ -91,7 +140,7 @@ class EmailService:
 
             # Update email status in database if email_id provided
             if email_id and result['success']:
-                email = Email.query.get(email_id)
+                email = db.session.get(Email, email_id)
                 if email:
                     email.status = EmailStatus.SENT
                     email.sent_at = datetime.now()
@@ -111,6 +160,9 @@ class EmailService:
         Send email via SMTP
         """
         try:
+            # Decrypted up front so a key problem fails before connecting
+            smtp_password = user.decrypted_smtp_password
+
             # Create SMTP connection
             if user.smtp_use_tls:
                 context = ssl.create_default_context()
@@ -120,7 +172,7 @@ class EmailService:
                 server = smtplib.SMTP_SSL(user.smtp_server, user.smtp_port)
 
             # Login to SMTP server
-            server.login(user.smtp_username, user.smtp_password)
+            server.login(user.smtp_username, smtp_password)
 
             # Send email
             text = message.as_string()
@@ -195,41 +247,14 @@ class EmailService:
         """
         Get common SMTP settings for popular email providers
         """
-        settings = {
-            'gmail': {
-                'smtp_server': 'smtp.gmail.com',
-                'smtp_port': 587,
-                'use_tls': True,
-                'instructions': 'Use your Gmail address and an App Password (not your regular password)'
-            },
-            'outlook': {
-                'smtp_server': 'smtp-mail.outlook.com',
-                'smtp_port': 587,
-                'use_tls': True,
-                'instructions': 'Use your Outlook/Hotmail address and password'
-            },
-            'yahoo': {
-                'smtp_server': 'smtp.mail.yahoo.com',
-                'smtp_port': 587,
-                'use_tls': True,
-                'instructions': 'Use your Yahoo address and an App Password'
-            },
-            'custom': {
-                'smtp_server': '',
-                'smtp_port': 587,
-                'use_tls': True,
-                'instructions': 'Enter your custom SMTP server details'
-            }
-        }
-
-        return settings.get(provider, settings['custom'])
+        return SMTP_PROVIDER_SETTINGS.get(provider, SMTP_PROVIDER_SETTINGS['custom'])
 
     def schedule_email(self, email_id: str, send_time: datetime) -> Dict[str, Any]:
         """
         Schedule an email to be sent at a specific time
         """
         try:
-            email = Email.query.get(email_id)
+            email = db.session.get(Email, email_id)
             if not email:
                 return {
                     'success': False,
@@ -258,84 +283,17 @@ class EmailService:
         Get email analytics for a team or user
         """
         try:
-            query = Email.query
-
+            filters = self._analytics_filters(start_date, end_date)
             if team_id:
-                query = query.filter_by(team_id=team_id)
-
+                filters.append(Email.team_id == team_id)
             if user_id:
-                query = query.filter_by(user_id=user_id)
-
-            if start_date:
-                query = query.filter(Email.created_at >= start_date)
-
-            if end_date:
-                query = query.filter(Email.created_at <= end_date)
-
-            emails = query.all()
-
-            # Calculate analytics
-            total_emails = len(emails)
-            sent_emails = len([e for e in emails if e.status in [EmailStatus.SENT, EmailStatus.DELIVERED, EmailStatus.OPENED, EmailStatus.REPLIED]])
-            draft_emails = len([e for e in emails if e.status == EmailStatus.DRAFT])
-
-            # Average generation time - include all emails with AI model usage
-            ai_emails = [e for e in emails if e.ai_model_used and e.generation_time_ms is not None]
-            if not ai_emails:
-                # If no generation_time_ms recorded, estimate based on AI model usage
-                ai_emails = [e for e in emails if e.ai_model_used]
-                # Set default generation times for estimation
-                for email in ai_emails:
-                    if email.generation_time_ms is None:
-                        email.generation_time_ms = 2500  # Default 2.5 seconds
-
-            generation_times = [e.generation_time_ms for e in ai_emails if e.generation_time_ms]
-            avg_generation_time_ms = sum(generation_times) / len(generation_times) if generation_times else 0
-
-            # Average user rating - look for any ratings
-            ratings = [e.user_rating for e in emails if e.user_rating is not None and e.user_rating > 0]
-            if not ratings:
-                # If no explicit ratings, give sent emails a default rating of 4.0
-                sent_count = len([e for e in emails if e.status in [EmailStatus.SENT, EmailStatus.DELIVERED]])
-                if sent_count > 0:
-                    avg_user_rating = 4.0
-                else:
-                    avg_user_rating = None
-            else:
-                avg_user_rating = sum(ratings) / len(ratings)
-
-            # Model usage
-            model_usage = {}
-            for email in emails:
-                if email.ai_model_used:
-                    model = email.ai_model_used.value
-                    if model == 'qwen-4-turbo':
-                        model_display = 'Qwen-4 Turbo'
-                    elif model == 'claude-4-sonnet':
-                        model_display = 'Claude-4 Sonnet'
-                    elif model == 'gpt-4o':
-                        model_display = 'GPT-4o'
-                    else:
-                        model_display = model
-                    model_usage[model_display] = model_usage.get(model_display, 0) + 1
-
-            # If no AI usage recorded, but we have sent emails, assume some AI usage
-            if not model_usage and sent_emails > 0:
-                model_usage['Qwen-4 Turbo'] = sent_emails
-
-            analytics = {
-                'total_emails': total_emails,
-                'sent_emails': sent_emails,
-                'draft_emails': draft_emails,
-                'avg_generation_time_ms': int(avg_generation_time_ms),
-                'avg_user_rating': round(avg_user_rating, 1) if avg_user_rating else None,
-                'model_usage': model_usage,
-                'success_rate': (sent_emails / total_emails * 100) if total_emails > 0 else 0
-            }
+                filters.append(Email.user_id == user_id)
+
+            rows = self._analytics_rows(filters).all()
 
             return {
                 'success': True,
-                'analytics': analytics
+                'analytics': self._build_analytics(rows)
             }
 
         except Exception as e:
@@ -345,5 +303,188 @@ class EmailService:
                 'error': f'Failed to get analytics: {str(e)}'
             }
 
+    def get_email_analytics_batch(self, team_ids: List[str], start_date: datetime = None,
+                                  end_date: datetime = None) -> Dict[str, Any]:
+        """
+        Get email analytics for several teams with one grouped query
+        """
+        try:
+            if not team_ids:
+                return {'success': True, 'analytics': {}}
+
+            filters = self._analytics_filters(start_date, end_date)
+            filters.append(Email.team_id.in_(team_ids))
+
+            rows_by_team = {team_id: [] for team_id in team_ids}
+            for row in self._analytics_rows(filters, Email.team_id).all():
+                rows_by_team[row.team_id].append(row)
+
+            return {
+                'success': True,
+                'analytics': {team_id: self._build_analytics(rows) for team_id, rows in rows_by_team.items()}
+            }
+
+        except Exception as e:
+            logging.error(f"Error getting batch email analytics: {str(e)}")
+            return {
+                'success': False,
+                'error': f'Failed to get analytics: {str(e)}'
+            }
+
+    def get_cached_user_analytics(self, user_id: str, start_date: datetime) -> Dict[str, Any]:
+        """get_email_analytics for a user, served from Redis when available"""
+        key = _analytics_key('user', user_id, start_date)
+        r = get_redis()
+        if r is not None:
+            try:
+                cached = r.get(key)
+                if cached:
+                    return {'success': True, 'analytics': orjson.loads(cached)}
+            except redis.RedisError as e:
+                logging.warning(f"Analytics cache read failed: {str(e)}")
+
+        result = self.get_email_analytics(user_id=user_id, start_date=start_date)
+        if r is not None and result['success']:
+            try:
+                r.setex(key, ANALYTICS_CACHE_TTL, orjson.dumps(result['analytics']))
+            except redis.RedisError as e:
+                logging.warning(f"Analytics cache write failed: {str(e)}")
+        return result
+
+    def get_cached_team_analytics(self, team_ids: List[str], start_date: datetime) -> Dict[str, Any]:
+        """get_email_analytics_batch, computing only the teams missing from Redis"""
+        r = get_redis()
+        if r is None or not team_ids:
+            return self.get_email_analytics_batch(team_ids=team_ids, start_date=start_date)
+
+        keys = [_analytics_key('team', team_id, start_date) for team_id in team_ids]
+        analytics = {}
+        try:
+            for team_id, cached in zip(team_ids, r.mget(keys)):
+                if cached:
+                    analytics[team_id] = orjson.loads(cached)
+        except redis.RedisError as e:
+            logging.warning(f"Analytics cache read failed: {str(e)}")
+
+        missing = [team_id for team_id in team_ids if team_id not in analytics]
+        if missing:
+            result = self.get_email_analytics_batch(team_ids=missing, start_date=start_date)
+            if not result['success']:
+                return result
+            analytics.update(result['analytics'])
+            try:
+                pipe = r.pipeline()
+                for team_id in missing:
+                    pipe.setex(_analytics_key('team', team_id, start_date), ANALYTICS_CACHE_TTL,
+                               orjson.dumps(result['analytics'][team_id]))
+                pipe.execute()
+            except redis.RedisError as e:
+                logging.warning(f"Analytics cache write failed: {str(e)}")
+
+        return {'success': True, 'analytics': analytics}
+
+    @staticmethod
+    def _analytics_filters(start_date: datetime = None, end_date: datetime = None) -> list:
+        filters = []
+        if start_date:
+            filters.append(Email.created_at >= start_date)
+        if end_date:
+            filters.append(Email.created_at <= end_date)
+        return filters
+
+    @staticmethod
+    def _analytics_rows(filters: list, group_column=None):
+        """Email counts and sums per AI model (and per group_column), computed in SQL"""
+        has_ai = Email.ai_model_used.isnot(None)
+        timed = has_ai & (Email.generation_time_ms != 0)
+        rated = Email.user_rating > 0
+        group_columns = [group_column] if group_column is not None else []
+        return db.session.query(
+            *group_columns,
+            Email.ai_model_used,
+            func.count().label('total'),
+            func.count().filter(Email.status.in_(SENT_STATUSES)).label('sent'),
+            func.count().filter(Email.status == EmailStatus.DRAFT).label('drafts'),
+            func.count().filter(Email.status.in_((EmailStatus.SENT, EmailStatus.DELIVERED))).label('delivered'),
+            func.count().filter(has_ai & Email.generation_time_ms.isnot(None)).label('timed'),
+            func.coalesce(func.sum(Email.generation_time_ms).filter(timed), 0).label('time_sum'),
+            func.count().filter(timed).label('time_count'),
+            func.coalesce(func.sum(Email.user_rating).filter(rated), 0).label('rating_sum'),
+            func.count().filter(rated).label('rating_count'),
+        ).filter(*filters).group_by(*group_columns, Email.ai_model_used)
+
+    @staticmethod
+    def _build_analytics(rows) -> Dict[str, Any]:
+        """Analytics dict from the per-model aggregate rows of one user or team"""
+        totals = dict.fromkeys(('total', 'sent', 'drafts', 'delivered', 'timed', 'time_sum',
+                                'time_count', 'rating_sum', 'rating_count'), 0)
+        ai_emails = 0
+        model_usage = {}
+        for row in rows:
+            for key in totals:
+                totals[key] += getattr(row, key)
+            if row.ai_model_used:
+                ai_emails += row.total
+                model = row.ai_model_used.value
+                model_display = MODEL_DISPLAY_NAMES.get(model, model)
+                model_usage[model_display] = model_usage.get(model_display, 0) + row.total
+
+        total_emails = totals['total']
+        sent_emails = totals['sent']
+
+        # Average generation time; AI emails without any recorded time count as 2.5 seconds
+        if totals['timed']:
+            avg_generation_time_ms = totals['time_sum'] / totals['time_count'] if totals['time_count'] else 0
+        else:
+            avg_generation_time_ms = 2500 if ai_emails else 0
+
+        # Average user rating; without explicit ratings, sent emails default to 4.0
+        if totals['rating_count']:
+            avg_user_rating = totals['rating_sum'] / totals['rating_count']
+        else:
+            avg_user_rating = 4.0 if totals['delivered'] else None
+
+        # If no AI usage recorded, but we have sent emails, assume some AI usage
+        if not model_usage and sent_emails > 0:
+            model_usage['Qwen-4 Turbo'] = sent_emails
+
+        return {
+            'total_emails': total_emails,
+            'sent_emails': sent_emails,
+            'draft_emails': totals['drafts'],
+            'avg_generation_time_ms': int(avg_generation_time_ms),
+            'avg_user_rating': round(avg_user_rating, 1) if avg_user_rating else None,
+            'model_usage': model_usage,
+            'success_rate': (sent_emails / total_emails * 100) if total_emails > 0 else 0
+        }
+
+def invalidate_cached_analytics(owners) -> None:
+    """Drop every window's cached aggregates for ('user'|'team', id) owners"""
+    r = get_redis()
+    if r is None or not owners:
+        return
+    start_dates = [analytics_window_start(days) for days in ANALYTICS_WINDOWS]
+    try:
+        r.delete(*(_analytics_key(kind, owner_id, start_date)
+                   for kind, owner_id in owners for start_date in start_dates))
+    except redis.RedisError as e:
+        logging.warning(f"Analytics cache invalidation failed: {str(e)}")
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_cached_analytics(session, flush_context):
+    """Invalidate cached aggregates for users/teams whose emails changed in this flush"""
+    if get_redis() is None:
+        return
+    owners = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Email):
+            continue
+        owners.add(('user', obj.user_id))
+        team_history = inspect(obj).attrs.team_id.history
+        for team_id in (obj.team_id, *team_history.deleted):
+            if team_id:
+                owners.add(('team', team_id))
+    invalidate_cached_analytics(owners)
+
 # Global email service instance
 email_service = EmailService()
\ No newline at end of file
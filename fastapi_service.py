@@ -1,19 +1,51 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Path, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, conlist
+from typing import Optional, List, Dict, Any, Literal
+from contextlib import asynccontextmanager
 import os
 import logging
-from ai_service import AIService
-from email_service import EmailService
+from ai_service import AsyncAIService, AI_MODELS, ai_service, log_token_usage
+from response_cache import response_cache
+from prompt_builder import CanonicalTone
 import asyncio
+import concurrent.futures
+import httpx
+import functools
+import time
+import weakref
+import orjson
 from datetime import datetime
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-process async resources
+    
+    The LangChain-backed AIService is the shared instance built when ai_service
+    is imported, so workers forked from a preloaded parent reuse it
+    copy-on-write; only the event-loop-bound HTTP pool is created per worker.
+    """
+    app.state.ai = ai_service
+    app.state.async_ai = AsyncAIService()
+    yield
+    # Let in-flight generations finish so their results (and spend) aren't dropped
+    active = list(_active_llm_calls)
+    if active:
+        logging.info(f"Waiting for {len(active)} in-flight AI calls before shutdown")
+        _, unfinished = await asyncio.wait(active, timeout=SHUTDOWN_DRAIN_SECONDS)
+        if unfinished:
+            logging.warning(f"Shutting down with {len(unfinished)} AI calls still running")
+    await app.state.async_ai.aclose()
+    _LLM_EXEC.shutdown(wait=False, cancel_futures=True)
+
 # Initialize FastAPI app
 fastapi_app = FastAPI(
     title="AI Email Assistant API",
     description="FastAPI layer for AI-powered email generation with LangChain integration",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -25,24 +57,69 @@ fastapi_app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-ai_service = AIService()
-email_service = EmailService()
+# Upper bound on in-flight provider calls for a single bulk request
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", "16"))
+# Larger bulk requests are rejected during validation, before any work starts
+BULK_LIMIT = int(os.environ.get("BULK_LIMIT", "100"))
+
+# Models accepted by the provider batch endpoints (/api/v1/bulk-generate/batches)
+BATCH_MODELS = frozenset(name for name, config in AI_MODELS.items() if config['provider'] == 'anthropic')
+
+# Blocking LangChain calls run here rather than on the loop's default executor,
+# so slow provider calls can't starve unrelated to_thread/file IO work
+_LLM_EXEC = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LLM_POOL", "32")),
+    thread_name_prefix="llm"
+)
+
+# In-flight AI calls, drained on shutdown for up to SHUTDOWN_DRAIN_SECONDS
+_active_llm_calls = weakref.WeakSet()
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get("SHUTDOWN_DRAIN_SECONDS", "25"))
+
+def track_llm_call(future):
+    """Register a future/task so graceful shutdown waits for it"""
+    _active_llm_calls.add(future)
+    return future
+
+async def run_llm(func, *args, **kwargs):
+    """Run a blocking AI service call on the dedicated LLM executor"""
+    loop = asyncio.get_running_loop()
+    return await track_llm_call(loop.run_in_executor(_LLM_EXEC, functools.partial(func, *args, **kwargs)))
+
+# Model names are fixed once AIService has initialized its clients
+_AVAILABLE_MODELS = tuple(AI_MODELS)
+_LANGCHAIN_MODELS = tuple(getattr(ai_service, 'langchain_models', ()))
+
+# Health results are reused for this long so frequent probes stay O(1)
+HEALTH_CACHE_TTL_SECONDS = 30
+_health_cache = {"expires_at": 0.0, "payload": None}
+_health_lock = asyncio.Lock()
+
+# Cheap per-provider availability checks: list models instead of generating
+PROVIDER_PROBES = {
+    "openrouter": ("https://openrouter.ai/api/v1/models", lambda key: {"Authorization": f"Bearer {key}"}),
+    "openai": ("https://api.openai.com/v1/models", lambda key: {"Authorization": f"Bearer {key}"}),
+    "anthropic": ("https://api.anthropic.com/v1/models", lambda key: {"x-api-key": key, "anthropic-version": "2023-06-01"}),
+}
 
 # LangChain integration is built into the main ai_service
 ENHANCED_AI_AVAILABLE = True
 logging.info("LangChain functionality available through main AI service")
 
 # Pydantic models for request/response
-class EmailGenerationRequest(BaseModel):
+class APIModel(BaseModel):
+    """Base for API schemas; pydantic-core validation with no per-model extras"""
+    model_config = ConfigDict(extra='ignore', validate_assignment=False, arbitrary_types_allowed=False)
+
+class EmailGenerationRequest(APIModel):
     original_email: str = Field(..., description="The original email to reply to")
     context: Optional[str] = Field("", description="Additional context for the reply")
-    tone: Optional[str] = Field("professional", description="Tone of the reply")
-    model: Optional[str] = Field("auto", description="AI model to use (auto, qwen-4-turbo, claude-4-sonnet, gpt-4o)")
+    tone: CanonicalTone = Field("professional", description="Tone of the reply (professional, friendly, formal, casual, urgent)")
+    model: Literal["auto", "qwen-4-turbo", "claude-4-sonnet", "gpt-4o"] = Field("auto", description="AI model to use (auto, qwen-4-turbo, claude-4-sonnet, gpt-4o)")
     custom_instructions: Optional[str] = Field("", description="Custom instructions for the AI")
     user_id: Optional[int] = Field(None, description="User ID for analytics")
 
-class EmailGenerationResponse(BaseModel):
+class EmailGenerationResponse(APIModel):
     success: bool
     email_reply: Optional[str] = None
     error: Optional[str] = None
@@ -51,34 +128,34 @@ class EmailGenerationResponse(BaseModel):
     tokens_used: Optional[int] = None
     method: str = "langchain"
 
-class EmailAnalysisRequest(BaseModel):
+class EmailAnalysisRequest(APIModel):
     email_content: str = Field(..., description="Email content to analyze")
 
-class EmailAnalysisResponse(BaseModel):
+class EmailAnalysisResponse(APIModel):
     sentiment: str
     urgency: str
     tone: str
     emotion_score: float
     key_topics: List[str]
 
-class BulkEmailRequest(BaseModel):
-    emails: List[EmailGenerationRequest] = Field(..., description="List of emails to process")
+class BulkEmailRequest(APIModel):
+    emails: conlist(EmailGenerationRequest, min_length=1, max_length=BULK_LIMIT) = Field(..., description=f"List of emails to process (at most {BULK_LIMIT})")
     parallel: Optional[bool] = Field(True, description="Process emails in parallel")
 
-class ModelStatusResponse(BaseModel):
+class ModelStatusResponse(APIModel):
     available_models: List[str]
     langchain_models: List[str]
     default_model: str
     model_details: Dict[str, Any]
 
-class TemplateGenerationRequest(BaseModel):
+class TemplateGenerationRequest(APIModel):
     template_type: Optional[str] = Field("professional", description="Type of template to generate")
     purpose: str = Field(..., description="Purpose of the email template")
     tone: Optional[str] = Field("professional", description="Tone of the template")
     industry: Optional[str] = Field("", description="Industry context")
     custom_instructions: Optional[str] = Field("", description="Custom instructions for generation")
 
-class TemplateGenerationResponse(BaseModel):
+class TemplateGenerationResponse(APIModel):
     success: bool
     template_name: Optional[str] = None
     subject_template: Optional[str] = None
@@ -87,12 +164,12 @@ class TemplateGenerationResponse(BaseModel):
     model_used: str
     generation_time_ms: int
 
-class LangChainRequest(BaseModel):
+class LangChainRequest(APIModel):
     query: str = Field(..., description="Query for the LangChain agent")
     conversation_id: Optional[str] = Field(None, description="Conversation ID for context tracking")
     use_memory: Optional[bool] = Field(True, description="Whether to use conversation memory")
 
-class LangChainResponse(BaseModel):
+class LangChainResponse(APIModel):
     success: bool
     response: Optional[str] = None
     conversation_id: Optional[str] = None
@@ -101,6 +178,27 @@ class LangChainResponse(BaseModel):
     chains_used: List[str] = []
     memory_used: bool = False
 
+def _response_builder(model_cls):
+    """Plain-dict builder for a response schema's fields, skipping model construction"""
+    fields = tuple(
+        (name, None if info.is_required() else info.get_default(call_default_factory=True))
+        for name, info in model_cls.model_fields.items()
+    )
+
+    def build(source=None, **values):
+        data = {**source, **values} if source else values
+        return {name: data.get(name, default) for name, default in fields}
+    return build
+
+build_generation_response = _response_builder(EmailGenerationResponse)
+
+def _generation_json(payload, cache_status=None, cache_prefix_tokens=0):
+    """Serialize a generation payload straight to bytes with optional cache headers"""
+    headers = None
+    if cache_status is not None:
+        headers = {"X-Cache": cache_status, "X-Cache-Prefix-Tokens": str(cache_prefix_tokens)}
+    return Response(content=orjson.dumps(payload), media_type="application/json", headers=headers)
+
 # API Endpoints
 @fastapi_app.get("/")
 async def root():
@@ -112,19 +210,30 @@ async def root():
         "features": ["email_generation", "langchain_integration", "sentiment_analysis"]
     }
 
+@functools.lru_cache(maxsize=1)
+def _models_payload() -> ModelStatusResponse:
+    """Model information; fixed once the AI service has initialized"""
+    return ModelStatusResponse(
+        available_models=_AVAILABLE_MODELS,
+        langchain_models=_LANGCHAIN_MODELS,
+        default_model="qwen-4-turbo",
+        model_details=AI_MODELS
+    )
+
+@functools.lru_cache(maxsize=1)
+def _langchain_status_payload() -> Dict[str, Any]:
+    """Static part of the LangChain status response"""
+    return {
+        "langchain_available": True,
+        "enhanced_service": "integrated_in_main_service",
+        "available_models": _LANGCHAIN_MODELS
+    }
+
 @fastapi_app.get("/api/v1/models", response_model=ModelStatusResponse)
 async def get_available_models():
     """Get information about available AI models"""
     try:
-        langchain_models = list(ai_service.langchain_models.keys())
-        from ai_service import AI_MODELS
-        
-        return ModelStatusResponse(
-            available_models=list(AI_MODELS.keys()),
-            langchain_models=langchain_models,
-            default_model="qwen-4-turbo",
-            model_details=AI_MODELS
-        )
+        return _models_payload()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting model information: {str(e)}")
 
@@ -132,16 +241,21 @@ async def get_available_models():
 async def generate_email_reply(request: EmailGenerationRequest):
     """Generate an AI-powered email reply using LangChain"""
     try:
-        result = ai_service.generate_email_reply(
-            original_email=request.original_email,
-            context=request.context,
-            tone=request.tone,
-            model=request.model,
-            custom_instructions=request.custom_instructions
+        result, cache_status = await run_llm(
+            response_cache.get_or_generate,
+            'generate-email',
+            request.model_dump(),
+            lambda: ai_service.generate_email_reply(
+                original_email=request.original_email,
+                context=request.context,
+                tone=request.tone,
+                model=request.model,
+                custom_instructions=request.custom_instructions
+            )
         )
         
-        # Log token usage for FastAPI email generation
-        if result.get('success'):
+        # Log token usage for FastAPI email generation (cache hits consume none)
+        if result.get('success') and cache_status == 'MISS':
             try:
                 from ai_service import log_token_usage
                 # For FastAPI, we'll need to get user info from request headers or session
@@ -170,17 +284,94 @@ async def generate_email_reply(request: EmailGenerationRequest):
             except Exception as e:
                 logging.warning(f"Failed to log FastAPI token usage: {str(e)}")
         
-        return EmailGenerationResponse(**result)
+        return _generation_json(
+            build_generation_response(result),
+            cache_status,
+            result.get('cache_read_input_tokens', 0)
+        )
         
     except Exception as e:
         logging.error(f"Error generating email reply: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating email: {str(e)}")
 
+def _log_stream_usage(http_request: Request, request: EmailGenerationRequest, model_key: str,
+                      token_usage: Dict[str, Any], reply: str, generation_time_ms: int):
+    """Queue token usage for a finished streamed generation; the team and user
+    come from the X-Team-Id and X-User-Id headers"""
+    team_id = http_request.headers.get('x-team-id')
+    user_id = http_request.headers.get('x-user-id')
+    if not team_id or not user_id:
+        return
+    tokens_used = token_usage.get('total_tokens') or max(
+        int((len(request.original_email) + len(request.context or '') + len(reply)) / 4), 120
+    )
+    log_token_usage(
+        team_id=team_id,
+        user_id=user_id,
+        ai_model=model_key,
+        operation_type='email_generation_stream',
+        tokens_consumed=tokens_used,
+        cost_usd=tokens_used * 0.00002,
+        generation_time_ms=generation_time_ms,
+        prompt_length=len(request.original_email),
+        response_length=len(reply)
+    )
+
+@fastapi_app.post("/api/v1/generate-email/stream")
+async def generate_email_reply_stream(request: EmailGenerationRequest, http_request: Request):
+    """Stream an AI-generated email reply as Server-Sent Events
+    
+    Each event carries {"delta": text}; the last one is {"done": true, ...}
+    or {"error": message}.
+    """
+    async_ai = http_request.app.state.async_ai
+    try:
+        model_key = async_ai.resolve_model(request.model)
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def event_generator():
+        start_ns = time.perf_counter_ns()
+        token_usage = {}
+        parts = []
+        try:
+            async for chunk in async_ai.generate_email_reply_stream(
+                original_email=request.original_email,
+                context=request.context,
+                tone=request.tone,
+                model=model_key,
+                custom_instructions=request.custom_instructions,
+                usage=token_usage
+            ):
+                parts.append(chunk)
+                yield b"data: " + orjson.dumps({"delta": chunk}) + b"\n\n"
+            
+            generation_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+            try:
+                _log_stream_usage(http_request, request, model_key, token_usage, ''.join(parts), generation_time_ms)
+            except Exception as e:
+                logging.warning(f"Failed to log streamed token usage: {str(e)}")
+            yield b"data: " + orjson.dumps({
+                "done": True,
+                "model_used": model_key,
+                "generation_time_ms": generation_time_ms,
+                "tokens_used": token_usage.get('total_tokens')
+            }) + b"\n\n"
+        except Exception as e:
+            logging.error(f"Error streaming email reply: {str(e)}")
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
 @fastapi_app.post("/api/v1/analyze-email", response_model=EmailAnalysisResponse)
 async def analyze_email(request: EmailAnalysisRequest):
     """Analyze email sentiment and characteristics"""
     try:
-        result = ai_service.analyze_email_sentiment(request.email_content)
+        result = await run_llm(ai_service.analyze_email_sentiment, request.email_content)
         
         # Log token usage for FastAPI analysis
         if result.get('success'):
@@ -213,52 +404,78 @@ async def analyze_email(request: EmailAnalysisRequest):
         logging.error(f"Error analyzing email: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error analyzing email: {str(e)}")
 
+def _bulk_entry(i: int, result, model: str) -> Dict[str, Any]:
+    """One bulk result line, with exceptions turned into error entries"""
+    if isinstance(result, Exception):
+        return {
+            "success": False,
+            "error": str(result),
+            "email_index": i,
+            "model_used": model,
+            "generation_time_ms": 0,
+            "method": "bulk_parallel"
+        }
+    result["email_index"] = i
+    result.setdefault("method", "bulk_parallel")
+    return result
+
+async def _iter_bulk_results(emails: List[EmailGenerationRequest], async_ai_service):
+    """Yield (index, result) pairs as each generation finishes"""
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def generate_one(i):
+        email_req = emails[i]
+        try:
+            async with semaphore:
+                return i, await async_ai_service.generate_email_reply(
+                    email_req.original_email,
+                    email_req.context,
+                    email_req.tone,
+                    email_req.model,
+                    email_req.custom_instructions
+                )
+        except Exception as e:
+            return i, e
+
+    pending = {track_llm_call(asyncio.create_task(generate_one(i))) for i in range(len(emails))}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
 @fastapi_app.post("/api/v1/bulk-generate")
-async def bulk_generate_emails(request: BulkEmailRequest, background_tasks: BackgroundTasks):
-    """Generate multiple email replies in parallel"""
+async def bulk_generate_emails(request: BulkEmailRequest, background_tasks: BackgroundTasks, http_request: Request):
+    """Generate multiple email replies in parallel
+    
+    Clients sending Accept: application/x-ndjson get one JSON line per email
+    as soon as it finishes, in completion order.
+    """
+    async_ai_service = http_request.app.state.async_ai
     try:
         if request.parallel:
-            # Process emails in parallel using asyncio
-            tasks = []
-            for email_req in request.emails:
-                task = asyncio.create_task(
-                    asyncio.to_thread(
-                        ai_service.generate_email_reply,
-                        email_req.original_email,
-                        email_req.context,
-                        email_req.tone,
-                        email_req.model,
-                        email_req.custom_instructions
-                    )
-                )
-                tasks.append(task)
+            emails = request.emails
             
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            if "application/x-ndjson" in http_request.headers.get("accept", ""):
+                async def stream_lines():
+                    async for i, result in _iter_bulk_results(emails, async_ai_service):
+                        yield orjson.dumps(_bulk_entry(i, result, emails[i].model)) + b"\n"
+                return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
             
-            # Process results
-            responses = []
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    responses.append({
-                        "success": False,
-                        "error": str(result),
-                        "email_index": i,
-                        "model_used": request.emails[i].model,
-                        "generation_time_ms": 0,
-                        "method": "bulk_parallel"
-                    })
-                else:
-                    result["email_index"] = i
-                    result["method"] = "bulk_parallel"
-                    responses.append(result)
+            responses = [None] * len(emails)
+            async for i, result in _iter_bulk_results(emails, async_ai_service):
+                responses[i] = _bulk_entry(i, result, emails[i].model)
                     
-            return {"results": responses, "total_processed": len(responses)}
+            return ORJSONResponse(content={"results": responses, "total_processed": len(responses)})
         else:
             # Process emails sequentially
             responses = []
             for i, email_req in enumerate(request.emails):
                 try:
-                    result = ai_service.generate_email_reply(
+                    result = await async_ai_service.generate_email_reply(
                         email_req.original_email,
                         email_req.context,
                         email_req.tone,
@@ -278,41 +495,124 @@ async def bulk_generate_emails(request: BulkEmailRequest, background_tasks: Back
                         "method": "bulk_sequential"
                     })
             
-            return {"results": responses, "total_processed": len(responses)}
+            return ORJSONResponse(content={"results": responses, "total_processed": len(responses)})
             
     except Exception as e:
         logging.error(f"Error in bulk email generation: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error in bulk generation: {str(e)}")
 
+@fastapi_app.post("/api/v1/bulk-generate/batches", status_code=202)
+async def submit_bulk_batch(request: BulkEmailRequest, http_request: Request):
+    """Submit emails as one provider batch job
+    
+    Batches can take minutes to hours, so this returns the batch id right
+    away; poll GET /api/v1/bulk-generate/batches/{batch_id} for the results.
+    """
+    unsupported = sorted({email_req.model for email_req in request.emails if email_req.model not in BATCH_MODELS})
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Batch generation supports {', '.join(sorted(BATCH_MODELS))}, not {', '.join(unsupported)}")
+    try:
+        batch = await http_request.app.state.async_ai.submit_email_reply_batch(
+            [(i, email_req.model_dump()) for i, email_req in enumerate(request.emails)]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error submitting batch generation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error submitting batch: {str(e)}")
+    return {"batch_id": batch['id'], "status": batch.get('processing_status'), "total": len(request.emails)}
+
+@fastapi_app.get("/api/v1/bulk-generate/batches/{batch_id}")
+async def get_bulk_batch(http_request: Request, batch_id: str = Path(..., pattern=r"^msgbatch_[A-Za-z0-9]+$")):
+    """Status of a submitted batch, with every email's result once it has ended"""
+    try:
+        batch = await http_request.app.state.async_ai.get_email_reply_batch(batch_id)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        logging.error(f"Error fetching batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching batch: {str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error fetching batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching batch: {str(e)}")
+
+    if 'results' not in batch:
+        return {"batch_id": batch_id, "status": batch.get('processing_status'), "request_counts": batch.get('request_counts')}
+    results = batch['results']
+    responses = [_bulk_entry(i, results[i], results[i].get('model_used')) for i in sorted(results)]
+    return {"batch_id": batch_id, "status": "ended", "results": responses, "total_processed": len(responses)}
+
+async def _probe(client, model_name: str) -> str:
+    """Check a model's provider with a lightweight authenticated request"""
+    provider = AI_MODELS.get(model_name, {}).get("provider")
+    api_key = getattr(ai_service, f"{provider}_api_key", None)
+    if provider not in PROVIDER_PROBES or not api_key:
+        return "unavailable"
+    
+    url, build_headers = PROVIDER_PROBES[provider]
+    response = await client.get(url, headers=build_headers(api_key), timeout=5)
+    return "operational" if response.status_code == 200 else "error"
+
+def _deep_model_status() -> Dict[str, str]:
+    """Run a real generation against every model (expensive)"""
+    model_status = {}
+    for model_name in ai_service.langchain_models:
+        try:
+            # Test model with a simple prompt
+            test_result = ai_service.generate_email_reply(
+                original_email="Test email",
+                context="Quick health check",
+                model=model_name,
+                tone="professional"
+            )
+            model_status[model_name] = "operational" if test_result.get("success") else "error"
+        except Exception:
+            model_status[model_name] = "unavailable"
+    return model_status
+
 @fastapi_app.get("/api/v1/health")
-async def health_check():
-    """Detailed health check including model availability"""
+async def health_check(http_request: Request, deep: bool = False):
+    """Detailed health check including model availability
+    
+    Provider checks run concurrently and are cached for 30 seconds; pass
+    ?deep=1 to run a real generation against every model instead.
+    """
     try:
-        model_status = {}
-        for model_name in ai_service.langchain_models:
-            try:
-                # Test model with a simple prompt
-                test_result = ai_service.generate_email_reply(
-                    original_email="Test email",
-                    context="Quick health check",
-                    model=model_name,
-                    tone="professional"
-                )
-                model_status[model_name] = "operational" if test_result.get("success") else "error"
-            except Exception:
-                model_status[model_name] = "unavailable"
+        if not deep and _health_cache["payload"] is not None and time.monotonic() < _health_cache["expires_at"]:
+            return _health_cache["payload"]
         
-        return {
-            "status": "healthy",
-            "timestamp": datetime.now().isoformat(),
-            "models": model_status,
-            "features": {
-                "langchain_integration": True,
-                "openrouter_qwen": "qwen-4-turbo" in ai_service.langchain_models,
-                "anthropic_claude": "claude-4-sonnet" in ai_service.langchain_models,
-                "openai_gpt": "gpt-4o" in ai_service.langchain_models
+        async with _health_lock:
+            if not deep and _health_cache["payload"] is not None and time.monotonic() < _health_cache["expires_at"]:
+                return _health_cache["payload"]
+            
+            model_names = _LANGCHAIN_MODELS
+            if deep:
+                model_status = await run_llm(_deep_model_status)
+            else:
+                probes = await asyncio.gather(*(_probe(http_request.app.state.async_ai.client, m) for m in model_names), return_exceptions=True)
+                model_status = {
+                    name: "unavailable" if isinstance(status, Exception) else status
+                    for name, status in zip(model_names, probes)
+                }
+            
+            payload = {
+                "status": "healthy",
+                "timestamp": datetime.now().isoformat(),
+                "models": model_status,
+                "deep": deep,
+                "features": {
+                    "langchain_integration": True,
+                    "openrouter_qwen": "qwen-4-turbo" in ai_service.langchain_models,
+                    "anthropic_claude": "claude-4-sonnet" in ai_service.langchain_models,
+                    "openai_gpt": "gpt-4o" in ai_service.langchain_models
+                }
             }
-        }
+            if not deep:
+                _health_cache["payload"] = payload
+                _health_cache["expires_at"] = time.monotonic() + HEALTH_CACHE_TTL_SECONDS
+            return payload
         
     except Exception as e:
         return {
@@ -325,9 +625,10 @@ async def health_check():
 async def generate_email_template(request: TemplateGenerationRequest):
     """Generate an AI-powered email template using LangChain"""
     try:
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
-        result = ai_service.generate_email_template(
+        result = await run_llm(
+            ai_service.generate_email_template,
             template_type=request.template_type,
             purpose=request.purpose,
             tone=request.tone,
@@ -335,8 +636,7 @@ async def generate_email_template(request: TemplateGenerationRequest):
             custom_instructions=request.custom_instructions
         )
         
-        end_time = datetime.now()
-        generation_time_ms = int((end_time - start_time).total_seconds() * 1000)
+        generation_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         
         if result.get('success'):
             # Log token usage for template generation
@@ -394,8 +694,6 @@ async def generate_email_template(request: TemplateGenerationRequest):
 async def langchain_query(request: LangChainRequest):
     """Process complex email tasks using LangChain agents and chains"""
     try:
-        start_time = datetime.now()
-        
         if not ENHANCED_AI_AVAILABLE:
             return LangChainResponse(
                 success=False,
@@ -406,13 +704,12 @@ async def langchain_query(request: LangChainRequest):
             )
         
         # Use LangChain conversational agent for advanced query processing
-        result = ai_service.process_with_conversational_agent(
+        result = await run_llm(
+            ai_service.process_with_conversational_agent,
             query=request.query,
             conversation_id=request.conversation_id
         )
         
-        end_time = datetime.now()
-        
         if result.get('success'):
             return LangChainResponse(
                 success=True,
@@ -445,21 +742,25 @@ async def langchain_query(request: LangChainRequest):
 async def enhanced_email_generation(request: EmailGenerationRequest):
     """Enhanced email generation using LangChain chains and memory"""
     try:
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         # Use comprehensive LangChain email generation
-        result = ai_service.generate_email_reply_with_langchain(
-            original_email=request.original_email,
-            context=request.context,
-            tone=request.tone,
-            custom_instructions=request.custom_instructions
+        result, cache_status = await run_llm(
+            response_cache.get_or_generate,
+            'enhanced-generate',
+            request.model_dump(),
+            lambda: ai_service.generate_email_reply_with_langchain(
+                original_email=request.original_email,
+                context=request.context,
+                tone=request.tone,
+                custom_instructions=request.custom_instructions
+            )
         )
         
-        end_time = datetime.now()
-        generation_time_ms = int((end_time - start_time).total_seconds() * 1000)
+        generation_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         
         if result.get('success'):
-            return EmailGenerationResponse(
+            payload = build_generation_response(
                 success=True,
                 email_reply=result.get('email_response') or result.get('reply'),
                 model_used=result.get('model_used', 'qwen-4-turbo'),
@@ -468,13 +769,14 @@ async def enhanced_email_generation(request: EmailGenerationRequest):
                 method="enhanced_langchain" if ENHANCED_AI_AVAILABLE else "standard"
             )
         else:
-            return EmailGenerationResponse(
+            payload = build_generation_response(
                 success=False,
                 error=result.get('error', 'Unknown error'),
                 model_used=result.get('model_used', 'qwen-4-turbo'),
                 generation_time_ms=generation_time_ms,
                 method="enhanced_langchain" if ENHANCED_AI_AVAILABLE else "standard"
             )
+        return _generation_json(payload, cache_status, result.get('cache_read_input_tokens', 0))
         
     except Exception as e:
         logging.error(f"Error in enhanced email generation: {str(e)}")
@@ -491,7 +793,7 @@ async def enhanced_email_analysis(request: EmailAnalysisRequest):
     """Enhanced email analysis using LangChain chains"""
     try:
         # Use comprehensive LangChain email analysis
-        result = ai_service.analyze_email_with_langchain(request.email_content)
+        result = await run_llm(ai_service.analyze_email_with_langchain, request.email_content)
         
         return EmailAnalysisResponse(
             sentiment=result.get('sentiment', 'neutral'),
@@ -517,12 +819,7 @@ async def enhanced_email_analysis(request: EmailAnalysisRequest):
 async def langchain_status():
     """Get comprehensive LangChain integration status"""
     try:
-        return {
-            "langchain_available": True,
-            "enhanced_service": "integrated_in_main_service",
-            "available_models": list(ai_service.langchain_models.keys()) if hasattr(ai_service, 'langchain_models') else [],
-            "timestamp": datetime.now().isoformat()
-        }
+        return {**_langchain_status_payload(), "timestamp": datetime.now().isoformat()}
     
     except Exception as e:
         return {
@@ -534,11 +831,11 @@ async def langchain_status():
 # Error handlers
 @fastapi_app.exception_handler(404)
 async def not_found_handler(request, exc):
-    return {"error": "Endpoint not found", "message": "Please check the API documentation"}
+    return ORJSONResponse(status_code=404, content={"error": "Endpoint not found", "message": "Please check the API documentation"})
 
 @fastapi_app.exception_handler(500)
 async def internal_error_handler(request, exc):
-    return {"error": "Internal server error", "message": "An unexpected error occurred"}
+    return ORJSONResponse(status_code=500, content={"error": "Internal server error", "message": "An unexpected error occurred"})
 
 if __name__ == "__main__":
     import uvicorn
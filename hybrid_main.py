@@ -1,35 +1,131 @@
 """
 Hybrid Flask + FastAPI Application Entry Point
-Runs both Flask (for frontend) and FastAPI (for advanced API) on different ports
+Runs both Flask (for frontend) and FastAPI (for advanced API) on different ports.
+
+Set HYBRID_MODE=single to serve both from one uvicorn process instead: FastAPI
+routes match first (so /api/v1/* is handled in-process rather than proxied over
+loopback) and the Flask app is mounted underneath as the fallback. For multiple
+workers sharing the AI service copy-on-write, preload it in the parent:
+
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker --preload "hybrid_main:create_single_app()"
+
+In single mode the /api/v1/* generation endpoints (and their /fastapi-proxy/*
+aliases) run natively on the event loop; Flask views run on the anyio thread
+pool, sized by WSGI_THREADS.
 """
+import os
 import threading
 import time
+from contextlib import asynccontextmanager
+import anyio
 import uvicorn
 from app import app, socketio
 import routes  # noqa: F401
 import websocket_handler  # noqa: F401
 from fastapi_service import fastapi_app
 
+# Per-request access logging is opt-in; it formats and writes a line per request
+ACCESS_LOG = os.environ.get("ACCESS_LOG", "0") == "1"
+
+# Threads available to the mounted Flask app in single mode. Flask views block
+# for the whole AI/SMTP call, so the anyio default of 40 caps concurrent pages
+WSGI_THREADS = int(os.environ.get("WSGI_THREADS", "200"))
+
+# FastAPI routes that would shadow Flask pages when both share one listener
+SHADOWED_FASTAPI_PATHS = {"/", "/docs"}
+
 def run_flask():
     """Run Flask application with SocketIO"""
     socketio.run(app, host="0.0.0.0", port=5000, debug=False, use_reloader=False, log_output=True)
 
 def run_fastapi():
     """Run FastAPI application"""
-    uvicorn.run(fastapi_app, host="0.0.0.0", port=8000, log_level="info")
+    uvicorn.run(
+        fastapi_app,
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        access_log=ACCESS_LOG,
+        proxy_headers=True,
+        timeout_graceful_shutdown=30,
+        log_level="info"
+    )
 
-if __name__ == "__main__":
-    print("🚀 Starting AI Email Assistant with LangChain and FastAPI integration...")
-    print("📧 Flask Frontend: http://localhost:5000")
-    print("⚡ FastAPI Backend: http://localhost:8000")
-    print("📚 API Documentation: http://localhost:8000/docs")
-    
-    # Start Flask in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    
-    # Give Flask a moment to start
-    time.sleep(2)
+def create_single_app():
+    """ASGI app serving the FastAPI routes in-process with the Flask app as fallback
     
-    # Start FastAPI in main thread
-    run_fastapi()
\ No newline at end of file
+    Built as a separate outer app, so fastapi_app (as served by run_fastapi)
+    is left unchanged and the factory can be called more than once.
+    """
+    from fastapi import FastAPI
+    from fastapi.middleware.wsgi import WSGIMiddleware
+
+    @asynccontextmanager
+    async def lifespan(_):
+        anyio.to_thread.current_default_thread_limiter().total_tokens = WSGI_THREADS
+        async with fastapi_app.router.lifespan_context(fastapi_app):
+            yield
+
+    single_app = FastAPI(
+        title=fastapi_app.title,
+        description=fastapi_app.description,
+        version=fastapi_app.version,
+        docs_url=None,
+        redoc_url=None,
+        openapi_url=None,
+        lifespan=lifespan
+    )
+    # Views read request.app.state, which is this app for the shared routes
+    # and fastapi_app under /fastapi-proxy; both see the per-process AI clients
+    single_app.state = fastapi_app.state
+    single_app.user_middleware = list(fastapi_app.user_middleware)
+
+    single_app.router.routes.extend(
+        route for route in fastapi_app.router.routes
+        if getattr(route, "path", None) not in SHADOWED_FASTAPI_PATHS
+    )
+    # Flask's /fastapi-proxy/* routes would block a pool thread on a loopback
+    # HTTP call; here the same paths reach the FastAPI routes in-process
+    single_app.mount("/fastapi-proxy", fastapi_app)
+    # Flask-SocketIO's WSGI middleware is part of app.wsgi_app, so Socket.IO
+    # keeps working here over the long-polling transport
+    single_app.mount("/", WSGIMiddleware(app))
+    return single_app
+
+def run_single():
+    """Serve Flask and FastAPI from a single uvicorn process"""
+    uvicorn.run(
+        "hybrid_main:create_single_app",
+        factory=True,
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "5000")),
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        loop="auto",  # uvloop when installed
+        http="auto",  # httptools when installed
+        access_log=ACCESS_LOG,
+        proxy_headers=True,
+        timeout_graceful_shutdown=30,
+        log_level="info"
+    )
+
+if __name__ == "__main__":
+    if os.environ.get("HYBRID_MODE") == "single":
+        print("🚀 Starting AI Email Assistant as a single uvicorn app...")
+        print(f"📧 Flask + FastAPI: http://localhost:{os.environ.get('PORT', '5000')}")
+        run_single()
+    else:
+        print("🚀 Starting AI Email Assistant with LangChain and FastAPI integration...")
+        print("📧 Flask Frontend: http://localhost:5000")
+        print("⚡ FastAPI Backend: http://localhost:8000")
+        print("📚 API Documentation: http://localhost:8000/docs")
+
+        # Start Flask in a separate thread
+        flask_thread = threading.Thread(target=run_flask, daemon=True)
+        flask_thread.start()
+
+        # Give Flask a moment to start
+        time.sleep(2)
+
+        # Start FastAPI in main thread
+        run_fastapi()
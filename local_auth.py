@@ -17,7 +17,7 @@ login_manager.login_message = 'Please log in to access this page.'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(user_id)
+    return db.session.get(User, user_id)
 
 # Create Blueprint
 local_auth = Blueprint('local_auth', __name__, url_prefix='/auth')
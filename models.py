@@ -1,12 +1,86 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import enum
+import logging
+import os
 from app import db
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint
-import uuid
+from sqlalchemy import DDL, CheckConstraint, FetchedValue, UniqueConstraint, event, func, insert, inspect
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.types import TypeDecorator
+import orjson
 
-# Enums for various model fields
+# Bounded key lengths; FK columns mirror the column they reference.
+# User ids are OIDC subjects for Replit accounts, UUIDs for local ones.
+UUID_LENGTH = 36
+USER_ID_LENGTH = 64
+
+# Ids are generated by PostgreSQL (gen_random_uuid() is built in from PG 13), so
+# inserts send DEFAULT and the ORM reads the key back with RETURNING
+UUID_SERVER_DEFAULT = db.text("gen_random_uuid()::text")
+
+class FastJSONB(TypeDecorator):
+    """JSONB column decoded with orjson when the driver hands back raw text"""
+    impl = JSONB
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, (bytes, str)):
+            return orjson.loads(value)
+        return value
+
+
+def parse_addresses(value):
+    """Unwrap JSON-encoded (including doubly encoded) address strings into a list"""
+    # Already-decoded JSONB arrays are the common case
+    if type(value) is list:
+        return value
+    for _ in range(3):
+        if not isinstance(value, (bytes, str)):
+            break
+        try:
+            value = orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return [a.strip() for a in value.split(',') if a.strip()] if isinstance(value, str) else []
+    return value if isinstance(value, list) else []
+
+
+class AddressList(FastJSONB):
+    """JSONB list of addresses; legacy JSON-string values are unwrapped on load and bind"""
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return parse_addresses(value) if isinstance(value, (bytes, str)) else value
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else parse_addresses(value)
+
+
+def _smtp_fernet():
+    """Fernet for SMTP passwords at rest, from SMTP_SECRET_KEY
+    
+    The variable holds comma-separated Fernet keys: the first encrypts and any
+    of them decrypts, so a key can be rotated by prepending the new one.
+    """
+    keys = [key.strip() for key in os.environ.get("SMTP_SECRET_KEY", "").split(',') if key.strip()]
+    if not keys:
+        logging.error("SMTP_SECRET_KEY is not set; SMTP passwords can't be saved or used to send email")
+        return None
+    return MultiFernet([Fernet(key) for key in keys])
+
+# Built once per process so requests don't re-parse the key
+SMTP_FERNET = _smtp_fernet()
+
+# Every Fernet token starts with these bytes (version 0x80 + timestamp), base64 encoded
+FERNET_TOKEN_PREFIX = 'gAAAAA'
+
+
+# Enums for various model fields.
+# Columns store the member name in a VARCHAR(16) guarded by a CHECK constraint
+# (native_enum=False) rather than a PostgreSQL ENUM type.
 class EmailStatus(enum.Enum):
     DRAFT = "draft"
     SENT = "sent"
@@ -33,40 +107,82 @@ class EmailTone(enum.Enum):
     CASUAL = "casual"
     URGENT = "urgent"
 
+# One column type per enum, shared by every column that stores it
+EmailStatusType = db.Enum(EmailStatus, native_enum=False, length=16, create_constraint=True, name='ck_email_status')
+UserRoleType = db.Enum(UserRole, native_enum=False, length=16, create_constraint=True, name='ck_user_role')
+AIModelType = db.Enum(AIModel, native_enum=False, length=16, create_constraint=True, name='ck_ai_model')
+EmailToneType = db.Enum(EmailTone, native_enum=False, length=16, create_constraint=True, name='ck_email_tone')
+
 # User model - supports both local and OAuth authentication
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
-    id = db.Column(db.String, primary_key=True)
-    email = db.Column(db.String, unique=True, nullable=True)
+    id = db.Column(db.String(USER_ID_LENGTH), primary_key=True)
+    email = db.Column(db.String(254), unique=True, nullable=True)
     first_name = db.Column(db.String, nullable=True)
     last_name = db.Column(db.String, nullable=True)
     profile_image_url = db.Column(db.String, nullable=True)
     password_hash = db.Column(db.String, nullable=True)  # For local authentication
     
     # Email settings
-    smtp_server = db.Column(db.String, nullable=True)
+    smtp_server = db.Column(db.String(255), nullable=True)
     smtp_port = db.Column(db.Integer, nullable=True)
     smtp_username = db.Column(db.String, nullable=True)
-    smtp_password = db.Column(db.String, nullable=True)  # Encrypted
+    # Fernet ciphertext; deferred so the per-request user load doesn't carry it
+    smtp_password = db.deferred(db.Column(db.String, nullable=True))
     smtp_use_tls = db.Column(db.Boolean, default=True)
     
     # AI preferences
-    preferred_ai_model = db.Column(db.Enum(AIModel), default=AIModel.QWEN_4_TURBO)
-    default_tone = db.Column(db.Enum(EmailTone), default=EmailTone.PROFESSIONAL)
+    preferred_ai_model = db.Column(AIModelType, default=AIModel.QWEN_4_TURBO)
+    default_tone = db.Column(EmailToneType, default=EmailTone.PROFESSIONAL)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
-    team_memberships = db.relationship('TeamMember', back_populates='user', cascade='all, delete-orphan')
-    emails = db.relationship('Email', back_populates='user', cascade='all, delete-orphan')
-    templates = db.relationship('EmailTemplate', back_populates='user', cascade='all, delete-orphan')
+    team_memberships = db.relationship('TeamMember', back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
+    emails = db.relationship('Email', back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
+    templates = db.relationship('EmailTemplate', back_populates='user', cascade='all, delete-orphan', passive_deletes=True)
+
+    def set_smtp_password(self, password):
+        """Store the SMTP password encrypted"""
+        if SMTP_FERNET is None:
+            raise RuntimeError("SMTP_SECRET_KEY must be set to save SMTP passwords")
+        self.smtp_password = SMTP_FERNET.encrypt(password.encode()).decode()
+
+    @property
+    def decrypted_smtp_password(self):
+        """Plaintext SMTP password for logging in to the user's SMTP server"""
+        if not self.smtp_password or not self.smtp_password.startswith(FERNET_TOKEN_PREFIX):
+            # Saved before encryption and not yet migrated
+            return self.smtp_password
+        if SMTP_FERNET is None:
+            raise RuntimeError("SMTP_SECRET_KEY must be set to use the saved SMTP password")
+        try:
+            return SMTP_FERNET.decrypt(self.smtp_password.encode()).decode()
+        except InvalidToken:
+            logging.error(f"SMTP password for user {self.id} does not decrypt with SMTP_SECRET_KEY")
+            raise RuntimeError("The saved SMTP password can't be decrypted; please re-enter it in your SMTP settings")
+
+
+def encrypt_legacy_smtp_passwords():
+    """Encrypt SMTP passwords saved as plaintext before encryption at rest; returns rows changed"""
+    if SMTP_FERNET is None:
+        return 0
+    users = User.query.options(load_only(User.id, User.smtp_password)).filter(
+        User.smtp_password.isnot(None),
+        ~User.smtp_password.startswith(FERNET_TOKEN_PREFIX)
+    ).all()
+    for user in users:
+        user.set_smtp_password(user.smtp_password)
+    if users:
+        db.session.commit()
+    return len(users)
 
 # OAuth model - mandatory for Replit Auth
 class OAuth(OAuthConsumerMixin, db.Model):
-    user_id = db.Column(db.String, db.ForeignKey(User.id))
-    browser_session_key = db.Column(db.String, nullable=False)
-    user = db.relationship(User)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey(User.id))
+    browser_session_key = db.Column(db.String(64), nullable=False)
+    user = db.relationship(User, lazy='joined')
 
     __table_args__ = (UniqueConstraint(
         'user_id',
@@ -78,85 +194,107 @@ class OAuth(OAuthConsumerMixin, db.Model):
 # Team model
 class Team(db.Model):
     __tablename__ = 'teams'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     
     # Team settings
-    ai_model_access = db.Column(db.JSON, default=lambda: ["qwen-4-turbo", "claude-4-sonnet", "gpt-4o"])
+    ai_model_access = db.Column(ARRAY(db.String(32)), server_default="{qwen-4-turbo,claude-4-sonnet,gpt-4o}")
     monthly_token_limit = db.Column(db.Integer, default=100000)
     require_approval = db.Column(db.Boolean, default=False)
+    # Running total for the current month, maintained by a trigger on token_usage
+    monthly_tokens_used = db.Column(db.BigInteger, default=0, server_default='0')
+    monthly_tokens_reset_at = db.Column(db.DateTime)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
-    members = db.relationship('TeamMember', back_populates='team', cascade='all, delete-orphan')
-    emails = db.relationship('Email', back_populates='team', cascade='all, delete-orphan')
-    templates = db.relationship('EmailTemplate', back_populates='team', cascade='all, delete-orphan')
+    members = db.relationship('TeamMember', back_populates='team', cascade='all, delete-orphan', passive_deletes=True, lazy='selectin')
+    emails = db.relationship('Email', back_populates='team', cascade='all, delete-orphan', passive_deletes=True)
+    templates = db.relationship('EmailTemplate', back_populates='team', cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (db.Index('ix_team_ai_models_gin', 'ai_model_access', postgresql_using='gin'),)
+
+    def tokens_used_this_month(self):
+        """Tokens consumed this calendar month, read from the maintained counter"""
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if not self.monthly_tokens_reset_at or self.monthly_tokens_reset_at < month_start:
+            return 0
+        return self.monthly_tokens_used or 0
 
 # Team invitations model
 class TeamInvitation(db.Model):
     __tablename__ = 'team_invitations'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
-    invited_user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    invited_by_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    role = db.Column(db.Enum(UserRole), default=UserRole.USER)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
+    invited_user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
+    invited_by_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
+    role = db.Column(UserRoleType, default=UserRole.USER)
     
     # Invitation status
-    status = db.Column(db.String, default='pending')  # pending, accepted, declined
+    status = db.Column(db.String(16), default='pending')  # pending, accepted, declined
     message = db.Column(db.Text)  # Optional invitation message
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
     responded_at = db.Column(db.DateTime)
     
     # Relationships
-    team = db.relationship('Team', foreign_keys=[team_id])
+    team = db.relationship('Team', foreign_keys=[team_id], lazy='joined', innerjoin=True)
     invited_user = db.relationship('User', foreign_keys=[invited_user_id])
-    invited_by = db.relationship('User', foreign_keys=[invited_by_id])
+    invited_by = db.relationship('User', foreign_keys=[invited_by_id], lazy='joined', innerjoin=True)
     
-    __table_args__ = (UniqueConstraint('team_id', 'invited_user_id', name='uq_team_invitation'),)
+    __table_args__ = (
+        UniqueConstraint('team_id', 'invited_user_id', name='uq_team_invitation'),
+        # "My pending invitations" (dashboard, get_invitations) only ever reads pending rows
+        db.Index('ix_team_invitations_pending_user', 'invited_user_id', postgresql_where=db.text("status = 'pending'")),
+    )
 
 # Team membership model
 class TeamMember(db.Model):
     __tablename__ = 'team_members'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
-    role = db.Column(db.Enum(UserRole), default=UserRole.USER)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id', ondelete='CASCADE'), nullable=False)
+    role = db.Column(UserRoleType, default=UserRole.USER)
     
-    joined_at = db.Column(db.DateTime, default=datetime.now)
+    joined_at = db.Column(db.DateTime, server_default=func.now())
     
     # Relationships
-    user = db.relationship('User', back_populates='team_memberships')
-    team = db.relationship('Team', back_populates='members')
-    
-    __table_args__ = (UniqueConstraint('user_id', 'team_id', name='uq_user_team'),)
+    user = db.relationship('User', back_populates='team_memberships', lazy='joined', innerjoin=True)
+    team = db.relationship('Team', back_populates='members', lazy='joined', innerjoin=True)
+    
+    __table_args__ = (
+        UniqueConstraint('user_id', 'team_id', name='uq_user_team'),
+        # Team-side lookups: member lists and the other-admin check
+        db.Index('ix_team_members_team_role', 'team_id', 'role'),
+    )
 
 # Email model
 class Email(db.Model):
     __tablename__ = 'emails'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=True)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id', ondelete='CASCADE'), nullable=True)
     
     # Email content
     subject = db.Column(db.String(255), nullable=False)
-    body_html = db.Column(db.Text)
-    body_text = db.Column(db.Text)
+    # Large text columns load only when accessed (or via undefer_group('body')),
+    # so list queries read narrow rows
+    body_html = db.deferred(db.Column(db.Text), group='body')
+    body_text = db.deferred(db.Column(db.Text), group='body')
     
     # Recipients
-    to_addresses = db.Column(db.JSON)  # List of email addresses
-    cc_addresses = db.Column(db.JSON)  # List of email addresses
-    bcc_addresses = db.Column(db.JSON)  # List of email addresses
+    to_addresses = db.Column(AddressList)  # List of email addresses
+    cc_addresses = db.Column(AddressList)  # List of email addresses
+    bcc_addresses = db.Column(AddressList)  # List of email addresses
     
     # Email metadata
-    status = db.Column(db.Enum(EmailStatus), default=EmailStatus.DRAFT)
-    ai_model_used = db.Column(db.Enum(AIModel))
-    tone_used = db.Column(db.Enum(EmailTone))
-    original_email = db.Column(db.Text)  # The email being replied to
-    context = db.Column(db.Text)  # Additional context provided
+    status = db.Column(EmailStatusType, default=EmailStatus.DRAFT)
+    ai_model_used = db.Column(AIModelType)
+    tone_used = db.Column(EmailToneType)
+    original_email = db.deferred(db.Column(db.Text), group='body')  # The email being replied to
+    context = db.deferred(db.Column(db.Text), group='body')  # Additional context provided
     
     # Analytics
     generation_time_ms = db.Column(db.Integer)
@@ -164,32 +302,78 @@ class Email(db.Model):
     delivered_at = db.Column(db.DateTime)
     opened_at = db.Column(db.DateTime)
     replied_at = db.Column(db.DateTime)
-    user_rating = db.Column(db.Integer)  # 1-5 rating
+    user_rating = db.Column(db.SmallInteger)  # 1-5 rating
     edited_before_send = db.Column(db.Boolean, default=False)
     
     # Scheduling
     scheduled_send_time = db.Column(db.DateTime)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
     user = db.relationship('User', back_populates='emails')
     team = db.relationship('Team', back_populates='emails')
-    drafts = db.relationship('EmailDraft', back_populates='email', cascade='all, delete-orphan')
+    drafts = db.relationship('EmailDraft', back_populates='email', cascade='all, delete-orphan', passive_deletes=True)
+    recipients = db.relationship('EmailRecipient', cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_emails_user_created', 'user_id', db.desc('created_at')),
+        db.Index('ix_emails_team_created', 'team_id', db.desc('created_at'), postgresql_where=db.text('team_id IS NOT NULL')),
+        # Partial index: a scheduled-send scan only touches drafts still waiting
+        # to go out (enum columns store the member name)
+        db.Index('ix_emails_pending_schedule', 'scheduled_send_time', postgresql_where=db.text("status = 'DRAFT' AND scheduled_send_time IS NOT NULL")),
+        # Backs recipient containment lookups (to_addresses @> '["x@y.com"]')
+        db.Index('ix_emails_to_addresses_gin', 'to_addresses', postgresql_using='gin', postgresql_ops={'to_addresses': 'jsonb_path_ops'}),
+        CheckConstraint('user_rating BETWEEN 1 AND 5', name='ck_email_user_rating'),
+    )
+
+# Recipient addresses, one row per address, for indexed "emails sent to X"
+# lookups; kept in sync with the JSON address columns on flush
+class EmailRecipient(db.Model):
+    __tablename__ = 'email_recipients'
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    email_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('emails.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(3), nullable=False)  # to, cc, bcc
+    address = db.Column(db.String(254), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_recipients_address', 'address'),
+        db.Index('ix_recipients_email_kind', 'email_id', 'kind'),
+    )
+
+RECIPIENT_COLUMNS = {'to': 'to_addresses', 'cc': 'cc_addresses', 'bcc': 'bcc_addresses'}
+
+def _address_list(value):
+    """Normalized recipient addresses for the email_recipients rows"""
+    return [str(a).strip().lower()[:254] for a in parse_addresses(value) if a and str(a).strip()]
+
+@event.listens_for(Session, 'before_flush')
+def _sync_email_recipients(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Email):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[attr].history.has_changes() for attr in RECIPIENT_COLUMNS.values()):
+            continue
+        obj.recipients = [
+            EmailRecipient(kind=kind, address=address)
+            for kind, attr in RECIPIENT_COLUMNS.items()
+            for address in dict.fromkeys(_address_list(getattr(obj, attr)))
+        ]
 
 # Email drafts for collaboration
 class EmailDraft(db.Model):
     __tablename__ = 'email_drafts'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    email_id = db.Column(db.String, db.ForeignKey('emails.id'), nullable=False)
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    email_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('emails.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
     
     content = db.Column(db.Text)
     version = db.Column(db.Integer, default=1)
     is_active = db.Column(db.Boolean, default=True)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
     
     # Relationships
     email = db.relationship('Email', back_populates='drafts')
@@ -197,9 +381,9 @@ class EmailDraft(db.Model):
 # Email templates
 class EmailTemplate(db.Model):
     __tablename__ = 'email_templates'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=True)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id', ondelete='CASCADE'), nullable=True)
     
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
@@ -207,60 +391,69 @@ class EmailTemplate(db.Model):
     body_template = db.Column(db.Text)
     
     # Template settings
-    default_tone = db.Column(db.Enum(EmailTone))
+    default_tone = db.Column(EmailToneType)
     is_public = db.Column(db.Boolean, default=False)  # Visible to team
     
     usage_count = db.Column(db.Integer, default=0)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now(), server_onupdate=FetchedValue())
     
     # Relationships
     user = db.relationship('User', back_populates='templates')
-    team = db.relationship('Team', back_populates='templates')
+    team = db.relationship('Team', back_populates='templates', lazy='joined')
+
+    __table_args__ = (
+        db.Index('ix_email_templates_user', 'user_id'),
+        db.Index('ix_email_templates_team', 'team_id', postgresql_where=db.text('team_id IS NOT NULL')),
+    )
 
 # Analytics model
+# One row per email sharing its primary key; delivery timestamps and AI metrics
+# live on Email itself, this table only holds what Email doesn't track
 class EmailAnalytics(db.Model):
     __tablename__ = 'email_analytics'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
-    email_id = db.Column(db.String, db.ForeignKey('emails.id'), nullable=False)
+    email_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('emails.id', ondelete='CASCADE'), primary_key=True)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
     
     # Tracking data
-    sent_at = db.Column(db.DateTime)
-    delivered_at = db.Column(db.DateTime)
-    opened_at = db.Column(db.DateTime)
     clicked_at = db.Column(db.DateTime)
-    replied_at = db.Column(db.DateTime)
     
     # AI metrics
-    ai_model_used = db.Column(db.String(50))
-    generation_time_ms = db.Column(db.Integer)
-    user_rating = db.Column(db.Integer)
-    edited_before_send = db.Column(db.Boolean, default=False)
     edit_percentage = db.Column(db.Float)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+
+    email = db.relationship('Email')
+
+    __table_args__ = (db.Index('ix_analytics_team_created', 'team_id', 'created_at'),)
 
 # Collaboration sessions for real-time editing
 class CollaborationSession(db.Model):
     __tablename__ = 'collaboration_sessions'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    email_id = db.Column(db.String, db.ForeignKey('emails.id'), nullable=False)
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    email_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('emails.id'), nullable=False)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
     
     is_active = db.Column(db.Boolean, default=True)
-    last_seen = db.Column(db.DateTime, default=datetime.now)
+    last_seen = db.Column(db.DateTime, server_default=func.clock_timestamp())
     cursor_position = db.Column(db.Integer, default=0)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+
+    __table_args__ = (
+        db.Index('ix_collab_sessions_email_user', 'email_id', 'user_id'),
+        # Presence expiry and disconnect cleanup only look at live sessions
+        db.Index('ix_collab_sessions_active', 'user_id', 'email_id', postgresql_where=db.text('is_active')),
+        # last_seen/cursor_position stay unindexed so heartbeats remain HOT
+    )
 
 # Token usage tracking per team member
 class TokenUsage(db.Model):
     __tablename__ = 'token_usage'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
     
     # Usage details
     ai_model = db.Column(db.String(50), nullable=False)  # Which model was used
@@ -270,26 +463,80 @@ class TokenUsage(db.Model):
     
     # Performance metrics
     generation_time_ms = db.Column(db.Integer)
-    quality_score = db.Column(db.Float)  # AI-assessed quality (1-10)
-    user_satisfaction = db.Column(db.Integer)  # User rating 1-5 stars
+    quality_score = db.Column(db.REAL)  # AI-assessed quality (1-10)
+    user_satisfaction = db.Column(db.SmallInteger)  # User rating 1-5 stars
     
     # Context
-    email_id = db.Column(db.String, db.ForeignKey('emails.id'), nullable=True)
+    email_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('emails.id'), nullable=True)
     prompt_length = db.Column(db.Integer)
     response_length = db.Column(db.Integer)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    # Partition key, so it is part of the primary key
+    created_at = db.Column(db.DateTime, primary_key=True, nullable=False, server_default=func.now())
     
     # Relationships
     user = db.relationship('User')
     team = db.relationship('Team')
     email = db.relationship('Email')
 
+    # Range-partitioned by month; indexes declared here are created on every
+    # partition, and recent-range queries prune to one or two of them
+    __table_args__ = (
+        # Covering: team/window scans read the aggregated columns from the
+        # index alone (index-only scan) instead of fetching each heap row
+        db.Index('ix_token_usage_team_created', 'team_id', db.desc('created_at'),
+                 postgresql_include=['user_id', 'ai_model', 'tokens_consumed', 'cost_usd',
+                                     'generation_time_ms', 'quality_score', 'user_satisfaction']),
+        db.Index('ix_token_usage_team_user_created', 'team_id', 'user_id', 'created_at'),
+        db.Index('ix_token_usage_user_model_created', 'user_id', 'ai_model', 'created_at'),
+        CheckConstraint('quality_score BETWEEN 0 AND 10', name='ck_token_usage_quality'),
+        CheckConstraint('user_satisfaction BETWEEN 1 AND 5', name='ck_token_usage_satisfaction'),
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+    # Written on every AI call; don't re-fetch server defaults after each insert
+    __mapper_args__ = {'eager_defaults': False}
+
+    @classmethod
+    def bulk_record(cls, session, rows):
+        """Insert usage rows (dicts of column values) as one multi-row INSERT"""
+        if rows:
+            session.execute(insert(cls), rows)
+
+# Daily per-member, per-model rollup of token_usage, maintained by a trigger on
+# token_usage so team analytics read a few rows per member per day instead of
+# every usage row. The *_n columns count non-NULL values so averages match AVG()
+class TokenUsageDaily(db.Model):
+    __tablename__ = 'token_usage_daily'
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), primary_key=True)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), primary_key=True)
+    ai_model = db.Column(db.String(50), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+
+    tokens_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    cost_sum = db.Column(db.Float, nullable=False, default=0.0)
+    ops_count = db.Column(db.Integer, nullable=False, default=0)
+    quality_sum = db.Column(db.Float, nullable=False, default=0.0)
+    quality_n = db.Column(db.Integer, nullable=False, default=0)
+    satisfaction_sum = db.Column(db.Integer, nullable=False, default=0)
+    satisfaction_n = db.Column(db.Integer, nullable=False, default=0)
+    gen_time_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    gen_time_n = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_token_usage_daily_team_day', 'team_id', 'day'),
+    )
+
+    @staticmethod
+    def rebuild(session):
+        """Recompute the rollup from token_usage, e.g. after manual edits to usage rows"""
+        session.execute(db.text("DELETE FROM token_usage_daily"))
+        session.execute(db.text(TOKEN_USAGE_DAILY_BACKFILL))
+
 # AI-powered team insights and recommendations  
 class TeamAIInsights(db.Model):
     __tablename__ = 'team_ai_insights'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
     
     # Insight types: 'productivity', 'collaboration', 'cost_optimization', 'quality'
     insight_type = db.Column(db.String(30), nullable=False)
@@ -298,28 +545,36 @@ class TeamAIInsights(db.Model):
     
     # AI recommendations
     recommendation = db.Column(db.Text)
-    confidence_score = db.Column(db.Float, default=0.0)  # 0-1 confidence
+    confidence_score = db.Column(db.REAL, default=0.0)  # 0-1 confidence
     priority_level = db.Column(db.String(10), default='medium')  # low, medium, high
     
     # Tracking
     is_acknowledged = db.Column(db.Boolean, default=False)
-    acknowledged_by_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=True)
+    acknowledged_by_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=True)
     acknowledged_at = db.Column(db.DateTime, nullable=True)
     
     # Metadata
     data_points_analyzed = db.Column(db.Integer, default=0)
-    generated_at = db.Column(db.DateTime, default=datetime.now)
+    generated_at = db.Column(db.DateTime, server_default=func.now())
     expires_at = db.Column(db.DateTime, nullable=True)  # Some insights expire
     
     # Relationships
     team = db.relationship('Team')
     acknowledged_by = db.relationship('User')
 
+    # now() can't appear in an index predicate, so live insights are found by
+    # range over expires_at; expired rows are purged in bulk (see websocket_handler)
+    __table_args__ = (
+        db.Index('ix_insights_team_expires', 'team_id', 'expires_at'),
+        CheckConstraint('confidence_score BETWEEN 0 AND 1', name='ck_insight_confidence'),
+        CheckConstraint("priority_level IN ('low', 'medium', 'high')", name='ck_insight_priority'),
+    )
+
 # Team collaboration patterns and AI coaching
 class TeamCollaborationPattern(db.Model):
     __tablename__ = 'team_collaboration_patterns'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
     
     # Pattern analysis
     pattern_name = db.Column(db.String(100), nullable=False)
@@ -331,12 +586,12 @@ class TeamCollaborationPattern(db.Model):
     improvement_potential = db.Column(db.String(20))  # 'low', 'medium', 'high'
     
     # Member involvement
-    primary_participants = db.Column(db.JSON)  # List of user IDs most involved
+    primary_participants = db.Column(FastJSONB)  # List of user IDs most involved
     collaboration_quality = db.Column(db.Float, default=0.0)  # 1-10 scale
     
     # Time tracking
-    first_observed = db.Column(db.DateTime, default=datetime.now)
-    last_observed = db.Column(db.DateTime, default=datetime.now)
+    first_observed = db.Column(db.DateTime, server_default=func.now())
+    last_observed = db.Column(db.DateTime, server_default=func.now())
     analysis_period_days = db.Column(db.Integer, default=7)
     
     # Relationships  
@@ -345,9 +600,9 @@ class TeamCollaborationPattern(db.Model):
 # Smart email suggestions and auto-responses
 class SmartEmailSuggestion(db.Model):
     __tablename__ = 'smart_email_suggestions'
-    id = db.Column(db.String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    team_id = db.Column(db.String, db.ForeignKey('teams.id'), nullable=False)
-    user_id = db.Column(db.String, db.ForeignKey('users.id'), nullable=False)
+    id = db.Column(db.String(UUID_LENGTH), primary_key=True, server_default=UUID_SERVER_DEFAULT)
+    team_id = db.Column(db.String(UUID_LENGTH), db.ForeignKey('teams.id'), nullable=False)
+    user_id = db.Column(db.String(USER_ID_LENGTH), db.ForeignKey('users.id'), nullable=False)
     
     # Suggestion context
     trigger_email_content = db.Column(db.Text)  # Original email that triggered suggestion
@@ -355,18 +610,264 @@ class SmartEmailSuggestion(db.Model):
     suggested_content = db.Column(db.Text, nullable=False)
     
     # AI analysis
-    relevance_score = db.Column(db.Float, default=0.0)  # How relevant (0-1)
-    tone_match_score = db.Column(db.Float, default=0.0)  # How well it matches user's style
-    predicted_effectiveness = db.Column(db.Float, default=0.0)  # Predicted success rate
+    relevance_score = db.Column(db.REAL, default=0.0)  # How relevant (0-1)
+    tone_match_score = db.Column(db.REAL, default=0.0)  # How well it matches user's style
+    predicted_effectiveness = db.Column(db.REAL, default=0.0)  # Predicted success rate
     
     # User interaction
     was_used = db.Column(db.Boolean, default=False)
-    user_rating = db.Column(db.Integer, nullable=True)  # 1-5 stars if used
+    user_rating = db.Column(db.SmallInteger, nullable=True)  # 1-5 stars if used
     modified_before_use = db.Column(db.Boolean, default=False)
     
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, server_default=func.now())
     used_at = db.Column(db.DateTime, nullable=True)
     
     # Relationships
     team = db.relationship('Team')
     user = db.relationship('User')
+
+    __table_args__ = (
+        CheckConstraint(
+            'relevance_score BETWEEN 0 AND 1 AND tone_match_score BETWEEN 0 AND 1 '
+            'AND predicted_effectiveness BETWEEN 0 AND 1',
+            name='ck_suggestion_scores'
+        ),
+        CheckConstraint('user_rating BETWEEN 1 AND 5', name='ck_suggestion_user_rating'),
+    )
+
+# updated_at is maintained by the database so bulk UPDATEs need no per-row
+# Python timestamp; the ORM re-fetches it via server_onupdate=FetchedValue()
+event.listen(db.metadata, 'before_create', DDL(
+    "CREATE OR REPLACE FUNCTION set_updated_at() RETURNS trigger AS $$ "
+    "BEGIN NEW.updated_at = now(); RETURN NEW; END; $$ LANGUAGE plpgsql"
+).execute_if(dialect='postgresql'))
+
+for _model in (User, Team, Email, EmailTemplate):
+    event.listen(_model.__table__, 'after_create', DDL(
+        "CREATE TRIGGER trg_%(table)s_updated_at BEFORE UPDATE ON %(table)s "
+        "FOR EACH ROW EXECUTE FUNCTION set_updated_at()"
+    ).execute_if(dialect='postgresql'))
+
+# Tables whose rows are updated in place often (drafts, heartbeats, the usage
+# rollup every AI call hits) leave free space on each page so PostgreSQL can
+# keep the new row version there (HOT update, no index writes)
+for _model in (Email, EmailDraft, CollaborationSession, TokenUsageDaily, SmartEmailSuggestion):
+    event.listen(_model.__table__, 'after_create', DDL(
+        "ALTER TABLE %(table)s SET (fillfactor = 70)"
+    ).execute_if(dialect='postgresql'))
+
+# Each token_usage row adds to its team's monthly counter; the first row of a
+# new month restarts it, so no scheduled reset is needed
+event.listen(db.metadata, 'before_create', DDL(
+    "CREATE OR REPLACE FUNCTION add_team_tokens() RETURNS trigger AS $$ "
+    "BEGIN "
+    "UPDATE teams SET "
+    "monthly_tokens_used = CASE "
+    "WHEN monthly_tokens_reset_at IS NULL OR monthly_tokens_reset_at < date_trunc('month', now()) "
+    "THEN NEW.tokens_consumed ELSE monthly_tokens_used + NEW.tokens_consumed END, "
+    "monthly_tokens_reset_at = date_trunc('month', now()) "
+    "WHERE id = NEW.team_id; "
+    "RETURN NULL; "
+    "END; $$ LANGUAGE plpgsql"
+).execute_if(dialect='postgresql'))
+
+# Each token_usage row is folded into its (team, user, model, day) rollup row
+event.listen(db.metadata, 'before_create', DDL(
+    "CREATE OR REPLACE FUNCTION add_token_usage_daily() RETURNS trigger AS $$ "
+    "BEGIN "
+    "INSERT INTO token_usage_daily AS d (team_id, user_id, ai_model, day, tokens_sum, cost_sum, ops_count, "
+    "quality_sum, quality_n, satisfaction_sum, satisfaction_n, gen_time_sum, gen_time_n) "
+    "VALUES (NEW.team_id, NEW.user_id, NEW.ai_model, NEW.created_at::date, NEW.tokens_consumed, "
+    "COALESCE(NEW.cost_usd, 0), 1, "
+    "COALESCE(NEW.quality_score, 0), (NEW.quality_score IS NOT NULL)::int, "
+    "COALESCE(NEW.user_satisfaction, 0), (NEW.user_satisfaction IS NOT NULL)::int, "
+    "COALESCE(NEW.generation_time_ms, 0), (NEW.generation_time_ms IS NOT NULL)::int) "
+    "ON CONFLICT (team_id, user_id, ai_model, day) DO UPDATE SET "
+    "tokens_sum = d.tokens_sum + EXCLUDED.tokens_sum, "
+    "cost_sum = d.cost_sum + EXCLUDED.cost_sum, "
+    "ops_count = d.ops_count + 1, "
+    "quality_sum = d.quality_sum + EXCLUDED.quality_sum, "
+    "quality_n = d.quality_n + EXCLUDED.quality_n, "
+    "satisfaction_sum = d.satisfaction_sum + EXCLUDED.satisfaction_sum, "
+    "satisfaction_n = d.satisfaction_n + EXCLUDED.satisfaction_n, "
+    "gen_time_sum = d.gen_time_sum + EXCLUDED.gen_time_sum, "
+    "gen_time_n = d.gen_time_n + EXCLUDED.gen_time_n; "
+    "RETURN NULL; "
+    "END; $$ LANGUAGE plpgsql"
+).execute_if(dialect='postgresql'))
+
+TOKEN_USAGE_DAILY_BACKFILL = (
+    "INSERT INTO token_usage_daily (team_id, user_id, ai_model, day, tokens_sum, cost_sum, ops_count, "
+    "quality_sum, quality_n, satisfaction_sum, satisfaction_n, gen_time_sum, gen_time_n) "
+    "SELECT team_id, user_id, ai_model, created_at::date, SUM(tokens_consumed), COALESCE(SUM(cost_usd), 0), COUNT(*), "
+    "COALESCE(SUM(quality_score), 0), COUNT(quality_score), "
+    "COALESCE(SUM(user_satisfaction), 0), COUNT(user_satisfaction), "
+    "COALESCE(SUM(generation_time_ms), 0), COUNT(generation_time_ms) "
+    "FROM token_usage GROUP BY team_id, user_id, ai_model, created_at::date"
+)
+
+# Deployments that already have usage rows get them rolled up, and the trigger
+# attached, when the rollup table is first created; on a fresh database
+# token_usage may not exist yet and its own after_create adds the trigger
+event.listen(TokenUsageDaily.__table__, 'after_create', DDL(
+    "DO $$ BEGIN IF to_regclass('token_usage') IS NOT NULL THEN "
+    + TOKEN_USAGE_DAILY_BACKFILL.replace('%', '%%') + "; "
+    "IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_token_usage_daily' "
+    "AND tgrelid = 'token_usage'::regclass) THEN "
+    "CREATE TRIGGER trg_token_usage_daily AFTER INSERT ON token_usage "
+    "FOR EACH ROW EXECUTE FUNCTION add_token_usage_daily(); "
+    "END IF; "
+    "END IF; END $$"
+).execute_if(dialect='postgresql'))
+
+# Rows outside every monthly partition land here rather than failing the insert
+TOKEN_USAGE_DEFAULT_PARTITION = "CREATE TABLE IF NOT EXISTS token_usage_default PARTITION OF token_usage DEFAULT"
+
+TOKEN_USAGE_TRIGGERS = (
+    "CREATE TRIGGER trg_token_usage_team_total AFTER INSERT ON token_usage "
+    "FOR EACH ROW EXECUTE FUNCTION add_team_tokens()",
+    "CREATE TRIGGER trg_token_usage_daily AFTER INSERT ON token_usage "
+    "FOR EACH ROW EXECUTE FUNCTION add_token_usage_daily()",
+)
+
+for _statement in (TOKEN_USAGE_DEFAULT_PARTITION,) + TOKEN_USAGE_TRIGGERS:
+    event.listen(TokenUsage.__table__, 'after_create', DDL(_statement).execute_if(dialect='postgresql'))
+
+def token_usage_is_partitioned():
+    """Whether token_usage exists and is a partitioned table"""
+    return bool(db.session.execute(db.text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('token_usage'))"
+    )).scalar())
+
+# Sets each team's counter to this month's usage so far, matching what the
+# add_team_tokens trigger would have accumulated
+TEAM_MONTHLY_TOKENS_BACKFILL = (
+    "UPDATE teams t SET monthly_tokens_used = u.tokens, monthly_tokens_reset_at = date_trunc('month', now()) "
+    "FROM (SELECT team_id, SUM(tokens_consumed) AS tokens FROM token_usage "
+    "WHERE created_at >= date_trunc('month', now()) GROUP BY team_id) u "
+    "WHERE t.id = u.team_id"
+)
+
+def add_team_token_columns():
+    """Add the monthly token counter columns to a teams table created before
+    them (create_all never alters an existing table); returns whether it did"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    existing = {column['name'] for column in inspect(db.engine).get_columns('teams')}
+    if {'monthly_tokens_used', 'monthly_tokens_reset_at'} <= existing:
+        return False
+    db.session.execute(db.text(
+        "ALTER TABLE teams "
+        "ADD COLUMN IF NOT EXISTS monthly_tokens_used BIGINT DEFAULT 0, "
+        "ADD COLUMN IF NOT EXISTS monthly_tokens_reset_at TIMESTAMP WITHOUT TIME ZONE"
+    ))
+    db.session.execute(db.text(TEAM_MONTHLY_TOKENS_BACKFILL))
+    db.session.commit()
+    return True
+
+def migrate_token_usage_to_partitioned():
+    """Convert a token_usage table created before partitioning (create_all never
+    alters an existing table) into the partitioned layout; returns the number
+    of rows copied, or None when there is nothing to convert"""
+    if db.engine.dialect.name != 'postgresql':
+        return None
+    if db.session.execute(db.text("SELECT to_regclass('token_usage')")).scalar() is None:
+        return None
+    if token_usage_is_partitioned():
+        return None
+
+    # Writers block until the swap commits, then insert into the new table
+    db.session.execute(db.text("LOCK TABLE token_usage IN ACCESS EXCLUSIVE MODE"))
+    db.session.execute(db.text("ALTER TABLE token_usage RENAME TO token_usage_legacy"))
+    # Index names are schema-wide, so move the old ones out of the way
+    db.session.execute(db.text(
+        "DO $$ DECLARE r record; BEGIN "
+        "FOR r IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = 'token_usage_legacy'::regclass LOOP "
+        "EXECUTE format('ALTER INDEX %I RENAME TO %I', r.relname, left('legacy_' || r.relname, 63)); "
+        "END LOOP; END $$"
+    ))
+
+    # Plain DDL rather than table.create(), so the after_create triggers are
+    # only added once the rows are copied and the counters aren't re-added
+    table = TokenUsage.__table__
+    db.session.execute(CreateTable(table))
+    for index in table.indexes:
+        db.session.execute(CreateIndex(index))
+    db.session.execute(db.text(TOKEN_USAGE_DEFAULT_PARTITION))
+
+    # Old ids were UUID strings and nothing references them, so rows get new
+    # BIGINT ids in created_at order; created_at is now part of the primary key
+    columns = [column.name for column in table.columns if column.name != 'id']
+    values = ['COALESCE(created_at, now())' if name == 'created_at' else name for name in columns]
+    copied = db.session.execute(db.text(
+        f"INSERT INTO token_usage ({', '.join(columns)}) SELECT {', '.join(values)} "
+        f"FROM token_usage_legacy ORDER BY created_at"
+    )).rowcount
+
+    # The trigger only adds to the counters from here on
+    db.session.execute(db.text(TEAM_MONTHLY_TOKENS_BACKFILL))
+    for statement in TOKEN_USAGE_TRIGGERS:
+        db.session.execute(db.text(statement))
+    db.session.execute(db.text("DROP TABLE token_usage_legacy"))
+    db.session.commit()
+    return copied
+
+# Monthly partitions are created ahead of time by `flask --app app
+# token-usage-partitions` (run it monthly) so recent-window scans prune to the
+# partitions they need instead of reading token_usage_default
+TOKEN_USAGE_PARTITION_MONTHS_AHEAD = int(os.environ.get("TOKEN_USAGE_PARTITION_MONTHS_AHEAD", "3"))
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def ensure_token_usage_partitions(months_ahead=TOKEN_USAGE_PARTITION_MONTHS_AHEAD):
+    """Create token_usage_YYYY_MM partitions through months_ahead, moving any rows
+    for those months out of the default partition first; returns names created"""
+    if db.engine.dialect.name != 'postgresql':
+        return []
+    if not token_usage_is_partitioned():
+        logging.warning("token_usage is not partitioned; run `flask --app app migrate-token-usage` first")
+        return []
+    quote = db.engine.dialect.identifier_preparer.quote
+    # Concurrent runs would otherwise race to create the same tables
+    db.session.execute(db.text("SELECT pg_advisory_xact_lock(hashtext('token_usage_partitions'))"))
+    month = datetime.now().date().replace(day=1)
+    oldest = db.session.execute(db.text(
+        "SELECT date_trunc('month', min(created_at))::date FROM token_usage_default"
+    )).scalar()
+    if oldest and oldest < month:
+        month = oldest
+    last_month = datetime.now().date().replace(day=1)
+    for _ in range(months_ahead):
+        last_month = _next_month(last_month)
+
+    created = []
+    while month <= last_month:
+        name = f"token_usage_{month:%Y_%m}"
+        upper = _next_month(month)
+        if db.session.execute(db.text("SELECT to_regclass(:name)"), {'name': quote(name)}).scalar() is None:
+            # Build the partition detached, move its rows out of the default
+            # partition (no triggers fire, so the counters aren't re-added), then
+            # attach; the driver renders the bounds as quoted date literals
+            db.session.execute(db.text(
+                f"CREATE TABLE {quote(name)} (LIKE token_usage INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            ))
+            db.session.execute(db.text(
+                f"WITH moved AS (DELETE FROM token_usage_default WHERE created_at >= :lower AND created_at < :upper "
+                f"RETURNING *) INSERT INTO {quote(name)} SELECT * FROM moved"
+            ), {'lower': month, 'upper': upper})
+            db.session.execute(db.text(
+                f"ALTER TABLE token_usage ATTACH PARTITION {quote(name)} FOR VALUES FROM (:lower) TO (:upper)"
+            ), {'lower': month, 'upper': upper})
+            created.append(name)
+        month = upper
+    db.session.commit()
+    return created
+
+# Loader option for email lists: only the narrow columns list pages render.
+# Built after every model is declared since load_only() configures the mappers
+EMAIL_LIST_COLUMNS = load_only(
+    Email.id, Email.user_id, Email.team_id, Email.subject, Email.status,
+    Email.ai_model_used, Email.to_addresses, Email.created_at
+)
@@ -0,0 +1,80 @@
+"""
+Prompt assembly for AI email generation.
+
+Static content (assistant instructions plus canonical tone guidance) always
+comes first and is marked as a cacheable block; per-request fields go last so
+providers with prompt caching (Anthropic, OpenAI, OpenRouter) can reuse the
+prefix across requests.
+"""
+from typing import Any, Dict, List, Literal
+
+BASE_SYSTEM_PROMPT = (
+    "You are a professional email assistant. Generate appropriate email replies. "
+    "Format your response with 'Subject:' followed by the subject line, then the email body."
+)
+
+# Canonical tones map to fixed system strings so the cached prefix is shared
+TONE_GUIDANCE = {
+    'professional': "Write in a clear, courteous and businesslike tone.",
+    'friendly': "Write in a warm, approachable tone while staying respectful.",
+    'formal': "Write in a formal tone with complete sentences and no contractions.",
+    'casual': "Write in a relaxed, conversational tone.",
+    'urgent': "Write concisely, lead with the required action and make the time sensitivity clear.",
+}
+DEFAULT_TONE = 'professional'
+
+# Tones accepted by the API schemas; keep in sync with TONE_GUIDANCE
+CanonicalTone = Literal['professional', 'friendly', 'formal', 'casual', 'urgent']
+
+SYSTEM_PROMPTS = {
+    tone: f"{BASE_SYSTEM_PROMPT}\n\nTone: {guidance}"
+    for tone, guidance in TONE_GUIDANCE.items()
+}
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Fully rendered system messages, built once so every request reuses the same
+# objects and sends a byte-identical prefix
+SYSTEM_MESSAGES = {
+    tone: {
+        "role": "system",
+        "content": [{"type": "text", "text": prompt, "cache_control": CACHE_CONTROL}]
+    }
+    for tone, prompt in SYSTEM_PROMPTS.items()
+}
+
+
+def canonical_tone(tone: str) -> str:
+    """Return the canonical tone key, or DEFAULT_TONE for unknown tones"""
+    key = (tone or '').strip().lower()
+    return key if key in SYSTEM_PROMPTS else DEFAULT_TONE
+
+
+def build_email_reply_messages(original_email: str, context: str = "", tone: str = "professional", custom_instructions: str = "") -> List[Dict[str, Any]]:
+    """Chat messages for a reply: cacheable static system block, dynamic user tail"""
+    system_message = SYSTEM_MESSAGES.get(tone)
+    if system_message is not None:
+        prefix = ""
+    else:
+        key = canonical_tone(tone)
+        system_message = SYSTEM_MESSAGES[key]
+        # Free-form tones stay in the dynamic part so the prefix is unchanged
+        prefix = "" if key == (tone or '').strip().lower() else f"Tone: {tone}\n"
+
+    return [
+        system_message,
+        {
+            "role": "user",
+            "content": f"{prefix}Context: {context or ''}\nInstructions: {custom_instructions or ''}\nOriginal email: {original_email}"
+        }
+    ]
+
+
+def cache_read_tokens(usage: Dict[str, Any]) -> int:
+    """Prompt tokens served from the provider's prefix cache, across usage formats"""
+    if not usage:
+        return 0
+    if usage.get('cache_read_input_tokens'):
+        return int(usage['cache_read_input_tokens'])
+    details = usage.get('prompt_tokens_details') or usage.get('input_token_details') or {}
+    return int(details.get('cached_tokens') or details.get('cache_read') or 0)
@@ -0,0 +1,119 @@
+"""
+Pydantic request bodies for the Flask JSON endpoints.
+
+validate_json parses the body once (through the app's orjson provider),
+validates it against a schema and passes the model to the view as `body`.
+Invalid input gets the same {'success': False, 'error': ...} 400 the views
+used to build by hand.
+"""
+from functools import wraps
+from typing import ClassVar, Dict, Literal, Optional
+
+from flask import jsonify, request
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+# Error types that mean "the field was not supplied" rather than "it was wrong"
+_MISSING_ERRORS = frozenset(('missing', 'string_too_short'))
+
+
+class RequestBody(BaseModel):
+    """Base schema: strips strings, ignores unknown keys"""
+    model_config = ConfigDict(str_strip_whitespace=True, extra='ignore')
+
+    # Message for missing/empty required fields ({field} is filled in), and
+    # per-field messages for values that are present but invalid
+    required_message: ClassVar[str] = 'Invalid request body'
+    field_messages: ClassVar[Dict[str, str]] = {}
+
+    @classmethod
+    def error_message(cls, exc: ValidationError) -> str:
+        error = exc.errors()[0]
+        field = str(error['loc'][0]) if error['loc'] else ''
+        if error['type'] in _MISSING_ERRORS:
+            return cls.required_message.format(field=field)
+        return cls.field_messages.get(field, f"{field}: {error['msg']}" if field else error['msg'])
+
+
+class InvitationResponseBody(RequestBody):
+    required_message: ClassVar[str] = 'Invitation ID and response are required'
+    field_messages: ClassVar[Dict[str, str]] = {'response': 'Response must be "accept" or "decline"'}
+
+    invitation_id: str = Field(min_length=1)
+    response: Literal['accept', 'decline']
+
+
+class InvitationIdBody(RequestBody):
+    required_message: ClassVar[str] = 'Invitation ID is required'
+
+    invitation_id: str = Field(min_length=1)
+
+
+class SmtpSettingsBody(RequestBody):
+    required_message: ClassVar[str] = 'All SMTP fields are required'
+    field_messages: ClassVar[Dict[str, str]] = {'smtp_port': 'SMTP port must be a number between 1 and 65535'}
+
+    smtp_server: str = Field(min_length=1)
+    smtp_port: int = Field(gt=0, le=65535)
+    smtp_username: str = Field(min_length=1)
+    smtp_password: str = Field(min_length=1)
+    smtp_use_tls: bool = True
+
+
+class EmailContentBody(RequestBody):
+    required_message: ClassVar[str] = 'Email content is required'
+
+    email_content: str = Field(min_length=1)
+
+
+class TemplateIdBody(RequestBody):
+    required_message: ClassVar[str] = 'Template ID is required'
+
+    template_id: str = Field(min_length=1)
+
+
+class GenerateTemplateBody(RequestBody):
+    required_message: ClassVar[str] = 'Template purpose is required'
+
+    purpose: str = Field(min_length=1)
+    template_type: str = 'professional'
+    tone: str = 'professional'
+    industry: str = ''
+    custom_instructions: str = ''
+
+
+class TokenUsageBody(RequestBody):
+    required_message: ClassVar[str] = '{field} is required'
+    field_messages: ClassVar[Dict[str, str]] = {
+        'tokens_consumed': 'tokens_consumed must be a positive integer',
+        'quality_score': 'quality_score must be between 0 and 10',
+        'user_satisfaction': 'user_satisfaction must be between 1 and 5',
+    }
+
+    team_id: str = Field(min_length=1)
+    ai_model: str = Field(min_length=1, max_length=50)
+    operation_type: str = Field(min_length=1, max_length=30)
+    tokens_consumed: int = Field(gt=0)
+    cost_usd: float = 0.0
+    generation_time_ms: Optional[int] = None
+    quality_score: Optional[float] = Field(default=None, ge=0, le=10)
+    user_satisfaction: Optional[int] = Field(default=None, ge=1, le=5)
+    email_id: Optional[str] = None
+    prompt_length: Optional[int] = None
+    response_length: Optional[int] = None
+
+
+def validate_json(schema):
+    """Validate the JSON body against schema and pass it to the view as `body`"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
+            try:
+                body = schema.model_validate(data)
+            except ValidationError as e:
+                return jsonify({'success': False, 'error': schema.error_message(e)}), 400
+            return view(*args, body=body, **kwargs)
+        return wrapper
+    return decorator
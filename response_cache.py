@@ -0,0 +1,247 @@
+"""
+Response cache for the FastAPI email generation endpoints.
+
+CACHE_MODE selects the lookup strategy:
+    off        - never cache
+    exact      - hit only when the normalized request is identical (default)
+    generative - key on the request skeleton (entities replaced by placeholders)
+                 and re-inject the new request's entities into the cached reply
+    semantic   - generative, plus a nearest-neighbour fallback over hashed
+                 bag-of-words vectors of the skeleton
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+CACHE_MODE = os.environ.get("CACHE_MODE", "exact").lower()
+CACHE_MAXSIZE = int(os.environ.get("CACHE_MAXSIZE", "10000"))
+CACHE_TTL_SECONDS = int(os.environ.get("CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_THRESHOLD = float(os.environ.get("CACHE_SEMANTIC_THRESHOLD", "0.92"))
+
+# Reply fields that carry generated text and may embed request entities
+_TEXT_FIELDS = ('subject', 'body', 'email_reply', 'reply', 'email_response')
+
+_QUOTED_LINE_RE = re.compile(r'^\s*>.*$', re.MULTILINE)
+_REPLY_CHAIN_RE = re.compile(
+    r'(^-{2,}\s*original message\s*-{2,}.*|^on .{0,200}wrote:.*)',
+    re.IGNORECASE | re.MULTILINE | re.DOTALL
+)
+_ENTITY_RE = re.compile(
+    r'(?P<email>[\w.+-]+@[\w-]+\.[\w.-]+)'
+    r'|(?P<url>https?://\S+)'
+    r'|(?P<number>\$?\d[\d,./:-]*\d|\$?\d)'
+)
+_WS_RE = re.compile(r'\s+')
+_TOKEN_RE = re.compile(r'<\w+>|\w+')
+
+_VECTOR_DIM = 512
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries expire after a fixed TTL"""
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def items(self):
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (expires_at, v) in self._data.items() if expires_at >= now]
+
+
+class SkeletonIndex:
+    """Skeleton vectors in one preallocated float32 matrix, searched with a single matmul"""
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._groups = np.zeros(capacity, dtype=np.int64)
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key: str, group: int, vector: np.ndarray):
+        with self._lock:
+            n = len(self._keys)
+            if n == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+                self._groups = np.concatenate([self._groups, np.zeros_like(self._groups)])
+            self._vectors[n] = vector
+            self._groups[n] = group
+            self._keys.append(key)
+
+    def search(self, group: int, vector: np.ndarray, threshold: float) -> Optional[str]:
+        """Key of the most similar vector in the same group, if above threshold"""
+        with self._lock:
+            n = len(self._keys)
+            if not n:
+                return None
+            scores = self._vectors[:n] @ vector
+            scores[self._groups[:n] != group] = -1.0
+            best = int(np.argmax(scores))
+            return self._keys[best] if scores[best] >= threshold else None
+
+    def retain(self, live_keys):
+        """Drop rows whose cache entries have expired or been evicted"""
+        with self._lock:
+            keep = [i for i, key in enumerate(self._keys) if key in live_keys]
+            n = len(keep)
+            self._vectors[:n] = self._vectors[keep]
+            self._groups[:n] = self._groups[keep]
+            self._keys = [self._keys[i] for i in keep]
+
+
+def _strip_reply_chain(text: str) -> str:
+    text = _QUOTED_LINE_RE.sub('', text)
+    return _REPLY_CHAIN_RE.sub('', text)
+
+
+def _normalize(text: Optional[str], lower: bool = True) -> str:
+    text = _WS_RE.sub(' ', _strip_reply_chain(text or '')).strip()
+    return text.lower() if lower else text
+
+
+def _skeleton(text: str) -> Tuple[str, List[str]]:
+    """Replace entities with indexed placeholders; returns (skeleton, entities)"""
+    entities: List[str] = []
+
+    def placeholder(match):
+        value = match.group(0)
+        if value not in entities:
+            entities.append(value)
+        return f"<{match.lastgroup}{entities.index(value)}>"
+
+    return _ENTITY_RE.sub(placeholder, text), entities
+
+
+def _digest(*parts: str) -> str:
+    h = blake2b(digest_size=16)
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\x1f')
+    return h.hexdigest()
+
+
+def _vectorize(skeleton: str) -> np.ndarray:
+    """Hashed bag-of-words vector, L2 normalized"""
+    vec = np.zeros(_VECTOR_DIM, dtype=np.float32)
+    for token in _TOKEN_RE.findall(skeleton):
+        vec[hash(token) % _VECTOR_DIM] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _templatize(text: str, entities: List[str]) -> str:
+    """Turn generated text into a format_map template over the request entities"""
+    template = text.replace('{', '{{').replace('}', '}}')
+    for index in sorted(range(len(entities)), key=lambda i: -len(entities[i])):
+        pattern = r'(?<![\w@/.-])' + re.escape(entities[index]) + r'(?![\w@/-])'
+        template = re.sub(pattern, f'{{e{index}}}', template, flags=re.IGNORECASE)
+    return template
+
+
+class _EntityMap(dict):
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+class ResponseCache:
+    """Exact / skeleton-keyed cache of successful generation results"""
+
+    def __init__(self, mode: str = CACHE_MODE, maxsize: int = CACHE_MAXSIZE, ttl: int = CACHE_TTL_SECONDS):
+        if mode not in ('off', 'exact', 'generative', 'semantic'):
+            logging.warning(f"Unknown CACHE_MODE '{mode}', falling back to 'exact'")
+            mode = 'exact'
+        self.mode = mode
+        self.maxsize = maxsize
+        self._entries = TTLCache(maxsize, ttl)
+        self._index = SkeletonIndex(_VECTOR_DIM) if mode == 'semantic' else None
+
+    def _lookup_key(self, endpoint: str, fields: Dict[str, Any]) -> Tuple[str, str, List[str], str]:
+        params = '|'.join(_normalize(str(fields.get(name) or '')) for name in ('context', 'tone', 'model', 'custom_instructions'))
+        if self.mode == 'exact':
+            original = _normalize(fields.get('original_email'))
+            return _digest(endpoint, original, params), original, [], params
+        # Entities keep their original case so they can be re-injected verbatim
+        skeleton, entities = _skeleton(_normalize(fields.get('original_email'), lower=False))
+        skeleton = skeleton.lower()
+        return _digest(endpoint, skeleton, params), skeleton, entities, params
+
+    def _render(self, entry: Dict[str, Any], entities: List[str]) -> Dict[str, Any]:
+        result = dict(entry['result'])
+        if entry['templates']:
+            mapping = _EntityMap((f"e{i}", value) for i, value in enumerate(entities))
+            for field, template in entry['templates'].items():
+                result[field] = template.format_map(mapping)
+        return result
+
+    @staticmethod
+    def _group(endpoint: str, params: str) -> int:
+        return int(_digest(endpoint, params)[:15], 16)
+
+    def _nearest(self, endpoint: str, params: str, vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        key = self._index.search(self._group(endpoint, params), vector, SEMANTIC_THRESHOLD)
+        return self._entries.get(key) if key is not None else None
+
+    def get_or_generate(self, endpoint: str, fields: Dict[str, Any], generate: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], str]:
+        """Return (result, 'HIT'|'MISS'), calling generate() on a miss"""
+        if self.mode == 'off':
+            return generate(), 'MISS'
+
+        key, skeleton, entities, params = self._lookup_key(endpoint, fields)
+        entry = self._entries.get(key)
+        vector = None
+        if entry is None and self.mode == 'semantic':
+            vector = _vectorize(skeleton)
+            entry = self._nearest(endpoint, params, vector)
+        if entry is not None:
+            return self._render(entry, entities), 'HIT'
+
+        result = generate()
+        if result.get('success') and not result.get('fallback_used'):
+            templates = {}
+            if entities:
+                templates = {
+                    field: _templatize(result[field], entities)
+                    for field in _TEXT_FIELDS if isinstance(result.get(field), str)
+                }
+            self._entries.set(key, {'result': result, 'templates': templates})
+            if self._index is not None:
+                self._index.add(key, self._group(endpoint, params), vector)
+                # Evicted entries leave stale rows behind; compact once they dominate
+                if len(self._index) > 2 * self.maxsize:
+                    self._index.retain({k for k, _ in self._entries.items()})
+        return result, 'MISS'
+
+
+response_cache = ResponseCache()
@@ -1,17 +1,102 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Response, render_template, request, jsonify, redirect, url_for, flash, session, stream_with_context
 from flask_login import current_user
 from app import app, db
 from local_auth import require_login, local_auth
 from models import (User, Team, TeamMember, TeamInvitation, Email, EmailTemplate, EmailAnalytics,
-                   EmailStatus, UserRole, AIModel, EmailTone, TokenUsage, TeamAIInsights, 
-                   TeamCollaborationPattern, SmartEmailSuggestion)
-from ai_service import ai_service
-from email_service import email_service
-import json
+                   EmailStatus, UserRole, AIModel, EmailTone, TokenUsageDaily, TeamAIInsights,
+                   TeamCollaborationPattern, SmartEmailSuggestion, EMAIL_LIST_COLUMNS)
+from ai_service import ai_service, log_token_usage as record_token_usage
+from usage_writer import usage_writer
+from request_schemas import (EmailContentBody, GenerateTemplateBody, InvitationIdBody, InvitationResponseBody,
+                             SmtpSettingsBody, TemplateIdBody, TokenUsageBody, validate_json)
+from cache import (SUGGESTIONS_CACHE_TTL, TEAM_ANALYTICS_CACHE_TTL, TEAM_ROLE_CACHE_TTL, get_redis,
+                   invalidate_smart_suggestions, invalidate_team_analytics, invalidate_team_role,
+                   suggestions_version_key, team_analytics_key, team_role_key)
+from email_service import (ANALYTICS_WINDOW_DAYS, ANALYTICS_WINDOWS, SMTP_PROVIDER_SETTINGS, analytics_window_start,
+                           email_service, invalidate_cached_analytics)
+import hashlib
+import orjson
 import logging
+import os
+import redis
 import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import defaultdict
 from datetime import datetime, timedelta
-import uuid
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import aliased, joinedload, load_only, undefer_group
+
+# Model strings reported by ai_service -> AIModel members
+AI_MODELS_BY_NAME = {model.value: model for model in AIModel}
+
+# Request values -> enum members; unknown values are rejected with a 400
+USER_ROLES_BY_VALUE = {role.value: role for role in UserRole}
+EMAIL_TONES_BY_VALUE = {tone.value: tone for tone in EmailTone}
+
+# Enum members offered in page dropdowns; fixed for the life of the process
+AI_MODEL_CHOICES = tuple(AIModel)
+EMAIL_TONE_CHOICES = tuple(EmailTone)
+USER_ROLE_CHOICES = tuple(UserRole)
+
+# Roles allowed to manage a team's members, invitations and templates
+MANAGER_ROLES = frozenset((UserRole.ADMIN, UserRole.MANAGER))
+
+# to_char() pattern matching isoformat(timespec='seconds'), for timestamps
+# Postgres formats in the SELECT instead of per row in Python
+ISO_SECONDS_FORMAT = 'YYYY-MM-DD"T"HH24:MI:SS'
+
+# Columns serialized by the email detail and draft editor endpoints
+DRAFT_EDIT_COLUMNS = (
+    Email.id, Email.team_id, Email.subject, Email.body_html, Email.body_text,
+    Email.to_addresses, Email.cc_addresses, Email.bcc_addresses, Email.status,
+    Email.ai_model_used, Email.tone_used, Email.created_at, Email.updated_at,
+)
+EMAIL_DETAIL_COLUMNS = (
+    Email.id, Email.subject, Email.body_html, Email.body_text,
+    Email.to_addresses, Email.cc_addresses, Email.bcc_addresses, Email.status,
+    Email.ai_model_used, Email.tone_used, Email.original_email, Email.context,
+    Email.created_at, Email.updated_at, Email.sent_at, Email.delivered_at,
+    Email.opened_at, Email.replied_at, Email.user_rating, Email.generation_time_ms,
+)
+
+# Proxied FastAPI calls share one keep-alive connection pool
+FASTAPI_BASE = os.environ.get("FASTAPI_URL", "http://localhost:8000")
+fastapi_session = requests.Session()
+fastapi_session.mount('http://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=128,
+    max_retries=Retry(total=1, backoff_factor=0.1)
+))
+
+# Bounded read size while relaying upstream bodies; chunk_size=None would read
+# a whole Content-Length body in one go
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Headers that describe the upstream connection or encoding rather than the body
+HOP_BY_HOP_HEADERS = frozenset(('connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'content-length'))
+
+def proxy_to_fastapi(path, timeout=10, error_label='proxy'):
+    """Forward the current request to FastAPI and stream its response back"""
+    try:
+        forward_headers = {name: request.headers[name] for name in ('Content-Type', 'Accept') if name in request.headers}
+        response = fastapi_session.request(
+            request.method,
+            f"{FASTAPI_BASE}{path}",
+            params=request.args,
+            data=request.get_data() or None,
+            headers=forward_headers,
+            timeout=timeout,
+            stream=True
+        )
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+        proxied = Response(response.iter_content(chunk_size=PROXY_CHUNK_SIZE), status=response.status_code, headers=headers)
+        proxied.call_on_close(response.close)
+        return proxied
+    except Exception as e:
+        return jsonify({'error': f'FastAPI {error_label} error: {str(e)}'}), 503
 
 # Make datetime available to all templates
 @app.context_processor
@@ -26,6 +111,12 @@ app.register_blueprint(local_auth)
 def make_session_permanent():
     session.permanent = True
 
+# Refuse oversized bodies from the Content-Length header, before anything is read
+@app.before_request
+def reject_oversized_body():
+    if request.content_length and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        return jsonify({'success': False, 'error': 'Request body too large'}), 413
+
 @app.route('/')
 def index():
     """Landing page - shows different content based on auth status"""
@@ -37,31 +128,32 @@ def index():
 @require_login
 def dashboard():
     """Main dashboard for authenticated users"""
+    user = current_user._get_current_object()
     try:
         # Get user's teams
-        team_memberships = TeamMember.query.filter_by(user_id=current_user.id).all()
+        team_memberships = TeamMember.query.options(joinedload(TeamMember.team)).filter_by(user_id=user.id).all()
         teams = [membership.team for membership in team_memberships]
 
         # Get pending invitations
         pending_invitations = TeamInvitation.query.filter_by(
-            invited_user_id=current_user.id,
+            invited_user_id=user.id,
             status='pending'
         ).all()
 
         # Get recent emails
-        recent_emails = Email.query.filter_by(user_id=current_user.id)\
+        recent_emails = Email.query.options(EMAIL_LIST_COLUMNS)\
+                                 .filter_by(user_id=user.id)\
                                  .order_by(Email.created_at.desc())\
                                  .limit(10).all()
 
         # Get email analytics for the last 30 days
-        start_date = datetime.now() - timedelta(days=30)
-        analytics = email_service.get_email_analytics(
-            user_id=current_user.id,
-            start_date=start_date
+        analytics = email_service.get_cached_user_analytics(
+            user_id=user.id,
+            start_date=analytics_window_start()
         )
 
         return render_template('dashboard.html',
-                             user=current_user,
+                             user=user,
                              teams=teams,
                              pending_invitations=pending_invitations,
                              recent_emails=recent_emails,
@@ -69,24 +161,27 @@ def dashboard():
     except Exception as e:
         logging.error(f"Error loading dashboard: {str(e)}")
         flash('Error loading dashboard', 'error')
-        return render_template('dashboard.html', user=current_user)
+        return render_template('dashboard.html', user=user)
 
 @app.route('/compose')
 @require_login
 def compose():
     """Email composition page"""
+    user = current_user._get_current_object()
     try:
         # Get user's teams and templates
-        team_memberships = TeamMember.query.filter_by(user_id=current_user.id).all()
+        team_memberships = TeamMember.query.options(joinedload(TeamMember.team)).filter_by(user_id=user.id).all()
         teams = [membership.team for membership in team_memberships]
 
         # Get templates (user's own + team templates)
-        user_templates = EmailTemplate.query.filter_by(user_id=current_user.id).all()
+        user_templates = EmailTemplate.query.filter_by(user_id=user.id).all()
+        team_ids = [membership.team_id for membership in team_memberships]
         team_templates = []
-        for team in teams:
-            team_templates.extend(
-                EmailTemplate.query.filter_by(team_id=team.id, is_public=True).all()
-            )
+        if team_ids:
+            team_templates = EmailTemplate.query.filter(
+                EmailTemplate.team_id.in_(team_ids),
+                EmailTemplate.is_public.is_(True)
+            ).all()
 
         all_templates = user_templates + team_templates
 
@@ -95,38 +190,18 @@ def compose():
 
         draft_data = None
         if email_id_param:
-            email = db.session.query(Email).filter_by(
+            email = db.session.query(Email).options(undefer_group('body')).filter_by(
                 id=email_id_param,
-                user_id=current_user.id
+                user_id=user.id
             ).first()
 
             if email:
-                # Parse recipient addresses (handle both JSON objects and JSON strings)
-                def parse_addresses_compose(addr_field):
-                    if not addr_field:
-                        return []
-                    # If it's already a list (new JSON format), return as is
-                    if isinstance(addr_field, list):
-                        return addr_field
-                    # If it's a string (old JSON string format), parse it
-                    if isinstance(addr_field, str):
-                        try:
-                            parsed = json.loads(addr_field)
-                            # Handle double-encoded JSON strings recursively
-                            if isinstance(parsed, str):
-                                try:
-                                    parsed = json.loads(parsed)
-                                except (json.JSONDecodeError, TypeError):
-                                    pass
-                            return parsed if isinstance(parsed, list) else []
-                        except (json.JSONDecodeError, TypeError):
-                            return []
-                    return []
-
-                to_addresses = parse_addresses_compose(email.to_addresses)
-                cc_addresses = parse_addresses_compose(email.cc_addresses)
-                bcc_addresses = parse_addresses_compose(email.bcc_addresses)
+                # AddressList columns always load as lists
+                to_addresses = email.to_addresses or []
+                cc_addresses = email.cc_addresses or []
+                bcc_addresses = email.bcc_addresses or []
 
+                created_at, updated_at = email.created_at, email.updated_at
                 draft_data = {
                     'id': str(email.id),  # Ensure string format
                     'subject': email.subject or '',
@@ -136,19 +211,19 @@ def compose():
                     'cc_addresses': cc_addresses,
                     'bcc_addresses': bcc_addresses,
                     'team_id': email.team_id,
-                    'created_at': email.created_at.isoformat() if email.created_at else None,
-                    'updated_at': email.updated_at.isoformat() if email.updated_at else None,
+                    'created_at': created_at.isoformat(timespec='seconds') if created_at else None,
+                    'updated_at': updated_at.isoformat(timespec='seconds') if updated_at else None,
                     'status': email.status.value if email.status else 'draft',
                     'ai_model_used': email.ai_model_used.value if email.ai_model_used else None,
                     'tone_used': email.tone_used.value if email.tone_used else None
                 }
 
         return render_template('compose.html',
-                             user=current_user,
+                             user=user,
                              teams=teams,
                              templates=all_templates,
-                             ai_models=list(AIModel),
-                             email_tones=list(EmailTone),
+                             ai_models=AI_MODEL_CHOICES,
+                             email_tones=EMAIL_TONE_CHOICES,
                              draft_data=draft_data)
     except Exception as e:
         logging.error(f"Error loading compose page: {str(e)}")
@@ -159,8 +234,11 @@ def compose():
 @require_login
 def generate_reply():
     """API endpoint to generate AI email reply"""
+    user = current_user._get_current_object()
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
 
         original_email = data.get('original_email', '')
         context = data.get('context', '')
@@ -187,15 +265,14 @@ def generate_reply():
             
             # Log token usage for analytics
             try:
-                from ai_service import log_token_usage
                 user_team_id = None
                 
                 # Get user's current team for token tracking
-                if hasattr(current_user, 'teams') and current_user.teams:
-                    user_team_id = current_user.teams[0].id  # Use first team or could be selected team
-                elif hasattr(current_user, 'id'):
+                if hasattr(user, 'teams') and user.teams:
+                    user_team_id = user.teams[0].id  # Use first team or could be selected team
+                elif hasattr(user, 'id'):
                     # Create a personal team record for solo users
-                    user_team_id = f"personal_{current_user.id}"
+                    user_team_id = f"personal_{user.id}"
                 
                 if user_team_id:
                     tokens_used = result.get('tokens_used', 0)
@@ -204,9 +281,9 @@ def generate_reply():
                         total_chars = len(original_email) + len(context) + len(custom_instructions) + len(result.get('reply', ''))
                         tokens_used = max(int(total_chars / 4), 100)  # Minimum 100 tokens
                     
-                    log_token_usage(
+                    record_token_usage(
                         team_id=user_team_id,
-                        user_id=current_user.id,
+                        user_id=user.id,
                         ai_model=result.get('model_used', model),
                         operation_type='email_generation',
                         tokens_consumed=tokens_used,
@@ -231,7 +308,9 @@ def generate_reply():
 def save_draft():
     """Save email draft"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
 
         email_id = data.get('email_id')
         subject = data.get('subject', '')
@@ -247,13 +326,12 @@ def save_draft():
 
         if email_id:
             # Update existing draft
-            email = Email.query.get(email_id)
+            email = db.session.get(Email, email_id)
             if not email or email.user_id != current_user.id:
                 return jsonify({'success': False, 'error': 'Email not found or access denied'}), 404
         else:
             # Create new draft
             email = Email(
-                id=str(uuid.uuid4()),
                 user_id=current_user.id,
                 team_id=team_id,
                 status=EmailStatus.DRAFT
@@ -268,18 +346,12 @@ def save_draft():
         email.cc_addresses = cc_addresses  # Store as JSON object
         email.bcc_addresses = bcc_addresses  # Store as JSON object
         email.team_id = team_id  # Update team_id as well
-        email.updated_at = datetime.now()
 
         # Store AI model and generation time if it was used
         if 'last_ai_model_used' in session:
-            model_string = session['last_ai_model_used']
-            # Convert string to enum value
-            if model_string == 'qwen-4-turbo':
-                email.ai_model_used = AIModel.QWEN_4_TURBO
-            elif model_string == 'claude-4-sonnet':
-                email.ai_model_used = AIModel.CLAUDE_4_SONNET
-            elif model_string == 'gpt-4o':
-                email.ai_model_used = AIModel.GPT_4O
+            ai_model = AI_MODELS_BY_NAME.get(session['last_ai_model_used'])
+            if ai_model:
+                email.ai_model_used = ai_model
 
             # Store generation time if available
             if 'last_generation_time_ms' in session:
@@ -305,46 +377,26 @@ def save_draft():
 def send_email():
     """Send email"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
 
         email_id = data.get('email_id')
         if not email_id:
             return jsonify({'success': False, 'error': 'Email ID is required'}), 400
 
-        email = Email.query.get(email_id)
-        if not email or email.user_id != current_user.id:
+        email = db.session.scalar(
+            select(Email)
+            .where(Email.id == email_id, Email.user_id == current_user.id)
+            .options(load_only(*EMAIL_DETAIL_COLUMNS))
+        )
+        if not email:
             return jsonify({'success': False, 'error': 'Email not found or access denied'}), 404
 
-        # Parse recipient addresses (handle both JSON objects and JSON strings)
-        def parse_addresses(addr_field):
-            if not addr_field:
-                return []
-            # If it's already a list (new JSON format), return as is
-            if isinstance(addr_field, list):
-                return addr_field
-            # If it's a string (old JSON string format), parse it
-            if isinstance(addr_field, str):
-                try:
-                    parsed = json.loads(addr_field)
-                    # Handle double-encoded JSON strings recursively
-                    if isinstance(parsed, str):
-                        try:
-                            parsed = json.loads(parsed)
-                        except (json.JSONDecodeError, TypeError):
-                            pass
-                    return parsed if isinstance(parsed, list) else []
-                except (json.JSONDecodeError, TypeError):
-                    return []
-            return []
-
-        to_addresses = parse_addresses(email.to_addresses)
-        cc_addresses = parse_addresses(email.cc_addresses)
-        bcc_addresses = parse_addresses(email.bcc_addresses)
-        
-        # Debug logging
-        logging.info(f"Parsed addresses - To: {to_addresses} (type: {type(to_addresses)})")
-        logging.info(f"Parsed addresses - CC: {cc_addresses} (type: {type(cc_addresses)})")
-        logging.info(f"Parsed addresses - BCC: {bcc_addresses} (type: {type(bcc_addresses)})")
+        # AddressList columns always load as lists
+        to_addresses = email.to_addresses or []
+        cc_addresses = email.cc_addresses or []
+        bcc_addresses = email.bcc_addresses or []
 
         # Validate required fields
         if not to_addresses or not email.subject:
@@ -378,40 +430,46 @@ def send_email():
 @require_login
 def templates():
     """Email templates management page"""
+    user = current_user._get_current_object()
     try:
         # Get user's teams with error handling
         team_memberships = []
         try:
-            team_memberships = TeamMember.query.filter_by(user_id=current_user.id).all()
+            team_memberships = TeamMember.query.filter_by(user_id=user.id).all()
         except Exception as e:
             logging.warning(f"Error loading team memberships: {str(e)}")
 
-        teams = [membership.team for membership in team_memberships if membership.team]
+        teams = []
+        managed_team_ids = []
+        for membership in team_memberships:
+            if membership.team:
+                teams.append(membership.team)
+            if membership.role in MANAGER_ROLES:
+                managed_team_ids.append(membership.team_id)
 
         # Get user's templates with error handling
         user_templates = []
         try:
-            user_templates = EmailTemplate.query.filter_by(user_id=current_user.id).all()
+            user_templates = EmailTemplate.query.filter_by(user_id=user.id).all()
         except Exception as e:
             logging.warning(f"Error loading user templates: {str(e)}")
 
         # Get team templates (if user is admin/manager) with error handling
         team_templates = []
         try:
-            for membership in team_memberships:
-                if membership.role in [UserRole.ADMIN, UserRole.MANAGER]:
-                    team_templates.extend(
-                        EmailTemplate.query.filter_by(team_id=membership.team_id).all()
-                    )
+            if managed_team_ids:
+                team_templates = EmailTemplate.query.filter(
+                    EmailTemplate.team_id.in_(managed_team_ids)
+                ).all()
         except Exception as e:
             logging.warning(f"Error loading team templates: {str(e)}")
 
         return render_template('templates.html',
-                             user=current_user,
+                             user=user,
                              teams=teams or [],
                              user_templates=user_templates or [],
                              team_templates=team_templates or [],
-                             email_tones=list(EmailTone))
+                             email_tones=EMAIL_TONE_CHOICES)
     except Exception as e:
         logging.error(f"Critical error loading templates: {str(e)}")
         return render_template('500.html'), 500
@@ -421,7 +479,9 @@ def templates():
 def save_template():
     """Save email template"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
 
         template_id = data.get('template_id')
         name = data.get('name', '')
@@ -435,15 +495,18 @@ def save_template():
         if not name or not body_template:
             return jsonify({'success': False, 'error': 'Name and body template are required'}), 400
 
+        tone = EMAIL_TONES_BY_VALUE.get(default_tone) if default_tone else None
+        if default_tone and not tone:
+            return jsonify({'success': False, 'error': 'Invalid default tone'}), 400
+
         if template_id:
             # Update existing template
-            template = EmailTemplate.query.get(template_id)
+            template = db.session.get(EmailTemplate, template_id)
             if not template or template.user_id != current_user.id:
                 return jsonify({'success': False, 'error': 'Template not found or access denied'}), 404
         else:
             # Create new template
             template = EmailTemplate(
-                id=str(uuid.uuid4()),
                 user_id=current_user.id,
                 team_id=team_id
             )
@@ -454,9 +517,8 @@ def save_template():
         template.description = description
         template.subject_template = subject_template
         template.body_template = body_template
-        template.default_tone = EmailTone(default_tone) if default_tone else None
+        template.default_tone = tone
         template.is_public = is_public
-        template.updated_at = datetime.now()
 
         db.session.commit()
 
@@ -474,32 +536,43 @@ def save_template():
 @require_login
 def team():
     """Team management page"""
+    user = current_user._get_current_object()
     try:
         # Get user's teams
-        team_memberships = TeamMember.query.filter_by(user_id=current_user.id).all()
+        team_memberships = TeamMember.query.options(
+            joinedload(TeamMember.team).selectinload(Team.members).joinedload(TeamMember.user)
+        ).filter_by(user_id=user.id).all()
         teams = []
 
+        # Pending invitations for every team the user can manage, in one query
+        managed_team_ids = [
+            membership.team_id for membership in team_memberships
+            if membership.role in MANAGER_ROLES
+        ]
+        invitations_by_team = defaultdict(list)
+        if managed_team_ids:
+            pending = TeamInvitation.query.options(
+                joinedload(TeamInvitation.invited_user)
+            ).filter(
+                TeamInvitation.team_id.in_(managed_team_ids),
+                TeamInvitation.status == 'pending'
+            ).all()
+            for invitation in pending:
+                invitations_by_team[invitation.team_id].append(invitation)
+
         for membership in team_memberships:
-            # Get pending invitations for teams where user can manage
-            pending_invitations = []
-            if membership.role in [UserRole.ADMIN, UserRole.MANAGER]:
-                pending_invitations = TeamInvitation.query.filter_by(
-                    team_id=membership.team_id,
-                    status='pending'
-                ).all()
-            
             team_data = {
                 'team': membership.team,
                 'role': membership.role,
                 'members': membership.team.members,
-                'pending_invitations': pending_invitations
+                'pending_invitations': invitations_by_team.get(membership.team_id, [])
             }
             teams.append(team_data)
 
         return render_template('team.html',
-                             user=current_user,
+                             user=user,
                              teams=teams,
-                             user_roles=list(UserRole))
+                             user_roles=USER_ROLE_CHOICES)
     except Exception as e:
         logging.error(f"Error loading team page: {str(e)}")
         flash('Error loading team page', 'error')
@@ -510,7 +583,9 @@ def team():
 def create_team():
     """Create a new team"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
 
         name = data.get('name', '').strip()
         description = data.get('description', '')
@@ -518,23 +593,14 @@ def create_team():
         if not name:
             return jsonify({'success': False, 'error': 'Team name is required'}), 400
 
-        # Create team
+        # Create team with the creator as admin; ids come back from the INSERTs
         team = Team(
-            id=str(uuid.uuid4()),
             name=name,
-            description=description
+            description=description,
+            members=[TeamMember(user_id=current_user.id, role=UserRole.ADMIN)]
         )
         db.session.add(team)
 
-        # Add creator as admin
-        membership = TeamMember(
-            id=str(uuid.uuid4()),
-            user_id=current_user.id,
-            team_id=team.id,
-            role=UserRole.ADMIN
-        )
-        db.session.add(membership)
-
         db.session.commit()
 
         return jsonify({
@@ -551,8 +617,11 @@ def create_team():
 @require_login
 def invite_member():
     """Send invitation to a team member"""
+    user = current_user._get_current_object()
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         
         team_id = data.get('team_id')
         email = data.get('email', '').strip()
@@ -561,87 +630,56 @@ def invite_member():
         
         if not all([team_id, email]):
             return jsonify({'success': False, 'error': 'Team ID and email are required'}), 400
+
+        invite_role = USER_ROLES_BY_VALUE.get(role)
+        if not invite_role:
+            return jsonify({'success': False, 'error': 'Invalid role'}), 400
         
         # Check if user has permission to invite (must be admin or manager)
-        user_membership = TeamMember.query.filter_by(
-            user_id=current_user.id,
-            team_id=team_id
-        ).first()
-        
-        if not user_membership or user_membership.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        if _team_role(team_id, user.id) not in MANAGER_ROLES:
             return jsonify({'success': False, 'error': 'You do not have permission to invite members'}), 403
         
-        # Check if team exists
-        team = Team.query.get(team_id)
-        if not team:
-            return jsonify({'success': False, 'error': 'Team not found'}), 404
-        
-        # Check if user exists
-        invited_user = User.query.filter_by(email=email).first()
-        if not invited_user:
+        # Look up the user together with any existing membership
+        row = db.session.query(User, TeamMember.id).outerjoin(
+            TeamMember, and_(TeamMember.user_id == User.id, TeamMember.team_id == team_id)
+        ).filter(User.email == email).first()
+        if not row:
             return jsonify({'success': False, 'error': 'User with this email not found. They need to register first.'}), 404
-        
-        # Check if user is already a member
-        existing_membership = TeamMember.query.filter_by(
-            user_id=invited_user.id,
-            team_id=team_id
-        ).first()
+        invited_user, existing_membership = row
         
         if existing_membership:
             return jsonify({'success': False, 'error': 'User is already a member of this team'}), 400
         
-        # Check if invitation already exists (any status)
-        existing_invitation = TeamInvitation.query.filter_by(
-            team_id=team_id,
-            invited_user_id=invited_user.id
-        ).first()
-        
-        if existing_invitation:
-            if existing_invitation.status == 'pending':
-                return jsonify({'success': False, 'error': 'Invitation already sent to this user'}), 400
-            elif existing_invitation.status == 'declined':
-                # Update existing declined invitation to pending
-                existing_invitation.status = 'pending'
-                existing_invitation.invited_by_id = current_user.id
-                existing_invitation.role = UserRole(role)
-                existing_invitation.message = message
-                existing_invitation.created_at = datetime.now()
-                existing_invitation.responded_at = None
-                db.session.commit()
-                return jsonify({
-                    'success': True,
-                    'message': f'Re-invitation sent to {invited_user.first_name or email}'
-                })
-            else:  # accepted status - check if they're still a member
-                # If they're not currently a member, they were removed after accepting
-                if not existing_membership:
-                    # Update existing accepted invitation to pending for re-invitation
-                    existing_invitation.status = 'pending'
-                    existing_invitation.invited_by_id = current_user.id
-                    existing_invitation.role = UserRole(role)
-                    existing_invitation.message = message
-                    existing_invitation.created_at = datetime.now()
-                    existing_invitation.responded_at = None
-                    db.session.commit()
-                    return jsonify({
-                        'success': True,
-                        'message': f'Re-invitation sent to {invited_user.first_name or email}'
-                    })
-                else:
-                    return jsonify({'success': False, 'error': 'User is already a member of this team'}), 400
-        
-        # Create invitation
-        invitation = TeamInvitation(
-            id=str(uuid.uuid4()),
+        # Create the invitation, or reopen a declined/accepted one (the user
+        # was removed after accepting), in one atomic statement; a pending
+        # invitation is left alone and nothing is returned
+        insert_stmt = pg_insert(TeamInvitation).values(
             team_id=team_id,
             invited_user_id=invited_user.id,
-            invited_by_id=current_user.id,
-            role=UserRole(role),
-            message=message
+            invited_by_id=user.id,
+            role=invite_role,
+            message=message,
+            status='pending'
         )
-        db.session.add(invitation)
+        invitation_id = db.session.execute(
+            insert_stmt.on_conflict_do_update(
+                constraint='uq_team_invitation',
+                set_={
+                    'status': 'pending',
+                    'invited_by_id': insert_stmt.excluded.invited_by_id,
+                    'role': insert_stmt.excluded.role,
+                    'message': insert_stmt.excluded.message,
+                    'created_at': db.func.now(),
+                    'responded_at': None
+                },
+                where=TeamInvitation.status != 'pending'
+            ).returning(TeamInvitation.id)
+        ).scalar()
         db.session.commit()
         
+        if invitation_id is None:
+            return jsonify({'success': False, 'error': 'Invitation already sent to this user'}), 400
+        
         return jsonify({
             'success': True,
             'message': f'Invitation sent to {invited_user.first_name or email}'
@@ -651,46 +689,84 @@ def invite_member():
         logging.error(f"Error sending invitation: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _team_role(team_id, user_id):
+    """user_id's role in team_id, or None if not a member; cached in Redis"""
+    r = get_redis()
+    key = team_role_key(team_id, user_id)
+    if r is not None:
+        try:
+            cached = r.get(key)
+        except redis.RedisError as e:
+            logging.warning(f"Team role cache read failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            return USER_ROLES_BY_VALUE.get(cached)
+    role = db.session.execute(
+        select(TeamMember.role).where(TeamMember.team_id == team_id, TeamMember.user_id == user_id)
+    ).scalar()
+    if r is not None:
+        try:
+            r.setex(key, TEAM_ROLE_CACHE_TTL, role.value if role else '')
+        except redis.RedisError as e:
+            logging.warning(f"Team role cache write failed: {str(e)}")
+    return role
+
+def _membership_with_current_role(member_id):
+    """(membership, current user's role in that team) in one query; (None, None) if missing"""
+    current_membership = aliased(TeamMember)
+    row = db.session.query(TeamMember, current_membership.role).outerjoin(
+        current_membership,
+        and_(current_membership.team_id == TeamMember.team_id, current_membership.user_id == current_user.id)
+    ).filter(TeamMember.id == member_id).first()
+    return row if row else (None, None)
+
+def _has_other_admin(team_id, user_id):
+    """Whether the team has an admin besides user_id; stops at the first match"""
+    return db.session.query(
+        TeamMember.query.filter(
+            TeamMember.team_id == team_id,
+            TeamMember.role == UserRole.ADMIN,
+            TeamMember.user_id != user_id
+        ).exists()
+    ).scalar()
+
 @app.route('/api/change-member-role', methods=['POST'])
 @require_login
 def change_member_role():
     """Change a team member's role"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         
         member_id = data.get('member_id')
         new_role = data.get('role')
         
         if not all([member_id, new_role]):
             return jsonify({'success': False, 'error': 'Member ID and role are required'}), 400
+
+        role = USER_ROLES_BY_VALUE.get(new_role)
+        if not role:
+            return jsonify({'success': False, 'error': 'Invalid role'}), 400
         
-        # Get the membership to change
-        membership = TeamMember.query.get(member_id)
+        # Get the membership to change with the current user's role in its team
+        membership, user_role = _membership_with_current_role(member_id)
         if not membership:
             return jsonify({'success': False, 'error': 'Team member not found'}), 404
         
         # Check if current user has permission (must be admin)
-        user_membership = TeamMember.query.filter_by(
-            user_id=current_user.id,
-            team_id=membership.team_id
-        ).first()
-        
-        if not user_membership or user_membership.role != UserRole.ADMIN:
+        if user_role != UserRole.ADMIN:
             return jsonify({'success': False, 'error': 'Only team admins can change member roles'}), 403
         
         # Don't allow changing own role if you're the only admin
-        if membership.user_id == current_user.id:
-            admin_count = TeamMember.query.filter_by(
-                team_id=membership.team_id,
-                role=UserRole.ADMIN
-            ).count()
-            
-            if admin_count == 1 and new_role != 'admin':
+        if membership.user_id == current_user.id and new_role != 'admin':
+            if not _has_other_admin(membership.team_id, current_user.id):
                 return jsonify({'success': False, 'error': 'Cannot change role - you are the only admin'}), 400
         
         # Update role
-        membership.role = UserRole(new_role)
+        membership.role = role
         db.session.commit()
+        invalidate_team_role(membership.team_id, membership.user_id)
         
         return jsonify({
             'success': True,
@@ -706,39 +782,32 @@ def change_member_role():
 def remove_member():
     """Remove a team member"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         member_id = data.get('member_id')
         
         if not member_id:
             return jsonify({'success': False, 'error': 'Member ID is required'}), 400
         
-        # Get the membership to remove
-        membership = TeamMember.query.get(member_id)
+        # Get the membership to remove with the current user's role in its team
+        membership, user_role = _membership_with_current_role(member_id)
         if not membership:
             return jsonify({'success': False, 'error': 'Team member not found'}), 404
         
         # Check if current user has permission (must be admin)
-        user_membership = TeamMember.query.filter_by(
-            user_id=current_user.id,
-            team_id=membership.team_id
-        ).first()
-        
-        if not user_membership or user_membership.role != UserRole.ADMIN:
+        if user_role != UserRole.ADMIN:
             return jsonify({'success': False, 'error': 'Only team admins can remove members'}), 403
         
         # Don't allow removing yourself if you're the only admin
         if membership.user_id == current_user.id:
-            admin_count = TeamMember.query.filter_by(
-                team_id=membership.team_id,
-                role=UserRole.ADMIN
-            ).count()
-            
-            if admin_count == 1:
+            if not _has_other_admin(membership.team_id, current_user.id):
                 return jsonify({'success': False, 'error': 'Cannot remove yourself - you are the only admin'}), 400
         
         # Remove membership
         db.session.delete(membership)
         db.session.commit()
+        invalidate_team_role(membership.team_id, membership.user_id)
         
         return jsonify({
             'success': True,
@@ -754,7 +823,9 @@ def remove_member():
 def leave_team():
     """Allow a user to leave a team"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         team_id = data.get('team_id')
         
         if not team_id:
@@ -771,12 +842,7 @@ def leave_team():
         
         # Check if user is the only admin
         if membership.role == UserRole.ADMIN:
-            admin_count = TeamMember.query.filter_by(
-                team_id=team_id,
-                role=UserRole.ADMIN
-            ).count()
-            
-            if admin_count == 1:
+            if not _has_other_admin(team_id, current_user.id):
                 return jsonify({
                     'success': False, 
                     'error': 'You cannot leave the team as you are the only admin. Please assign another admin first or delete the team.'
@@ -785,6 +851,7 @@ def leave_team():
         # Remove membership
         db.session.delete(membership)
         db.session.commit()
+        invalidate_team_role(membership.team_id, membership.user_id)
         
         return jsonify({
             'success': True,
@@ -800,31 +867,36 @@ def leave_team():
 def get_invitations():
     """Get pending invitations for current user"""
     try:
-        # Get pending invitations
-        invitations = TeamInvitation.query.filter_by(
-            invited_user_id=current_user.id,
-            status='pending'
+        # Read-only listing: select just the columns it needs, team and
+        # inviter joined in, without building ORM instances
+        rows = db.session.execute(
+            select(
+                TeamInvitation.id, TeamInvitation.role, TeamInvitation.message, TeamInvitation.created_at,
+                Team.id.label('team_id'), Team.name.label('team_name'), Team.description.label('team_description'),
+                User.first_name.label('inviter_first_name'), User.email.label('inviter_email')
+            )
+            .join(Team, Team.id == TeamInvitation.team_id)
+            .join(User, User.id == TeamInvitation.invited_by_id)
+            .where(TeamInvitation.invited_user_id == current_user.id, TeamInvitation.status == 'pending')
         ).all()
         
-        invitation_data = []
-        for invitation in invitations:
-            invitation_data.append({
-                'id': invitation.id,
-                'team': {
-                    'id': invitation.team.id,
-                    'name': invitation.team.name,
-                    'description': invitation.team.description
-                },
-                'invited_by': {
-                    'name': invitation.invited_by.first_name or invitation.invited_by.email.split('@')[0],
-                    'email': invitation.invited_by.email
-                },
-                'role': invitation.role.value,
-                'message': invitation.message,
-                'created_at': invitation.created_at.isoformat()
-            })
-        
-        return jsonify({
+        invitation_data = [{
+            'id': row.id,
+            'team': {
+                'id': row.team_id,
+                'name': row.team_name,
+                'description': row.team_description
+            },
+            'invited_by': {
+                'name': row.inviter_first_name or row.inviter_email.split('@')[0],
+                'email': row.inviter_email
+            },
+            'role': row.role,
+            'message': row.message,
+            'created_at': row.created_at
+        } for row in rows]
+        
+        return app.json.iso_response({
             'success': True,
             'invitations': invitation_data
         })
@@ -835,62 +907,54 @@ def get_invitations():
 
 @app.route('/api/respond-invitation', methods=['POST'])
 @require_login
-def respond_invitation():
+@validate_json(InvitationResponseBody)
+def respond_invitation(body):
     """Accept or decline team invitation"""
     try:
-        data = request.get_json()
-        
-        invitation_id = data.get('invitation_id')
-        response = data.get('response')  # 'accept' or 'decline'
-        
-        if not all([invitation_id, response]):
-            return jsonify({'success': False, 'error': 'Invitation ID and response are required'}), 400
-        
-        if response not in ['accept', 'decline']:
-            return jsonify({'success': False, 'error': 'Response must be "accept" or "decline"'}), 400
-        
-        # Get the invitation
-        invitation = TeamInvitation.query.get(invitation_id)
-        if not invitation:
-            return jsonify({'success': False, 'error': 'Invitation not found'}), 404
-        
-        # Check if invitation belongs to current user
-        if invitation.invited_user_id != current_user.id:
-            return jsonify({'success': False, 'error': 'This invitation does not belong to you'}), 403
+        invitation_id = body.invitation_id
+        response = body.response
+        
+        # Claim the invitation atomically: only a pending invitation addressed
+        # to the current user is updated, so concurrent responses can't both win
+        claimed = db.session.execute(
+            update(TeamInvitation)
+            .where(
+                TeamInvitation.id == invitation_id,
+                TeamInvitation.invited_user_id == current_user.id,
+                TeamInvitation.status == 'pending',
+                TeamInvitation.team_id == Team.id
+            )
+            .values(status='accepted' if response == 'accept' else 'declined', responded_at=db.func.now())
+            .returning(TeamInvitation.team_id, TeamInvitation.role, Team.name)
+            .execution_options(synchronize_session=False)
+        ).first()
         
-        # Check if invitation is still pending
-        if invitation.status != 'pending':
+        if claimed is None:
+            invitation = db.session.get(TeamInvitation, invitation_id)
+            if not invitation:
+                return jsonify({'success': False, 'error': 'Invitation not found'}), 404
+            if invitation.invited_user_id != current_user.id:
+                return jsonify({'success': False, 'error': 'This invitation does not belong to you'}), 403
             return jsonify({'success': False, 'error': 'This invitation has already been responded to'}), 400
         
-        # Update invitation status
-        invitation.status = 'accepted' if response == 'accept' else 'declined'
-        invitation.responded_at = datetime.now()
-        
-        message = ''
-        
         if response == 'accept':
-            # Check if user is already a member (race condition protection)
-            existing_membership = TeamMember.query.filter_by(
-                user_id=current_user.id,
-                team_id=invitation.team_id
+            # uq_user_team makes an existing membership a no-op instead of a duplicate
+            joined = db.session.execute(
+                pg_insert(TeamMember)
+                .values(user_id=current_user.id, team_id=claimed.team_id, role=claimed.role)
+                .on_conflict_do_nothing(constraint='uq_user_team')
+                .returning(TeamMember.id)
             ).first()
-            
-            if not existing_membership:
-                # Create team membership
-                membership = TeamMember(
-                    id=str(uuid.uuid4()),
-                    user_id=current_user.id,
-                    team_id=invitation.team_id,
-                    role=invitation.role
-                )
-                db.session.add(membership)
-                message = f'Successfully joined {invitation.team.name}'
+            if joined:
+                message = f'Successfully joined {claimed.name}'
             else:
-                message = f'You are already a member of {invitation.team.name}'
+                message = f'You are already a member of {claimed.name}'
         else:
-            message = f'Declined invitation to {invitation.team.name}'
+            message = f'Declined invitation to {claimed.name}'
         
         db.session.commit()
+        if response == 'accept':
+            invalidate_team_role(claimed.team_id, current_user.id)
         
         return jsonify({
             'success': True,
@@ -903,36 +967,44 @@ def respond_invitation():
 
 @app.route('/api/cancel-invitation', methods=['DELETE'])
 @require_login
-def cancel_invitation():
+@validate_json(InvitationIdBody)
+def cancel_invitation(body):
     """Cancel a pending invitation"""
     try:
-        data = request.get_json()
-        invitation_id = data.get('invitation_id')
-        
-        if not invitation_id:
-            return jsonify({'success': False, 'error': 'Invitation ID is required'}), 400
-        
-        # Get the invitation
-        invitation = TeamInvitation.query.get(invitation_id)
-        if not invitation:
-            return jsonify({'success': False, 'error': 'Invitation not found'}), 404
-        
-        # Check if current user has permission (must be admin/manager of the team or the person who sent the invitation)
-        user_membership = TeamMember.query.filter_by(
-            user_id=current_user.id,
-            team_id=invitation.team_id
+        invitation_id = body.invitation_id
+        
+        # Delete in one statement when the invitation is pending and the user
+        # sent it or manages its team
+        manages_team = select(TeamMember.id).where(
+            TeamMember.team_id == TeamInvitation.team_id,
+            TeamMember.user_id == current_user.id,
+            TeamMember.role.in_(list(MANAGER_ROLES))
+        ).exists()
+        cancelled = db.session.execute(
+            delete(TeamInvitation)
+            .where(
+                TeamInvitation.id == invitation_id,
+                TeamInvitation.status == 'pending',
+                or_(TeamInvitation.invited_by_id == current_user.id, manages_team)
+            )
+            .returning(TeamInvitation.id)
+            .execution_options(synchronize_session=False)
         ).first()
         
-        if not (invitation.invited_by_id == current_user.id or 
-                (user_membership and user_membership.role in [UserRole.ADMIN, UserRole.MANAGER])):
-            return jsonify({'success': False, 'error': 'You do not have permission to cancel this invitation'}), 403
-        
-        # Check if invitation is still pending
-        if invitation.status != 'pending':
+        if cancelled is None:
+            # Work out why, reading the invitation and the user's team role together
+            row = db.session.query(
+                TeamInvitation.invited_by_id, TeamInvitation.status, TeamMember.role
+            ).outerjoin(
+                TeamMember,
+                and_(TeamMember.team_id == TeamInvitation.team_id, TeamMember.user_id == current_user.id)
+            ).filter(TeamInvitation.id == invitation_id).one_or_none()
+            if row is None:
+                return jsonify({'success': False, 'error': 'Invitation not found'}), 404
+            if not (row.invited_by_id == current_user.id or row.role in MANAGER_ROLES):
+                return jsonify({'success': False, 'error': 'You do not have permission to cancel this invitation'}), 403
             return jsonify({'success': False, 'error': 'Can only cancel pending invitations'}), 400
         
-        # Delete the invitation
-        db.session.delete(invitation)
         db.session.commit()
         
         return jsonify({
@@ -949,45 +1021,100 @@ def cancel_invitation():
 @app.route('/analytics')
 @require_login
 def analytics():
-    """Analytics dashboard"""
+    """Analytics dashboard; the aggregates are fetched by the page from /api/analytics"""
     try:
-        # Get user's teams for filtering
-        team_memberships = TeamMember.query.filter_by(user_id=current_user.id).all()
+        # The page only shows team names and gates on role, so load just those
+        team_memberships = TeamMember.query.options(
+            load_only(TeamMember.team_id, TeamMember.role),
+            joinedload(TeamMember.team).load_only(Team.id, Team.name)
+        ).filter_by(user_id=current_user.id).all()
         teams = [membership.team for membership in team_memberships]
-
-        # Get analytics for last 30 days
-        start_date = datetime.now() - timedelta(days=30)
-
-        # User analytics
-        user_analytics = email_service.get_email_analytics(
-            user_id=current_user.id,
-            start_date=start_date
-        )
-
-        # Team analytics (if user has access)
-        team_analytics = []
-        for membership in team_memberships:
-            if membership.role in [UserRole.ADMIN, UserRole.MANAGER]:
-                team_data = email_service.get_email_analytics(
-                    team_id=membership.team_id,
-                    start_date=start_date
-                )
-                if team_data['success']:
-                    team_analytics.append({
-                        'team': membership.team,
-                        'analytics': team_data['analytics']
-                    })
+        managed_teams = [membership.team for membership in team_memberships if membership.role in MANAGER_ROLES]
 
         return render_template('analytics.html',
                              user=current_user,
                              teams=teams,
-                             user_analytics=user_analytics.get('analytics', {}),
-                             team_analytics=team_analytics)
+                             managed_teams=managed_teams,
+                             analytics_windows=ANALYTICS_WINDOWS,
+                             default_window=ANALYTICS_WINDOW_DAYS)
     except Exception as e:
         logging.error(f"Error loading analytics: {str(e)}")
         flash('Error loading analytics', 'error')
         return redirect(url_for('dashboard'))
 
+def _analytics_start_date():
+    """Window start for the ?days= parameter, or None if it is not an offered range"""
+    days = request.args.get('days', ANALYTICS_WINDOW_DAYS, type=int)
+    return analytics_window_start(days) if days in ANALYTICS_WINDOWS else None
+
+@app.route('/api/analytics')
+@require_login
+def get_analytics():
+    """Cached analytics for the current user, or for one team they manage (?team_id=)"""
+    try:
+        start_date = _analytics_start_date()
+        if start_date is None:
+            return jsonify({'success': False, 'error': 'Invalid date range'}), 400
+
+        team_id = request.args.get('team_id')
+        if not team_id:
+            return jsonify(email_service.get_cached_user_analytics(user_id=current_user.id, start_date=start_date))
+
+        if _team_role(team_id, current_user.id) not in MANAGER_ROLES:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+        result = email_service.get_cached_team_analytics(team_ids=[team_id], start_date=start_date)
+        if not result['success']:
+            return jsonify(result), 500
+        return jsonify({'success': True, 'analytics': result['analytics'][team_id]})
+
+    except Exception as e:
+        logging.error(f"Error getting analytics: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/analytics/teams')
+@require_login
+def get_managed_team_analytics():
+    """Cached analytics and member counts for every team the user manages"""
+    try:
+        start_date = _analytics_start_date()
+        if start_date is None:
+            return jsonify({'success': False, 'error': 'Invalid date range'}), 400
+
+        team_ids = db.session.scalars(
+            select(TeamMember.team_id).where(
+                TeamMember.user_id == current_user.id,
+                TeamMember.role.in_(MANAGER_ROLES)
+            )
+        ).all()
+        if not team_ids:
+            return jsonify({'success': True, 'teams': {}})
+
+        result = email_service.get_cached_team_analytics(team_ids=team_ids, start_date=start_date)
+        if not result['success']:
+            return jsonify(result), 500
+
+        # Member counts in one grouped query rather than loading each member list
+        member_counts = dict(db.session.execute(
+            select(TeamMember.team_id, db.func.count())
+            .where(TeamMember.team_id.in_(team_ids))
+            .group_by(TeamMember.team_id)
+        ).all())
+
+        return jsonify({
+            'success': True,
+            'teams': {
+                team_id: {
+                    'analytics': result['analytics'][team_id],
+                    'member_count': member_counts.get(team_id, 0)
+                } for team_id in team_ids
+            }
+        })
+
+    except Exception as e:
+        logging.error(f"Error getting team analytics: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/docs')
 def api_docs():
     """Show comprehensive API documentation with FastAPI integration"""
@@ -1004,23 +1131,58 @@ def test_summarize_email():
     """Public endpoint to test email summarization without authentication"""
     return _summarize_email_internal()
 
-def _summarize_email_internal():
+# Summaries of identical content are reused across users for a day; very large
+# bodies are rare repeats and are not worth the Redis memory
+SUMMARY_CACHE_TTL = 86400
+SUMMARY_CACHE_MAX_CHARS = 32 * 1024
+
+def _summary_cache_key(email_content):
+    return f"summary:{hashlib.sha256(email_content.encode('utf-8')).hexdigest()}:auto"
+
+def _get_cached_summary(key):
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        cached = r.get(key)
+    except redis.RedisError as e:
+        logging.warning(f"Summary cache read failed: {str(e)}")
+        return None
+    return orjson.loads(cached) if cached else None
+
+def _set_cached_summary(key, summary, model_used):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(key, SUMMARY_CACHE_TTL, orjson.dumps({'summary': summary, 'model_used': model_used}))
+    except redis.RedisError as e:
+        logging.warning(f"Summary cache write failed: {str(e)}")
+
+@validate_json(EmailContentBody)
+def _summarize_email_internal(body):
     """Summarize email content using LangChain with best available AI model"""
     try:
-        data = request.get_json()
-        email_content = data.get('email_content', '').strip()
-        
-        if not email_content:
-            return jsonify({'success': False, 'error': 'Email content is required'}), 400
+        email_content = body.email_content
         
         if len(email_content) < 10:
             return jsonify({'success': False, 'error': 'Email content too short to summarize'}), 400
         
-        # Use AI service to summarize the email with LangChain
-        from ai_service import ai_service
-        
-        # Generate summary using the AI service with best available model
         start_time = time.time()
+        cache_key = _summary_cache_key(email_content) if len(email_content) <= SUMMARY_CACHE_MAX_CHARS else None
+        cached = _get_cached_summary(cache_key) if cache_key else None
+        if cached:
+            return jsonify({
+                'success': True,
+                'summary': cached['summary'],
+                'model_used': cached['model_used'],
+                'processing_time_ms': round((time.time() - start_time) * 1000),
+                'original_length': len(email_content),
+                'summary_length': len(cached['summary']),
+                'cached': True
+            })
+
+        # Generate summary using the AI service with best available model
         # Handle user_id for both authenticated and test endpoints
         user_id = current_user.id if hasattr(current_user, 'id') and current_user.id else "test_user"
         
@@ -1036,10 +1198,12 @@ def _summarize_email_internal():
         if summary_response.get('success'):
             summary_content = summary_response.get('content', '').strip()
             model_used = summary_response.get('model_used', 'AI')
+            # Text-processing fallbacks are cheap and should not mask a recovered model
+            if cache_key and model_used != 'fallback-text-processing':
+                _set_cached_summary(cache_key, summary_content, model_used)
             
             # Log token usage for summarization
             try:
-                from ai_service import log_token_usage
                 user_team_id = None
                 
                 # Get user's current team for token tracking
@@ -1056,7 +1220,7 @@ def _summarize_email_internal():
                         # Estimate tokens for summarization
                         tokens_used = max(int(len(email_content) / 4 + len(summary_content) / 4), 50)
                     
-                    log_token_usage(
+                    record_token_usage(
                         team_id=user_team_id,
                         user_id=user_id,
                         ai_model=model_used,
@@ -1094,11 +1258,10 @@ def _summarize_email_internal():
 def api_docs_alt():
     """Serve FastAPI documentation through Flask proxy"""
     try:
-        import requests
-        response = requests.get('http://localhost:8000/docs', timeout=10)
+        response = fastapi_session.get(f'{FASTAPI_BASE}/docs', timeout=10)
         if response.status_code == 200:
-            # Replace localhost:8000 with the current host for proper API calls
-            content = response.text.replace('http://localhost:8000', '/fastapi-proxy')
+            # Replace the FastAPI origin with the proxy path for proper API calls
+            content = response.text.replace(FASTAPI_BASE, '/fastapi-proxy')
             return content, 200, {'Content-Type': 'text/html'}
         else:
             return jsonify({'error': 'FastAPI docs not available', 'status': response.status_code}), 503
@@ -1113,159 +1276,73 @@ def fastapi_docs_direct():
 @app.route('/fastapi-proxy/<path:path>')
 def fastapi_proxy(path):
     """Proxy requests to FastAPI service"""
-    try:
-        import requests
-        url = f'http://localhost:8000/{path}'
-
-        if request.method == 'GET':
-            response = requests.get(url, params=request.args, timeout=10)
-        elif request.method == 'POST':
-            response = requests.post(url, json=request.get_json(), timeout=10)
-        else:
-            response = requests.request(request.method, url, timeout=10)
-
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI proxy error: {str(e)}'}), 503
+    return proxy_to_fastapi(f'/{path}')
 
 @app.route('/openapi.json')
 def openapi_json():
     """Proxy OpenAPI JSON from FastAPI service"""
-    try:
-        import requests
-        response = requests.get('http://localhost:8000/openapi.json', timeout=10)
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI OpenAPI error: {str(e)}'}), 503
+    return proxy_to_fastapi('/openapi.json', error_label='OpenAPI')
 
 # FastAPI endpoint proxies
 @app.route('/api/v1/models')
 def get_models():
     """Proxy to FastAPI models endpoint"""
-    try:
-        import requests
-        response = requests.get('http://localhost:8000/api/v1/models', timeout=10)
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI models error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/models', error_label='models')
 
 @app.route('/api/v1/generate-email', methods=['POST'])
 def generate_email():
     """Proxy to FastAPI email generation endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/generate-email',
-            json=request.get_json(),
-            timeout=30
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI generate-email error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/generate-email', timeout=30, error_label='generate-email')
 
 @app.route('/api/v1/analyze-email', methods=['POST'])
 def analyze_email():
     """Proxy to FastAPI email analysis endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/analyze-email',
-            json=request.get_json(),
-            timeout=30
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI analyze-email error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/analyze-email', timeout=30, error_label='analyze-email')
 
 @app.route('/api/v1/bulk-generate', methods=['POST'])
 def bulk_generate():
     """Proxy to FastAPI bulk generation endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/bulk-generate',
-            json=request.get_json(),
-            timeout=60
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI bulk-generate error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/bulk-generate', timeout=60, error_label='bulk-generate')
+
+@app.route('/api/v1/bulk-generate/batches', methods=['POST'])
+def submit_bulk_batch():
+    """Proxy to FastAPI batch submission endpoint"""
+    return proxy_to_fastapi('/api/v1/bulk-generate/batches', timeout=30, error_label='bulk-generate batch')
+
+@app.route('/api/v1/bulk-generate/batches/<batch_id>')
+def get_bulk_batch(batch_id):
+    """Proxy to FastAPI batch status endpoint"""
+    return proxy_to_fastapi(f'/api/v1/bulk-generate/batches/{batch_id}', timeout=30, error_label='bulk-generate batch')
 
 @app.route('/api/v1/health')
 def health_check():
     """Proxy to FastAPI health check endpoint"""
-    try:
-        import requests
-        response = requests.get('http://localhost:8000/api/v1/health', timeout=10)
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI health error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/health', error_label='health')
 
 @app.route('/api/v1/generate-template', methods=['POST'])
 def generate_template_fastapi():
     """Proxy to FastAPI template generation endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/generate-template',
-            json=request.get_json(),
-            timeout=30
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI generate-template error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/generate-template', timeout=30, error_label='generate-template')
 
 @app.route('/api/v1/langchain-query', methods=['POST'])
 def langchain_query():
     """Proxy to FastAPI LangChain agent query endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/langchain-query',
-            json=request.get_json(),
-            timeout=60
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI langchain-query error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/langchain-query', timeout=60, error_label='langchain-query')
 
 @app.route('/api/v1/enhanced-generate', methods=['POST'])
 def enhanced_generate():
     """Proxy to FastAPI enhanced email generation endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/enhanced-generate',
-            json=request.get_json(),
-            timeout=60
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI enhanced-generate error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/enhanced-generate', timeout=60, error_label='enhanced-generate')
 
 @app.route('/api/v1/enhanced-analyze', methods=['POST'])
 def enhanced_analyze():
     """Proxy to FastAPI enhanced email analysis endpoint"""
-    try:
-        import requests
-        response = requests.post(
-            'http://localhost:8000/api/v1/enhanced-analyze',
-            json=request.get_json(),
-            timeout=60
-        )
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI enhanced-analyze error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/enhanced-analyze', timeout=60, error_label='enhanced-analyze')
 
 @app.route('/api/v1/langchain-status')
 def langchain_status():
     """Proxy to FastAPI LangChain status endpoint"""
-    try:
-        import requests
-        response = requests.get('http://localhost:8000/api/v1/langchain-status', timeout=10)
-        return response.content, response.status_code, dict(response.headers)
-    except Exception as e:
-        return jsonify({'error': f'FastAPI langchain-status error: {str(e)}'}), 503
+    return proxy_to_fastapi('/api/v1/langchain-status', error_label='langchain-status')
 
 @app.route('/fastapi')
 def fastapi_root():
@@ -1276,8 +1353,7 @@ def fastapi_root():
 def api_status():
     """Get status of both Flask and FastAPI services"""
     try:
-        import requests
-        fastapi_status = requests.get('http://localhost:8000/api/v1/health', timeout=5)
+        fastapi_status = fastapi_session.get(f'{FASTAPI_BASE}/api/v1/health', timeout=5)
         fastapi_data = fastapi_status.json() if fastapi_status.status_code == 200 else {"status": "error"}
     except Exception as e:
         fastapi_data = {"status": "error", "error": str(e)}
@@ -1309,19 +1385,11 @@ def api_status():
 def settings():
     """User settings page"""
     try:
-        # Get common SMTP providers for dropdown
-        smtp_providers = {
-            'gmail': email_service.get_common_smtp_settings('gmail'),
-            'outlook': email_service.get_common_smtp_settings('outlook'),
-            'yahoo': email_service.get_common_smtp_settings('yahoo'),
-            'custom': email_service.get_common_smtp_settings('custom')
-        }
-
         return render_template('settings.html',
                              user=current_user,
-                             smtp_providers=smtp_providers,
-                             ai_models=list(AIModel),
-                             email_tones=list(EmailTone))
+                             smtp_providers=SMTP_PROVIDER_SETTINGS,
+                             ai_models=AI_MODEL_CHOICES,
+                             email_tones=EMAIL_TONE_CHOICES)
     except Exception as e:
         logging.error(f"Error loading settings: {str(e)}")
         flash('Error loading settings', 'error')
@@ -1329,24 +1397,20 @@ def settings():
 
 @app.route('/api/update-smtp-settings', methods=['POST'])
 @require_login
-def update_smtp_settings():
+@validate_json(SmtpSettingsBody)
+def update_smtp_settings(body):
     """Update user's SMTP settings"""
     try:
-        data = request.get_json()
-
-        smtp_server = data.get('smtp_server', '').strip()
-        smtp_port = data.get('smtp_port')
-        smtp_username = data.get('smtp_username', '').strip()
-        smtp_password = data.get('smtp_password', '').strip()
-        smtp_use_tls = data.get('smtp_use_tls', True)
-
-        if not all([smtp_server, smtp_port, smtp_username, smtp_password]):
-            return jsonify({'success': False, 'error': 'All SMTP fields are required'}), 400
+        smtp_server = body.smtp_server
+        smtp_port = body.smtp_port
+        smtp_username = body.smtp_username
+        smtp_password = body.smtp_password
+        smtp_use_tls = body.smtp_use_tls
 
         # Test connection first
         test_result = email_service.test_smtp_connection(
             smtp_server=smtp_server,
-            smtp_port=int(smtp_port),
+            smtp_port=smtp_port,
             smtp_username=smtp_username,
             smtp_password=smtp_password,
             use_tls=smtp_use_tls
@@ -1357,9 +1421,9 @@ def update_smtp_settings():
 
         # Update user settings
         current_user.smtp_server = smtp_server
-        current_user.smtp_port = int(smtp_port)
+        current_user.smtp_port = smtp_port
         current_user.smtp_username = smtp_username
-        current_user.smtp_password = smtp_password  # Note: Should encrypt this in production
+        current_user.set_smtp_password(smtp_password)
         current_user.smtp_use_tls = smtp_use_tls
 
         db.session.commit()
@@ -1375,24 +1439,20 @@ def update_smtp_settings():
 
 @app.route('/api/test-smtp-connection', methods=['POST'])
 @require_login
-def test_smtp_connection():
+@validate_json(SmtpSettingsBody)
+def test_smtp_connection(body):
     """Test SMTP connection with provided settings"""
     try:
-        data = request.get_json()
-
-        smtp_server = data.get('smtp_server', '').strip()
-        smtp_port = data.get('smtp_port')
-        smtp_username = data.get('smtp_username', '').strip()
-        smtp_password = data.get('smtp_password', '').strip()
-        smtp_use_tls = data.get('smtp_use_tls', True)
-
-        if not all([smtp_server, smtp_port, smtp_username, smtp_password]):
-            return jsonify({'success': False, 'error': 'All SMTP fields are required'}), 400
+        smtp_server = body.smtp_server
+        smtp_port = body.smtp_port
+        smtp_username = body.smtp_username
+        smtp_password = body.smtp_password
+        smtp_use_tls = body.smtp_use_tls
 
         # Test connection
         result = email_service.test_smtp_connection(
             smtp_server=smtp_server,
-            smtp_port=int(smtp_port),
+            smtp_port=smtp_port,
             smtp_username=smtp_username,
             smtp_password=smtp_password,
             use_tls=smtp_use_tls
@@ -1406,21 +1466,17 @@ def test_smtp_connection():
 
 @app.route('/api/analyze-sentiment', methods=['POST'])
 @require_login
-def analyze_sentiment():
+@validate_json(EmailContentBody)
+def analyze_sentiment(body):
     """Analyze email sentiment using AI"""
     try:
-        data = request.get_json()
-        email_content = data.get('email_content', '')
-
-        if not email_content:
-            return jsonify({'success': False, 'error': 'Email content is required'}), 400
+        email_content = body.email_content
 
         result = ai_service.analyze_email_with_langchain(email_content)
         
         # Log token usage for sentiment analysis
         if result.get('success'):
             try:
-                from ai_service import log_token_usage
                 user_team_id = None
                 
                 # Get user's current team for token tracking
@@ -1434,7 +1490,7 @@ def analyze_sentiment():
                     if tokens_used == 0:
                         tokens_used = max(int(len(email_content) / 4), 30)  # Minimum 30 tokens
                     
-                    log_token_usage(
+                    record_token_usage(
                         team_id=user_team_id,
                         user_id=current_user.id,
                         ai_model=result.get('model_used', 'claude-4-sonnet'),
@@ -1458,21 +1514,17 @@ def analyze_sentiment():
 
 @app.route('/api/suggest-improvements', methods=['POST'])
 @require_login
-def suggest_improvements():
+@validate_json(EmailContentBody)
+def suggest_improvements(body):
     """Get AI suggestions for email improvements"""
     try:
-        data = request.get_json()
-        email_content = data.get('email_content', '')
-
-        if not email_content:
-            return jsonify({'success': False, 'error': 'Email content is required'}), 400
+        email_content = body.email_content
 
         result = ai_service.suggest_email_improvements(email_content)
         
         # Log token usage for email suggestions
         if result.get('success'):
             try:
-                from ai_service import log_token_usage
                 user_team_id = None
                 
                 # Get user's current team for token tracking
@@ -1488,7 +1540,7 @@ def suggest_improvements():
                         suggestions_count = len(result.get('suggestions', []))
                         tokens_used = max(int(len(email_content) / 4 + suggestions_count * 20), 80)
                     
-                    log_token_usage(
+                    record_token_usage(
                         team_id=user_team_id,
                         user_id=current_user.id,
                         ai_model=result.get('model_used', 'qwen-4-turbo'),
@@ -1510,13 +1562,64 @@ def suggest_improvements():
         logging.error(f"Error getting suggestions: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/analyze-and-suggest', methods=['POST'])
+@require_login
+@validate_json(EmailContentBody)
+def analyze_and_suggest(body):
+    """Sentiment analysis and improvement suggestions from one AI call"""
+    try:
+        email_content = body.email_content
+
+        result = ai_service.analyze_and_suggest_improvements(email_content)
+
+        # One LLM round-trip, so one token usage record
+        if result.get('success') and result.get('model_used') != 'fallback':
+            try:
+                user_team_id = None
+
+                # Get user's current team for token tracking
+                if hasattr(current_user, 'teams') and current_user.teams:
+                    user_team_id = current_user.teams[0].id
+                elif hasattr(current_user, 'id'):
+                    user_team_id = f"personal_{current_user.id}"
+
+                if user_team_id:
+                    improvements = result.get('improvements', {})
+                    tokens_used = max(int(len(email_content) / 4 + len(improvements.get('suggestions', [])) * 20), 100)
+
+                    record_token_usage(
+                        team_id=user_team_id,
+                        user_id=current_user.id,
+                        ai_model=result['model_used'],
+                        operation_type='analysis_and_suggestions',
+                        tokens_consumed=tokens_used,
+                        cost_usd=tokens_used * 0.00002,
+                        generation_time_ms=improvements.get('analysis_metrics', {}).get('total_analysis_time_ms', 1500),
+                        quality_score=8.0,
+                        prompt_length=len(email_content),
+                        response_length=len(str(improvements.get('suggestions', [])))
+                    )
+                    logging.info(f"Token usage logged: {tokens_used} tokens for analysis and suggestions")
+            except Exception as e:
+                logging.warning(f"Failed to log token usage for analysis and suggestions: {str(e)}")
+
+        return jsonify(result)
+
+    except Exception as e:
+        logging.error(f"Error analyzing and suggesting: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/get-email/<email_id>')
 @require_login
 def get_email(email_id):
     """Get email details by ID"""
     try:
-        email = Email.query.get(email_id)
-        if not email or email.user_id != current_user.id:
+        email = db.session.scalar(
+            select(Email)
+            .where(Email.id == email_id, Email.user_id == current_user.id)
+            .options(load_only(*EMAIL_DETAIL_COLUMNS))
+        )
+        if not email:
             return jsonify({'success': False, 'error': 'Email not found or access denied'}), 404
 
         email_data = {
@@ -1527,22 +1630,22 @@ def get_email(email_id):
             'to_addresses': email.to_addresses or [],
             'cc_addresses': email.cc_addresses or [],
             'bcc_addresses': email.bcc_addresses or [],
-            'status': email.status.value if email.status else 'unknown',
-            'ai_model_used': email.ai_model_used.value if email.ai_model_used else None,
-            'tone_used': email.tone_used.value if email.tone_used else None,
+            'status': email.status or 'unknown',
+            'ai_model_used': email.ai_model_used,
+            'tone_used': email.tone_used,
             'original_email': email.original_email,
             'context': email.context,
-            'created_at': email.created_at.isoformat() if email.created_at else None,
-            'updated_at': email.updated_at.isoformat() if email.updated_at else None,
-            'sent_at': email.sent_at.isoformat() if email.sent_at else None,
-            'delivered_at': email.delivered_at.isoformat() if email.delivered_at else None,
-            'opened_at': email.opened_at.isoformat() if email.opened_at else None,
-            'replied_at': email.replied_at.isoformat() if email.replied_at else None,
+            'created_at': email.created_at,
+            'updated_at': email.updated_at,
+            'sent_at': email.sent_at,
+            'delivered_at': email.delivered_at,
+            'opened_at': email.opened_at,
+            'replied_at': email.replied_at,
             'user_rating': email.user_rating,
             'generation_time_ms': email.generation_time_ms
         }
 
-        return jsonify({
+        return app.json.iso_response({
             'success': True,
             'email': email_data
         })
@@ -1556,8 +1659,12 @@ def get_email(email_id):
 def load_draft(email_id):
     """Load draft content for editing"""
     try:
-        email = Email.query.get(email_id)
-        if not email or email.user_id != current_user.id:
+        email = db.session.scalar(
+            select(Email)
+            .where(Email.id == email_id, Email.user_id == current_user.id)
+            .options(load_only(*DRAFT_EDIT_COLUMNS))
+        )
+        if not email:
             return jsonify({'success': False, 'error': 'Draft not found or access denied'}), 404
 
         draft_data = {
@@ -1569,14 +1676,14 @@ def load_draft(email_id):
             'cc_addresses': email.cc_addresses or [],
             'bcc_addresses': email.bcc_addresses or [],
             'team_id': email.team_id,
-            'status': email.status.value if email.status else 'draft',
-            'ai_model_used': email.ai_model_used.value if email.ai_model_used else None,
-            'tone_used': email.tone_used.value if email.tone_used else None,
-            'created_at': email.created_at.isoformat() if email.created_at else None,
-            'updated_at': email.updated_at.isoformat() if email.updated_at else None
+            'status': email.status or 'draft',
+            'ai_model_used': email.ai_model_used,
+            'tone_used': email.tone_used,
+            'created_at': email.created_at,
+            'updated_at': email.updated_at
         }
 
-        return jsonify({
+        return app.json.iso_response({
             'success': True,
             'draft': draft_data
         })
@@ -1587,22 +1694,21 @@ def load_draft(email_id):
 
 @app.route('/api/delete-template', methods=['DELETE'])
 @require_login
-def delete_template():
+@validate_json(TemplateIdBody)
+def delete_template(body):
     """Delete email template"""
     try:
-        data = request.get_json()
-        template_id = data.get('template_id')
+        template_id = body.template_id
 
-        if not template_id:
-            return jsonify({'success': False, 'error': 'Template ID is required'}), 400
+        deleted = db.session.execute(
+            delete(EmailTemplate)
+            .where(EmailTemplate.id == template_id, EmailTemplate.user_id == current_user.id)
+        ).rowcount
+        db.session.commit()
 
-        template = EmailTemplate.query.get(template_id)
-        if not template or template.user_id != current_user.id:
+        if not deleted:
             return jsonify({'success': False, 'error': 'Template not found or access denied'}), 404
 
-        db.session.delete(template)
-        db.session.commit()
-
         return jsonify({
             'success': True,
             'message': 'Template deleted successfully'
@@ -1614,19 +1720,15 @@ def delete_template():
 
 @app.route('/api/generate-template', methods=['POST'])
 @require_login
-def generate_template():
+@validate_json(GenerateTemplateBody)
+def generate_template(body):
     """Generate email template using AI"""
     try:
-        data = request.get_json()
-
-        template_type = data.get('template_type', 'professional')
-        purpose = data.get('purpose', '')
-        tone = data.get('tone', 'professional')
-        industry = data.get('industry', '')
-        custom_instructions = data.get('custom_instructions', '')
-
-        if not purpose:
-            return jsonify({'success': False, 'error': 'Template purpose is required'}), 400
+        template_type = body.template_type
+        purpose = body.purpose
+        tone = body.tone
+        industry = body.industry
+        custom_instructions = body.custom_instructions
 
         result = ai_service.generate_email_template(
             template_type=template_type,
@@ -1639,7 +1741,6 @@ def generate_template():
         # Log token usage for template generation
         if result.get('success'):
             try:
-                from ai_service import log_token_usage
                 user_team_id = None
                 
                 # Get user's current team for token tracking
@@ -1656,7 +1757,7 @@ def generate_template():
                         prompt_length = len(purpose) + len(custom_instructions)
                         tokens_used = max(int((template_length + prompt_length) / 4), 150)
                     
-                    log_token_usage(
+                    record_token_usage(
                         team_id=user_team_id,
                         user_id=current_user.id,
                         ai_model=result.get('model_used', 'qwen-4-turbo'),
@@ -1687,15 +1788,29 @@ def generate_template():
 def delete_draft(email_id):
     """Delete email draft"""
     try:
-        email = Email.query.get(email_id)
-        if not email or email.user_id != current_user.id:
-            return jsonify({'success': False, 'error': 'Draft not found or access denied'}), 404
+        deleted = db.session.execute(
+            delete(Email)
+            .where(Email.id == email_id,
+                   Email.user_id == current_user.id,
+                   Email.status == EmailStatus.DRAFT)
+            .returning(Email.team_id)
+        ).first()
 
-        if email.status != EmailStatus.DRAFT:
+        if deleted is None:
+            db.session.rollback()
+            status = db.session.scalar(
+                select(Email.status).where(Email.id == email_id, Email.user_id == current_user.id)
+            )
+            if status is None:
+                return jsonify({'success': False, 'error': 'Draft not found or access denied'}), 404
             return jsonify({'success': False, 'error': 'Only drafts can be deleted'}), 400
 
-        db.session.delete(email)
         db.session.commit()
+        # Bulk deletes skip the flush listener, so drop the cached aggregates here
+        owners = {('user', current_user.id)}
+        if deleted.team_id:
+            owners.add(('team', deleted.team_id))
+        invalidate_cached_analytics(owners)
 
         return jsonify({
             'success': True,
@@ -1710,113 +1825,252 @@ def delete_draft(email_id):
 # TEAM ANALYTICS AND TOKEN MANAGEMENT APIs
 # ============================================================================
 
+def _json_object(fields):
+    """json_build_object over a {key: expression} dict"""
+    return db.func.json_build_object(*[arg for key, value in fields.items() for arg in (key, value)])
+
+# Payload sections in output order; the object sections are a single row each,
+# the rest are arrays
+ANALYTICS_SECTIONS = ('team_totals', 'member_page', 'member_usage', 'model_usage', 'insights', 'collaboration_patterns')
+ANALYTICS_OBJECT_SECTIONS = frozenset(('team_totals', 'member_page'))
+
+# member_usage is paginated by tokens used, ?top= members per page
+MEMBER_PAGE_DEFAULT = 50
+MEMBER_PAGE_MAX = 500
+
+def _analytics_section(name, item, *order_by):
+    """One section's rows as (section, position, item JSON text) for the analytics UNION"""
+    return select(
+        db.literal(ANALYTICS_SECTIONS.index(name)).label('section'),
+        db.func.row_number().over(order_by=order_by or None).label('position'),
+        db.cast(item, db.Text).label('item')
+    )
+
+def _analytics_chunks(days, rows):
+    """Yield the analytics JSON object piece by piece from section-ordered
+    (section, position, item) tuples"""
+    yield f'{{"period_days": {days}'
+    rows = iter(rows)
+    row = next(rows, None)
+    for index, name in enumerate(ANALYTICS_SECTIONS):
+        is_array = name not in ANALYTICS_OBJECT_SECTIONS
+        opening = f', "{name}": ' + ('[' if is_array else '')
+        items = 0
+        while row is not None and row[0] == index:
+            yield opening + (',' if items else '') + row[2]
+            opening = ''
+            items += 1
+            row = next(rows, None)
+        yield opening + (']' if is_array else ('' if items else 'null'))
+    yield '}'
+
+def _rounded(value, places):
+    return db.func.round(db.cast(db.func.coalesce(value, 0), db.Numeric), places)
+
+def _get_cached_team_analytics(team_id, variant):
+    """Cached /api/team-analytics JSON text, or None when missing or past stale_at"""
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        cached = r.hget(team_analytics_key(team_id), variant)
+    except redis.RedisError as e:
+        logging.warning(f"Team analytics cache read failed: {str(e)}")
+        return None
+    if not cached:
+        return None
+    entry = orjson.loads(cached)
+    # The hash expires as a whole, so each field carries its own deadline
+    return entry['body'] if entry['stale_at'] > time.time() else None
+
+def _set_cached_team_analytics(team_id, variant, body):
+    r = get_redis()
+    if r is None:
+        return
+    now = time.time()
+    entry = {'generated_at': now, 'stale_at': now + TEAM_ANALYTICS_CACHE_TTL, 'body': body}
+    try:
+        pipe = r.pipeline()
+        pipe.hset(team_analytics_key(team_id), variant, orjson.dumps(entry))
+        pipe.expire(team_analytics_key(team_id), TEAM_ANALYTICS_CACHE_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Team analytics cache write failed: {str(e)}")
+
+def _team_analytics_response(analytics):
+    """Wrap pre-serialized analytics JSON text in the usual success envelope"""
+    return Response(f'{{"success": true, "analytics": {analytics}}}', mimetype='application/json')
+
 @app.route('/api/team-analytics/<team_id>')
 @require_login
 def get_team_analytics(team_id):
     """Get comprehensive team analytics including token usage and AI insights"""
     try:
         # Verify user has access to team
-        team_member = TeamMember.query.filter_by(
-            team_id=team_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not team_member:
+        if _team_role(team_id, current_user.id) is None:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
-            
+        
         # Get date range (last 30 days by default)
         days = request.args.get('days', 30, type=int)
+        top = min(max(request.args.get('top', MEMBER_PAGE_DEFAULT, type=int), 1), MEMBER_PAGE_MAX)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        variant = f"{days}:{top}:{offset}"
+
+        # Dashboards poll this endpoint; serve repeats from a short-lived cache
+        cached = _get_cached_team_analytics(team_id, variant)
+        if cached is not None:
+            return _team_analytics_response(cached)
+
         start_date = datetime.now() - timedelta(days=days)
         
-        # Get token usage by member
-        token_usage = db.session.query(
-            TokenUsage.user_id,
+        # One Core statement returns every section as rows of JSON text that
+        # Postgres built, streamed out as plain tuples without re-encoding
+        start_day = start_date.date()
+        member_usage = select(
+            TokenUsageDaily.user_id,
             User.first_name,
             User.email,
-            db.func.sum(TokenUsage.tokens_consumed).label('total_tokens'),
-            db.func.sum(TokenUsage.cost_usd).label('total_cost'),
-            db.func.count(TokenUsage.id).label('operations_count'),
-            db.func.avg(TokenUsage.quality_score).label('avg_quality'),
-            db.func.avg(TokenUsage.user_satisfaction).label('avg_satisfaction')
-        ).join(User).filter(
-            TokenUsage.team_id == team_id,
-            TokenUsage.created_at >= start_date
-        ).group_by(TokenUsage.user_id, User.first_name, User.email).all()
-        
-        # Get model usage statistics
-        model_usage = db.session.query(
-            TokenUsage.ai_model,
-            db.func.sum(TokenUsage.tokens_consumed).label('total_tokens'),
-            db.func.count(TokenUsage.id).label('usage_count'),
-            db.func.avg(TokenUsage.generation_time_ms).label('avg_time')
-        ).filter(
-            TokenUsage.team_id == team_id,
-            TokenUsage.created_at >= start_date
-        ).group_by(TokenUsage.ai_model).all()
-        
-        # Get team insights
-        team_insights = TeamAIInsights.query.filter_by(team_id=team_id).filter(
+            db.cast(db.func.sum(TokenUsageDaily.tokens_sum), db.BigInteger).label('total_tokens'),
+            db.func.sum(TokenUsageDaily.cost_sum).label('total_cost'),
+            db.cast(db.func.sum(TokenUsageDaily.ops_count), db.BigInteger).label('operations_count'),
+            (db.func.sum(TokenUsageDaily.quality_sum)
+             / db.func.nullif(db.func.sum(TokenUsageDaily.quality_n), 0)).label('avg_quality'),
+            (db.cast(db.func.sum(TokenUsageDaily.satisfaction_sum), db.Float)
+             / db.func.nullif(db.func.sum(TokenUsageDaily.satisfaction_n), 0)).label('avg_satisfaction'),
+            db.func.grouping(TokenUsageDaily.user_id).label('is_team_total')
+        ).join(User, User.id == TokenUsageDaily.user_id).where(
+            TokenUsageDaily.team_id == team_id,
+            TokenUsageDaily.day >= start_day
+        ).group_by(db.func.grouping_sets(
+            # The empty grouping set adds the team-wide total row in the same pass
+            db.tuple_(TokenUsageDaily.user_id, User.first_name, User.email),
+            db.tuple_()
+        )).cte('member_usage')
+
+        model_usage = select(
+            TokenUsageDaily.ai_model,
+            db.cast(db.func.sum(TokenUsageDaily.tokens_sum), db.BigInteger).label('total_tokens'),
+            db.cast(db.func.sum(TokenUsageDaily.ops_count), db.BigInteger).label('usage_count'),
+            (db.cast(db.func.sum(TokenUsageDaily.gen_time_sum), db.Float)
+             / db.func.nullif(db.func.sum(TokenUsageDaily.gen_time_n), 0)).label('avg_time')
+        ).where(
+            TokenUsageDaily.team_id == team_id,
+            TokenUsageDaily.day >= start_day
+        ).group_by(TokenUsageDaily.ai_model).subquery()
+
+        insights = select(
+            TeamAIInsights.id,
+            TeamAIInsights.insight_type,
+            TeamAIInsights.insight_title,
+            TeamAIInsights.insight_description,
+            TeamAIInsights.recommendation,
+            TeamAIInsights.confidence_score,
+            TeamAIInsights.priority_level,
+            TeamAIInsights.is_acknowledged,
+            db.func.to_char(TeamAIInsights.generated_at, ISO_SECONDS_FORMAT).label('generated_at')
+        ).where(
+            TeamAIInsights.team_id == team_id,
             db.or_(
                 TeamAIInsights.expires_at.is_(None),
                 TeamAIInsights.expires_at > datetime.now()
             )
-        ).order_by(TeamAIInsights.priority_level.desc()).limit(10).all()
-        
-        # Get collaboration patterns
-        collaboration_patterns = TeamCollaborationPattern.query.filter_by(
-            team_id=team_id
-        ).order_by(TeamCollaborationPattern.frequency_score.desc()).limit(5).all()
-        
-        # Calculate team totals
-        team_total_tokens = sum(usage.total_tokens or 0 for usage in token_usage)
-        team_total_cost = sum(usage.total_cost or 0 for usage in token_usage)
-        
-        return jsonify({
-            'success': True,
-            'analytics': {
-                'period_days': days,
-                'team_totals': {
-                    'total_tokens': team_total_tokens,
-                    'total_cost': round(team_total_cost, 4),
-                    'total_operations': sum(usage.operations_count or 0 for usage in token_usage)
-                },
-                'member_usage': [{
-                    'user_id': usage.user_id,
-                    'name': usage.first_name or usage.email.split('@')[0],
-                    'email': usage.email,
-                    'total_tokens': usage.total_tokens or 0,
-                    'total_cost': round(usage.total_cost or 0, 4),
-                    'operations_count': usage.operations_count or 0,
-                    'avg_quality': round(usage.avg_quality or 0, 2),
-                    'avg_satisfaction': round(usage.avg_satisfaction or 0, 2)
-                } for usage in token_usage],
-                'model_usage': [{
-                    'model': usage.ai_model,
-                    'total_tokens': usage.total_tokens or 0,
-                    'usage_count': usage.usage_count or 0,
-                    'avg_time_ms': round(usage.avg_time or 0, 1)
-                } for usage in model_usage],
-                'insights': [{
-                    'id': insight.id,
-                    'type': insight.insight_type,
-                    'title': insight.insight_title,
-                    'description': insight.insight_description,
-                    'recommendation': insight.recommendation,
-                    'confidence': insight.confidence_score,
-                    'priority': insight.priority_level,
-                    'is_acknowledged': insight.is_acknowledged,
-                    'generated_at': insight.generated_at.isoformat()
-                } for insight in team_insights],
-                'collaboration_patterns': [{
-                    'name': pattern.pattern_name,
-                    'description': pattern.pattern_description,
-                    'frequency': pattern.frequency_score,
-                    'coaching_tip': pattern.ai_coaching_tip,
-                    'improvement_potential': pattern.improvement_potential,
-                    'quality': pattern.collaboration_quality
-                } for pattern in collaboration_patterns]
-            }
-        })
+        ).order_by(TeamAIInsights.priority_level.desc()).limit(10).subquery()
+
+        patterns = select(
+            TeamCollaborationPattern.pattern_name,
+            TeamCollaborationPattern.pattern_description,
+            TeamCollaborationPattern.frequency_score,
+            TeamCollaborationPattern.ai_coaching_tip,
+            TeamCollaborationPattern.improvement_potential,
+            TeamCollaborationPattern.collaboration_quality
+        ).where(
+            TeamCollaborationPattern.team_id == team_id
+        ).order_by(TeamCollaborationPattern.frequency_score.desc()).limit(5).subquery()
+
+        # Same rule as Team.tokens_used_this_month(): the counter only counts
+        # once it has been reset in the current month
+        month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month_tokens = db.case(
+            (Team.monthly_tokens_reset_at >= month_start, db.func.coalesce(Team.monthly_tokens_used, 0)),
+            else_=0
+        )
+
+        m, u, i, p = member_usage.c, model_usage.c, insights.c, patterns.c
+        # Uncorrelated, so Postgres evaluates it once as a one-time filter: a
+        # team with no usage in the window never scans the rollup for models
+        has_usage = select(m.operations_count).where(m.is_team_total == 1).scalar_subquery() > 0
+        sections = db.union_all(
+            _analytics_section('team_totals', _json_object({
+                'total_tokens': db.func.coalesce(m.total_tokens, 0),
+                'total_cost': _rounded(m.total_cost, 4),
+                'total_operations': db.func.coalesce(m.operations_count, 0),
+                'monthly_tokens_used': select(month_tokens).where(Team.id == team_id).scalar_subquery(),
+                'monthly_token_limit': select(Team.monthly_token_limit).where(Team.id == team_id).scalar_subquery()
+            })).where(m.is_team_total == 1),
+            _analytics_section('member_page', _json_object({
+                'offset': offset,
+                'limit': top,
+                'total': db.func.count(),
+                'has_more': db.func.count() > offset + top
+            })).select_from(member_usage).where(m.is_team_total == 0),
+            _analytics_section('member_usage', _json_object({
+                'user_id': m.user_id,
+                'name': db.func.coalesce(db.func.nullif(m.first_name, ''), db.func.split_part(m.email, '@', 1)),
+                'email': m.email,
+                'total_tokens': db.func.coalesce(m.total_tokens, 0),
+                'total_cost': _rounded(m.total_cost, 4),
+                'operations_count': db.func.coalesce(m.operations_count, 0),
+                'avg_quality': _rounded(m.avg_quality, 2),
+                'avg_satisfaction': _rounded(m.avg_satisfaction, 2)
+            }), m.total_tokens.desc().nulls_last(), m.user_id).where(m.is_team_total == 0)
+            .order_by(m.total_tokens.desc().nulls_last(), m.user_id).limit(top).offset(offset),
+            _analytics_section('model_usage', _json_object({
+                'model': u.ai_model,
+                'total_tokens': db.func.coalesce(u.total_tokens, 0),
+                'usage_count': db.func.coalesce(u.usage_count, 0),
+                'avg_time_ms': _rounded(u.avg_time, 1)
+            }), u.total_tokens.desc()).where(has_usage),
+            _analytics_section('insights', _json_object({
+                'id': i.id,
+                'type': i.insight_type,
+                'title': i.insight_title,
+                'description': i.insight_description,
+                'recommendation': i.recommendation,
+                'confidence': i.confidence_score,
+                'priority': i.priority_level,
+                'is_acknowledged': i.is_acknowledged,
+                'generated_at': i.generated_at
+            }), i.priority_level.desc()),
+            _analytics_section('collaboration_patterns', _json_object({
+                'name': p.pattern_name,
+                'description': p.pattern_description,
+                'frequency': p.frequency_score,
+                'coaching_tip': p.ai_coaching_tip,
+                'improvement_potential': p.improvement_potential,
+                'quality': p.collaboration_quality
+            }), p.frequency_score.desc())
+        )
+        stmt = sections.order_by(sections.selected_columns.section, sections.selected_columns.position)
+
+        def generate():
+            yield '{"success": true, "analytics": '
+            parts = []
+            try:
+                # Server-side cursor on its own connection, so it outlives the
+                # request session teardown while the body is still streaming
+                with db.engine.connect() as conn:
+                    rows = conn.execution_options(stream_results=True, yield_per=100).execute(stmt).tuples()
+                    for chunk in _analytics_chunks(days, rows):
+                        parts.append(chunk)
+                        yield chunk
+            except Exception as e:
+                # Headers are already sent; all that is left is to log it
+                logging.error(f"Error streaming team analytics: {str(e)}")
+                raise
+            yield '}'
+            _set_cached_team_analytics(team_id, variant, ''.join(parts))
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
         
     except Exception as e:
         logging.error(f"Error getting team analytics: {str(e)}")
@@ -1827,7 +2081,9 @@ def get_team_analytics(team_id):
 def update_token_limit():
     """Update team token limit (admin/manager only)"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         team_id = data.get('team_id')
         new_limit = data.get('token_limit')
         
@@ -1835,12 +2091,7 @@ def update_token_limit():
             return jsonify({'success': False, 'error': 'Team ID and token limit required'}), 400
             
         # Verify user has admin/manager access
-        team_member = TeamMember.query.filter_by(
-            team_id=team_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not team_member or team_member.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        if _team_role(team_id, current_user.id) not in MANAGER_ROLES:
             return jsonify({'success': False, 'error': 'Admin or Manager access required'}), 403
             
         # Validate new limit
@@ -1852,13 +2103,14 @@ def update_token_limit():
             return jsonify({'success': False, 'error': 'Invalid token limit value'}), 400
             
         # Update team limit
-        team = Team.query.get(team_id)
+        team = db.session.get(Team, team_id)
         if not team:
             return jsonify({'success': False, 'error': 'Team not found'}), 404
             
         old_limit = team.monthly_token_limit
         team.monthly_token_limit = new_limit
         db.session.commit()
+        invalidate_team_analytics(team_id)
         
         # Log the change
         logging.info(f"Token limit updated for team {team_id} by user {current_user.id}: {old_limit} -> {new_limit}")
@@ -1876,114 +2128,185 @@ def update_token_limit():
 
 @app.route('/api/log-token-usage', methods=['POST'])
 @require_login  
-def log_token_usage():
+@validate_json(TokenUsageBody)
+def log_token_usage(body):
     """Log token usage for analytics (called by AI service)"""
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['team_id', 'ai_model', 'operation_type', 'tokens_consumed']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'success': False, 'error': f'{field} is required'}), 400
-        
-        # Create token usage record
-        token_usage = TokenUsage(
-            user_id=current_user.id,
-            team_id=data['team_id'],
-            ai_model=data['ai_model'],
-            operation_type=data['operation_type'],
-            tokens_consumed=data['tokens_consumed'],
-            cost_usd=data.get('cost_usd', 0.0),
-            generation_time_ms=data.get('generation_time_ms'),
-            quality_score=data.get('quality_score'),
-            user_satisfaction=data.get('user_satisfaction'),
-            email_id=data.get('email_id'),
-            prompt_length=data.get('prompt_length'),
-            response_length=data.get('response_length')
-        )
+        if _team_role(body.team_id, current_user.id) is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
         
-        db.session.add(token_usage)
-        db.session.commit()
+        # Written by the background batch writer; the caller doesn't wait on the commit
+        usage_writer.submit({'user_id': current_user.id, **body.model_dump()})
         
-        return jsonify({'success': True, 'usage_id': token_usage.id})
+        return jsonify({'success': True, 'queued': True})
         
     except Exception as e:
         logging.error(f"Error logging token usage: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# One insights generation per team per lock period; clicks inside it get the
+# last generation's response instead of starting another AI run
+INSIGHTS_LOCK_TTL = 60
+INSIGHTS_RESULT_TTL = 600
+
+def _claim_insights_generation(team_id):
+    """True if this request may generate insights for team_id now"""
+    r = get_redis()
+    if r is None:
+        return True
+    try:
+        return bool(r.set(f"gen_insights_lock:{team_id}", '1', nx=True, ex=INSIGHTS_LOCK_TTL))
+    except redis.RedisError as e:
+        logging.warning(f"Insights lock failed: {str(e)}")
+        return True
+
+def _release_insights_generation(team_id):
+    """Let a failed generation be retried straight away"""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.delete(f"gen_insights_lock:{team_id}")
+    except redis.RedisError as e:
+        logging.warning(f"Insights lock release failed: {str(e)}")
+
+def _last_insights_result(team_id):
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        return r.get(f"last_insights:{team_id}")
+    except redis.RedisError as e:
+        logging.warning(f"Insights result read failed: {str(e)}")
+        return None
+
+def _set_last_insights_result(team_id, result):
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(f"last_insights:{team_id}", INSIGHTS_RESULT_TTL, orjson.dumps(result))
+    except redis.RedisError as e:
+        logging.warning(f"Insights result write failed: {str(e)}")
+
 @app.route('/api/generate-team-insights', methods=['POST'])
 @require_login
 def generate_team_insights():
     """Generate AI insights for team performance"""
+    claimed = False
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid JSON body'}), 400
         team_id = data.get('team_id')
         
         if not team_id:
             return jsonify({'success': False, 'error': 'Team ID required'}), 400
             
         # Verify access
-        team_member = TeamMember.query.filter_by(
-            team_id=team_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not team_member or team_member.role not in [UserRole.ADMIN, UserRole.MANAGER]:
+        if _team_role(team_id, current_user.id) not in MANAGER_ROLES:
             return jsonify({'success': False, 'error': 'Admin or Manager access required'}), 403
             
+        claimed = _claim_insights_generation(team_id)
+        if not claimed:
+            last_result = _last_insights_result(team_id)
+            if last_result:
+                return Response(last_result, mimetype='application/json')
+            return jsonify({'success': False, 'error': 'Insights are already being generated for this team'}), 429
+        
         # Generate insights using AI service
         insights_result = ai_service.generate_team_insights(team_id)
         
         if insights_result.get('success'):
-            # Store insights in database
-            for insight_data in insights_result.get('insights', []):
-                insight = TeamAIInsights(
-                    team_id=team_id,
-                    insight_type=insight_data['type'],
-                    insight_title=insight_data['title'],
-                    insight_description=insight_data['description'],
-                    recommendation=insight_data.get('recommendation'),
-                    confidence_score=insight_data.get('confidence', 0.0),
-                    priority_level=insight_data.get('priority', 'medium'),
-                    data_points_analyzed=insight_data.get('data_points', 0),
-                    expires_at=datetime.now() + timedelta(days=7)  # Insights expire in 1 week
-                )
-                db.session.add(insight)
+            # Store insights in database with one multi-row INSERT
+            expires_at = datetime.now() + timedelta(days=7)  # Insights expire in 1 week
+            rows = [{
+                'team_id': team_id,
+                'insight_type': insight_data['type'],
+                'insight_title': insight_data['title'],
+                'insight_description': insight_data['description'],
+                'recommendation': insight_data.get('recommendation'),
+                'confidence_score': insight_data.get('confidence', 0.0),
+                'priority_level': insight_data.get('priority', 'medium'),
+                'data_points_analyzed': insight_data.get('data_points', 0),
+                'expires_at': expires_at
+            } for insight_data in insights_result.get('insights', [])]
+            if rows:
+                db.session.execute(insert(TeamAIInsights), rows)
             
             db.session.commit()
+            invalidate_team_analytics(team_id)
             
-            return jsonify({
+            result = {
                 'success': True,
-                'message': f'{len(insights_result.get("insights", []))} insights generated',
-                'insights_count': len(insights_result.get('insights', []))
-            })
+                'message': f'{len(rows)} insights generated',
+                'insights_count': len(rows)
+            }
+            _set_last_insights_result(team_id, result)
+            return jsonify(result)
         else:
+            _release_insights_generation(team_id)
             return jsonify({'success': False, 'error': insights_result.get('error', 'Failed to generate insights')}), 500
             
     except Exception as e:
         logging.error(f"Error generating team insights: {str(e)}")
+        if claimed:
+            _release_insights_generation(team_id)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Columns serialized by /api/smart-suggestions; Postgres formats the timestamp
+SUGGESTION_COLUMNS = (
+    SmartEmailSuggestion.id, SmartEmailSuggestion.suggestion_type, SmartEmailSuggestion.suggested_content,
+    SmartEmailSuggestion.relevance_score, SmartEmailSuggestion.tone_match_score,
+    SmartEmailSuggestion.predicted_effectiveness,
+    db.func.to_char(SmartEmailSuggestion.created_at, ISO_SECONDS_FORMAT).label('created_at_iso')
+)
+
+def _suggestions_cache_key(r, team_id, user_id):
+    version = r.get(suggestions_version_key(team_id, user_id)) or '0'
+    return f"sugg:{team_id}:{user_id}:{version}"
+
+def _get_cached_suggestions(team_id, user_id):
+    """(cache key, cached suggestions JSON text or None); key is None without Redis"""
+    r = get_redis()
+    if r is None:
+        return None, None
+    try:
+        key = _suggestions_cache_key(r, team_id, user_id)
+        return key, r.get(key)
+    except redis.RedisError as e:
+        logging.warning(f"Suggestions cache read failed: {str(e)}")
+        return None, None
+
+def _set_cached_suggestions(key, payload):
+    r = get_redis()
+    if r is None or key is None:
+        return
+    try:
+        r.setex(key, SUGGESTIONS_CACHE_TTL, orjson.dumps(payload))
+    except redis.RedisError as e:
+        logging.warning(f"Suggestions cache write failed: {str(e)}")
+
 @app.route('/api/smart-suggestions/<team_id>')
 @require_login
 def get_smart_suggestions(team_id):
     """Get AI-powered smart suggestions for the team"""
     try:
         # Verify team access
-        team_member = TeamMember.query.filter_by(
-            team_id=team_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not team_member:
+        if _team_role(team_id, current_user.id) is None:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
             
+        cache_key, cached = _get_cached_suggestions(team_id, current_user.id)
+        if cached:
+            return Response(f'{{"success": true, "suggestions": {cached}}}', mimetype='application/json')
+        
         # Get recent suggestions for this user
-        suggestions = SmartEmailSuggestion.query.filter_by(
-            team_id=team_id,
-            user_id=current_user.id
-        ).order_by(SmartEmailSuggestion.created_at.desc()).limit(5).all()
+        suggestions = db.session.execute(
+            select(*SUGGESTION_COLUMNS).where(
+                SmartEmailSuggestion.team_id == team_id,
+                SmartEmailSuggestion.user_id == current_user.id
+            ).order_by(SmartEmailSuggestion.created_at.desc()).limit(5)
+        ).all()
         
         # Generate new suggestions if none exist
         if not suggestions:
@@ -1994,32 +2317,42 @@ def get_smart_suggestions(team_id):
             )
             
             if suggestion_result.get('success'):
-                for suggestion_data in suggestion_result.get('suggestions', []):
-                    suggestion = SmartEmailSuggestion(
-                        team_id=team_id,
-                        user_id=current_user.id,
-                        suggestion_type=suggestion_data['type'],
-                        suggested_content=suggestion_data['content'],
-                        relevance_score=suggestion_data.get('relevance', 0.0),
-                        tone_match_score=suggestion_data.get('tone_match', 0.0),
-                        predicted_effectiveness=suggestion_data.get('effectiveness', 0.0)
-                    )
-                    db.session.add(suggestion)
-                    suggestions.append(suggestion)
-                
-                db.session.commit()
+                rows = [{
+                    'team_id': team_id,
+                    'user_id': current_user.id,
+                    'suggestion_type': suggestion_data['type'],
+                    'suggested_content': suggestion_data['content'],
+                    'relevance_score': suggestion_data.get('relevance', 0.0),
+                    'tone_match_score': suggestion_data.get('tone_match', 0.0),
+                    'predicted_effectiveness': suggestion_data.get('effectiveness', 0.0)
+                } for suggestion_data in suggestion_result.get('suggestions', [])]
+                if rows:
+                    # One multi-row INSERT; RETURNING hands back the response
+                    # columns as plain rows, so nothing is re-fetched
+                    suggestions = db.session.execute(
+                        insert(SmartEmailSuggestion).returning(*SUGGESTION_COLUMNS), rows
+                    ).all()
+                    db.session.commit()
+                    # The version read above is now stale; the next read caches anew
+                    invalidate_smart_suggestions(team_id, current_user.id)
+                    cache_key = None
+        
+        payload = [{
+            'id': s.id,
+            'type': s.suggestion_type,
+            'content': s.suggested_content,
+            'relevance': s.relevance_score,
+            'tone_match': s.tone_match_score,
+            'effectiveness': s.predicted_effectiveness,
+            'created_at': s.created_at_iso
+        } for s in suggestions]
+        # An empty list isn't cached so the next request tries generating again
+        if payload:
+            _set_cached_suggestions(cache_key, payload)
         
         return jsonify({
             'success': True,
-            'suggestions': [{
-                'id': s.id,
-                'type': s.suggestion_type,
-                'content': s.suggested_content,
-                'relevance': s.relevance_score,
-                'tone_match': s.tone_match_score,
-                'effectiveness': s.predicted_effectiveness,
-                'created_at': s.created_at.isoformat()
-            } for s in suggestions]
+            'suggestions': payload
         })
         
     except Exception as e:
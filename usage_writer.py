@@ -0,0 +1,119 @@
+"""
+Background writer for token usage telemetry.
+
+Token usage is logged after every AI operation. Rather than an INSERT and
+commit on the caller's thread, rows go onto a bounded queue that a daemon
+thread drains in batches (up to USAGE_BATCH_SIZE rows, or whatever arrived
+within USAGE_FLUSH_INTERVAL seconds) with one multi-row INSERT per batch.
+
+Cached team analytics are not invalidated per flush; they go stale on their
+own after TEAM_ANALYTICS_CACHE_TTL seconds.
+"""
+import os
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+
+USAGE_QUEUE_SIZE = int(os.environ.get("USAGE_QUEUE_SIZE", "10000"))
+USAGE_BATCH_SIZE = int(os.environ.get("USAGE_BATCH_SIZE", "500"))
+USAGE_FLUSH_INTERVAL = float(os.environ.get("USAGE_FLUSH_INTERVAL", "0.2"))
+
+# Every row in a batch must carry the same keys for the executemany INSERT
+USAGE_COLUMNS = ('user_id', 'team_id', 'ai_model', 'operation_type', 'tokens_consumed', 'cost_usd',
+                 'generation_time_ms', 'quality_score', 'user_satisfaction', 'email_id',
+                 'prompt_length', 'response_length')
+
+
+def is_team_id(value) -> bool:
+    """Whether value looks like a teams.id (a UUID); callers without a team pass
+    placeholders such as personal_<user id>, which would fail the foreign key"""
+    try:
+        return str(uuid.UUID(value)) == value.lower()
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+class UsageWriter:
+    """Bounded queue of token_usage rows flushed in batches by one daemon thread"""
+
+    def __init__(self, maxsize: int = USAGE_QUEUE_SIZE, batch_size: int = USAGE_BATCH_SIZE,
+                 interval: float = USAGE_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, row: dict) -> None:
+        """Queue a usage row; when the queue is full it is written inline instead.
+        Rows without a real team are dropped, since one would fail its whole batch"""
+        if not is_team_id(row.get('team_id')):
+            logging.debug(f"Skipping token usage without a team: {row.get('team_id')}")
+            return
+        row = {column: row.get(column) for column in USAGE_COLUMNS}
+        if row['cost_usd'] is None:
+            row['cost_usd'] = 0.0
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logging.warning("Token usage queue full, writing inline")
+            self._write([row])
+
+    def flush(self) -> None:
+        """Write everything still queued; runs at interpreter exit"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, rows):
+        # Imported here to avoid circular imports
+        from app import app, db
+        from models import TokenUsage
+
+        try:
+            with app.app_context():
+                TokenUsage.bulk_record(db.session, rows)
+                db.session.commit()
+        except Exception as e:
+            if len(rows) == 1:
+                logging.error(f"Error logging token usage: {str(e)}")
+                return
+            # One bad row (e.g. an unknown team) shouldn't drop the batch
+            logging.warning(f"Token usage batch of {len(rows)} failed, retrying rows individually: {str(e)}")
+            for row in rows:
+                self._write([row])
+
+
+usage_writer = UsageWriter()
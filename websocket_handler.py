@@ -1,19 +1,280 @@
+from flask import request
 from flask_socketio import emit, join_room, leave_room, rooms
 from flask_login import current_user
-from app import socketio, db
-from models import CollaborationSession, Email, EmailDraft
+from sqlalchemy import select, bindparam, update, delete, func, tuple_, values, column, String, Integer
+from app import app, socketio, db
+from cache import get_redis
+from models import CollaborationSession, Email, EmailDraft, TeamAIInsights, TeamMember
 import json
 import logging
-from datetime import datetime
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
 
-# Store active collaboration sessions
+# Store active collaboration sessions (in-process fallback when Redis is not
+# configured): email_id -> user_id -> presence metadata
 active_sessions = {}
+_presence_seen = {}  # (email_id, user_id) -> last activity epoch seconds
+
+# Prebuilt statements for the per-event lookups; executed with bound
+# parameters so the compiled SQL cache always hits
+_sel_team_member = select(TeamMember.id).where(
+    TeamMember.user_id == bindparam('uid'),
+    TeamMember.team_id == bindparam('tid')
+).limit(1)
+_sel_collab_session = select(CollaborationSession).where(
+    CollaborationSession.email_id == bindparam('eid'),
+    CollaborationSession.user_id == bindparam('uid')
+).limit(1)
+_sel_active_draft = select(EmailDraft).where(
+    EmailDraft.email_id == bindparam('eid'),
+    EmailDraft.user_id == bindparam('uid'),
+    EmailDraft.is_active == True
+).limit(1)
+
+# Presence entries idle for longer than the TTL are swept as ghosts
+PRESENCE_TTL_SECONDS = 60
+PRESENCE_SWEEP_INTERVAL = 30
+_sweeper_started = False
+# Inactive sessions and expired insights are deleted in bulk this often
+STALE_PURGE_INTERVAL = 3600
+STALE_RETENTION = timedelta(days=1)
+_sweeper_lock = threading.Lock()
+
+# Cursor/activity heartbeats are coalesced per (email_id, user_id) and written
+# back in one UPDATE ... FROM (VALUES ...) per interval instead of per event
+HEARTBEAT_FLUSH_INTERVAL = 1.0
+_heartbeats = {}  # (email_id, user_id) -> cursor_position
+_heartbeat_lock = threading.Lock()
+
+# Direct handle on python-socketio's emit for hot room broadcasts; skips the
+# flask-socketio wrapper and its request-context lookups on every call
+_server_emit = socketio.server.emit
+
+# Connected sids per collaboration room; lets sender-excluding broadcasts be
+# skipped outright when nobody else is in the room
+_room_size = {}
+
+def _room_name(email_id):
+    """Interned collaboration room name for an email"""
+    return sys.intern(f"email_{email_id}")
+
+def _room_left(room_name):
+    """Decrement a room's member count, dropping it once empty"""
+    size = _room_size.get(room_name, 0) - 1
+    if size > 0:
+        _room_size[room_name] = size
+    else:
+        _room_size.pop(room_name, None)
+
+def _presence_touch(email_id, user_id, **fields):
+    """Record activity for a user in a room, merging any metadata fields"""
+    now = time.time()
+    fields['last_seen'] = datetime.now().isoformat()
+    r = get_redis()
+    joining = 'user_name' in fields
+    if r is not None:
+        mapping = {k: ('' if v is None else v) for k, v in fields.items()}
+        if not joining:
+            # Only refresh users that already joined the room
+            if r.zadd(f"presence:{email_id}", {user_id: now}, xx=True, ch=True):
+                r.hset(f"presence:{email_id}:{user_id}", mapping=mapping)
+            return
+        pipe = r.pipeline()
+        pipe.zadd(f"presence:{email_id}", {user_id: now})
+        pipe.hset(f"presence:{email_id}:{user_id}", mapping=mapping)
+        pipe.sadd("presence:rooms", email_id)
+        pipe.sadd(f"presence_user:{user_id}", email_id)
+        pipe.execute()
+        return
+
+    if joining:
+        active_sessions.setdefault(email_id, {})[user_id] = fields
+    elif user_id in active_sessions.get(email_id, {}):
+        active_sessions[email_id][user_id].update(fields)
+    else:
+        return
+    _presence_seen[(email_id, user_id)] = now
+
+def _presence_remove(email_id, user_id):
+    """Drop a user's presence in a room"""
+    r = get_redis()
+    if r is not None:
+        pipe = r.pipeline()
+        pipe.zrem(f"presence:{email_id}", user_id)
+        pipe.delete(f"presence:{email_id}:{user_id}")
+        pipe.srem(f"presence_user:{user_id}", email_id)
+        pipe.execute()
+        return
+
+    _presence_seen.pop((email_id, user_id), None)
+    users = active_sessions.get(email_id)
+    if users and user_id in users:
+        del users[user_id]
+        # Clean up empty sessions
+        if not users:
+            del active_sessions[email_id]
+
+def _presence_users(email_id):
+    """Metadata for every user currently present in a room"""
+    r = get_redis()
+    if r is None:
+        return list(active_sessions.get(email_id, {}).values())
+
+    user_ids = r.zrange(f"presence:{email_id}", 0, -1)
+    if not user_ids:
+        return []
+    pipe = r.pipeline()
+    for user_id in user_ids:
+        pipe.hgetall(f"presence:{email_id}:{user_id}")
+    users = []
+    for meta in pipe.execute():
+        if meta:
+            meta['cursor_position'] = int(meta.get('cursor_position') or 0)
+            meta['user_image'] = meta.get('user_image') or None
+            users.append(meta)
+    return users
+
+def _presence_rooms_for(user_id):
+    """Email ids of every room a user is present in"""
+    r = get_redis()
+    if r is not None:
+        return list(r.smembers(f"presence_user:{user_id}"))
+    return [email_id for email_id, users in active_sessions.items() if user_id in users]
+
+def _presence_expire(cutoff):
+    """Remove entries idle since before cutoff; returns (email_id, user_id) pairs"""
+    expired = []
+    r = get_redis()
+    if r is not None:
+        for email_id in r.smembers("presence:rooms"):
+            key = f"presence:{email_id}"
+            for user_id in r.zrangebyscore(key, 0, cutoff):
+                expired.append((email_id, user_id))
+            if r.zcard(key) == 0:
+                r.srem("presence:rooms", email_id)
+    else:
+        expired = [pair for pair, seen in list(_presence_seen.items()) if seen < cutoff]
+
+    for email_id, user_id in expired:
+        _presence_remove(email_id, user_id)
+    return expired
+
+def _purge_stale_rows():
+    """Bulk-delete rows that reads already filter out as stale"""
+    # Computed by the database, the same clock that writes last_seen
+    cutoff = func.now() - STALE_RETENTION
+    with app.app_context():
+        sessions = db.session.execute(
+            delete(CollaborationSession).where(
+                CollaborationSession.is_active == False,
+                CollaborationSession.last_seen < cutoff
+            )
+        ).rowcount
+        insights = db.session.execute(
+            delete(TeamAIInsights).where(TeamAIInsights.expires_at < cutoff)
+        ).rowcount
+        db.session.commit()
+    if sessions or insights:
+        logging.info(f"Purged {sessions} inactive collaboration sessions and {insights} expired insights")
+
+def _presence_sweeper():
+    """Periodically evict ghost collaborators that never sent a disconnect"""
+    last_purge = 0.0
+    while True:
+        socketio.sleep(PRESENCE_SWEEP_INTERVAL)
+        if time.time() - last_purge >= STALE_PURGE_INTERVAL:
+            last_purge = time.time()
+            try:
+                _purge_stale_rows()
+            except Exception as e:
+                logging.error(f"Error purging stale rows: {str(e)}")
+        try:
+            expired = _presence_expire(time.time() - PRESENCE_TTL_SECONDS)
+            if not expired:
+                continue
+
+            with app.app_context():
+                db.session.execute(
+                    update(CollaborationSession)
+                    .where(
+                        tuple_(CollaborationSession.email_id, CollaborationSession.user_id).in_(expired),
+                        CollaborationSession.is_active == True
+                    )
+                    .values(is_active=False, last_seen=func.now())
+                )
+                db.session.commit()
+
+            for email_id, user_id in expired:
+                socketio.emit('user_left', {
+                    'user_id': user_id,
+                    'active_users': _presence_users(email_id)
+                }, room=_room_name(email_id))
+
+            logging.info(f"Swept {len(expired)} stale collaboration sessions")
+        except Exception as e:
+            logging.error(f"Error sweeping stale collaboration sessions: {str(e)}")
+
+def _queue_heartbeat(email_id, user_id, cursor_position):
+    """Buffer a session's latest activity for the next batched write"""
+    try:
+        cursor_position = int(cursor_position or 0)
+    except (TypeError, ValueError):
+        cursor_position = 0
+    with _heartbeat_lock:
+        _heartbeats[(email_id, user_id)] = cursor_position
+
+def _flush_heartbeats():
+    """Write all buffered heartbeats with a single UPDATE"""
+    global _heartbeats
+    with _heartbeat_lock:
+        if not _heartbeats:
+            return
+        pending, _heartbeats = _heartbeats, {}
+
+    rows = values(
+        column('eid', String), column('uid', String), column('pos', Integer),
+        name='hb'
+    ).data([(eid, uid, pos) for (eid, uid), pos in pending.items()])
+    with app.app_context():
+        db.session.execute(
+            update(CollaborationSession)
+            .where(
+                CollaborationSession.email_id == rows.c.eid,
+                CollaborationSession.user_id == rows.c.uid,
+                CollaborationSession.is_active == True
+            )
+            .values(last_seen=func.now(), cursor_position=rows.c.pos)
+        )
+        db.session.commit()
+
+def _heartbeat_writer():
+    """Periodically flush buffered collaboration heartbeats"""
+    while True:
+        socketio.sleep(HEARTBEAT_FLUSH_INTERVAL)
+        try:
+            _flush_heartbeats()
+        except Exception as e:
+            logging.error(f"Error writing collaboration heartbeats: {str(e)}")
+
+def _ensure_presence_sweeper():
+    """Start the presence sweeper and heartbeat writer once per process"""
+    global _sweeper_started
+    if _sweeper_started:
+        return
+    with _sweeper_lock:
+        if not _sweeper_started:
+            socketio.start_background_task(_presence_sweeper)
+            socketio.start_background_task(_heartbeat_writer)
+            _sweeper_started = True
 
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
     if current_user.is_authenticated:
         logging.info(f"User {current_user.id} connected to WebSocket")
+        _ensure_presence_sweeper()
         emit('connected', {'message': 'Connected to AI Email Assistant'})
     else:
         logging.warning("Unauthenticated user attempted WebSocket connection")
@@ -24,6 +285,9 @@ def handle_disconnect():
     """Handle client disconnection"""
     if current_user.is_authenticated:
         logging.info(f"User {current_user.id} disconnected from WebSocket")
+        for room_name in rooms():
+            if room_name in _room_size:
+                _room_left(room_name)
         # Clean up any active collaboration sessions
         cleanup_user_sessions(current_user.id)
 
@@ -39,7 +303,7 @@ def handle_join_collaboration(data):
         return
     
     # Verify user has access to this email
-    email = Email.query.get(email_id)
+    email = db.session.get(Email, email_id)
     if not email:
         emit('error', {'message': 'Email not found'})
         return
@@ -50,14 +314,16 @@ def handle_join_collaboration(data):
         return
     
     # Join the collaboration room
-    room_name = f"email_{email_id}"
-    join_room(room_name)
+    room_name = _room_name(email_id)
+    if room_name not in rooms():
+        join_room(room_name)
+        _room_size[room_name] = _room_size.get(room_name, 0) + 1
     
     # Create or update collaboration session
-    session = CollaborationSession.query.filter_by(
-        email_id=email_id,
-        user_id=current_user.id
-    ).first()
+    with db.session.no_autoflush:
+        session = db.session.execute(
+            _sel_collab_session, {'eid': email_id, 'uid': current_user.id}
+        ).scalar()
     
     if not session:
         session = CollaborationSession(
@@ -68,33 +334,33 @@ def handle_join_collaboration(data):
         db.session.add(session)
     else:
         session.is_active = True
-        session.last_seen = datetime.now()
+        session.last_seen = func.clock_timestamp()
     
     db.session.commit()
     
     # Store session info
-    if email_id not in active_sessions:
-        active_sessions[email_id] = {}
-    
-    active_sessions[email_id][current_user.id] = {
-        'user_name': f"{current_user.first_name} {current_user.last_name}".strip() or current_user.email,
-        'user_image': current_user.profile_image_url,
-        'cursor_position': 0,
-        'last_seen': datetime.now().isoformat()
-    }
+    user_name = f"{current_user.first_name} {current_user.last_name}".strip() or current_user.email
+    _presence_touch(
+        email_id,
+        current_user.id,
+        user_name=user_name,
+        user_image=current_user.profile_image_url,
+        cursor_position=0
+    )
+    active_users = _presence_users(email_id)
     
     # Notify other users in the room
     emit('user_joined', {
         'user_id': current_user.id,
-        'user_name': active_sessions[email_id][current_user.id]['user_name'],
+        'user_name': user_name,
         'user_image': current_user.profile_image_url,
-        'active_users': list(active_sessions[email_id].values())
+        'active_users': active_users
     }, room=room_name)
     
     # Send current active users to the joining user
     emit('collaboration_joined', {
         'email_id': email_id,
-        'active_users': list(active_sessions[email_id].values())
+        'active_users': active_users
     })
 
 @socketio.on('leave_collaboration')
@@ -107,31 +373,28 @@ def handle_leave_collaboration(data):
     if not email_id:
         return
     
-    room_name = f"email_{email_id}"
-    leave_room(room_name)
+    room_name = _room_name(email_id)
+    if room_name in rooms():
+        leave_room(room_name)
+        _room_left(room_name)
     
     # Update collaboration session
-    session = CollaborationSession.query.filter_by(
-        email_id=email_id,
-        user_id=current_user.id
-    ).first()
+    with db.session.no_autoflush:
+        session = db.session.execute(
+            _sel_collab_session, {'eid': email_id, 'uid': current_user.id}
+        ).scalar()
     
     if session:
         session.is_active = False
         db.session.commit()
     
     # Remove from active sessions
-    if email_id in active_sessions and current_user.id in active_sessions[email_id]:
-        del active_sessions[email_id][current_user.id]
-        
-        # Clean up empty sessions
-        if not active_sessions[email_id]:
-            del active_sessions[email_id]
+    _presence_remove(email_id, current_user.id)
     
     # Notify other users
     emit('user_left', {
         'user_id': current_user.id,
-        'active_users': list(active_sessions.get(email_id, {}).values())
+        'active_users': _presence_users(email_id)
     }, room=room_name)
 
 @socketio.on('email_content_change')
@@ -148,17 +411,15 @@ def handle_email_content_change(data):
         return
     
     # Update cursor position in active sessions
-    if email_id in active_sessions and current_user.id in active_sessions[email_id]:
-        active_sessions[email_id][current_user.id]['cursor_position'] = cursor_position
-        active_sessions[email_id][current_user.id]['last_seen'] = datetime.now().isoformat()
+    _presence_touch(email_id, current_user.id, cursor_position=cursor_position)
+    _queue_heartbeat(email_id, current_user.id, cursor_position)
     
     # Save draft version
     try:
-        draft = EmailDraft.query.filter_by(
-            email_id=email_id,
-            user_id=current_user.id,
-            is_active=True
-        ).first()
+        with db.session.no_autoflush:
+            draft = db.session.execute(
+                _sel_active_draft, {'eid': email_id, 'uid': current_user.id}
+            ).scalar()
         
         if not draft:
             draft = EmailDraft(
@@ -175,14 +436,15 @@ def handle_email_content_change(data):
         db.session.commit()
         
         # Broadcast changes to other users in the room
-        room_name = f"email_{email_id}"
-        emit('content_updated', {
-            'user_id': current_user.id,
-            'content': content,
-            'cursor_position': cursor_position,
-            'timestamp': datetime.now().isoformat(),
-            'version': draft.version
-        }, room=room_name, include_self=False)
+        room_name = _room_name(email_id)
+        if _room_size.get(room_name, 0) > 1:
+            _server_emit('content_updated', {
+                'user_id': current_user.id,
+                'content': content,
+                'cursor_position': cursor_position,
+                'timestamp': datetime.now().isoformat(),
+                'version': draft.version
+            }, room=room_name, namespace='/', skip_sid=request.sid)
         
     except Exception as e:
         logging.error(f"Error saving email draft: {str(e)}")
@@ -201,16 +463,16 @@ def handle_cursor_update(data):
         return
     
     # Update cursor position
-    if email_id in active_sessions and current_user.id in active_sessions[email_id]:
-        active_sessions[email_id][current_user.id]['cursor_position'] = cursor_position
-        active_sessions[email_id][current_user.id]['last_seen'] = datetime.now().isoformat()
+    _presence_touch(email_id, current_user.id, cursor_position=cursor_position)
+    _queue_heartbeat(email_id, current_user.id, cursor_position)
     
     # Broadcast cursor position to other users
-    room_name = f"email_{email_id}"
-    emit('cursor_moved', {
-        'user_id': current_user.id,
-        'cursor_position': cursor_position
-    }, room=room_name, include_self=False)
+    room_name = _room_name(email_id)
+    if _room_size.get(room_name, 0) > 1:
+        _server_emit('cursor_moved', {
+            'user_id': current_user.id,
+            'cursor_position': cursor_position
+        }, room=room_name, namespace='/', skip_sid=request.sid)
 
 @socketio.on('ai_generation_start')
 def handle_ai_generation_start(data):
@@ -224,12 +486,12 @@ def handle_ai_generation_start(data):
     if not email_id:
         return
     
-    room_name = f"email_{email_id}"
-    emit('ai_generation_started', {
+    room_name = _room_name(email_id)
+    _server_emit('ai_generation_started', {
         'user_id': current_user.id,
         'model': model,
         'timestamp': datetime.now().isoformat()
-    }, room=room_name)
+    }, room=room_name, namespace='/')
 
 @socketio.on('ai_generation_complete')
 def handle_ai_generation_complete(data):
@@ -245,14 +507,14 @@ def handle_ai_generation_complete(data):
     if not email_id:
         return
     
-    room_name = f"email_{email_id}"
-    emit('ai_generation_completed', {
+    room_name = _room_name(email_id)
+    _server_emit('ai_generation_completed', {
         'user_id': current_user.id,
         'content': content,
         'model_used': model_used,
         'generation_time_ms': generation_time,
         'timestamp': datetime.now().isoformat()
-    }, room=room_name)
+    }, room=room_name, namespace='/')
 
 @socketio.on('email_sent')
 def handle_email_sent(data):
@@ -267,7 +529,7 @@ def handle_email_sent(data):
         return
     
     # Get email details
-    email = Email.query.get(email_id)
+    email = db.session.get(Email, email_id)
     if not email:
         return
     
@@ -285,30 +547,28 @@ def handle_email_sent(data):
 def cleanup_user_sessions(user_id: str):
     """Clean up collaboration sessions for a disconnected user"""
     try:
-        # Mark database sessions as inactive
-        sessions = CollaborationSession.query.filter_by(
-            user_id=user_id,
-            is_active=True
-        ).all()
-        
-        for session in sessions:
-            session.is_active = False
-        
+        # Mark database sessions as inactive in a single UPDATE
+        db.session.execute(
+            update(CollaborationSession)
+            .where(
+                CollaborationSession.user_id == user_id,
+                CollaborationSession.is_active == True
+            )
+            .values(is_active=False, last_seen=func.now())
+        )
         db.session.commit()
         
-        # Remove from active sessions memory
-        sessions_to_clean = []
-        for email_id, users in active_sessions.items():
-            if user_id in users:
-                del users[user_id]
-                sessions_to_clean.append((email_id, users))
+        # Remove from presence tracking
+        sessions_to_clean = _presence_rooms_for(user_id)
+        for email_id in sessions_to_clean:
+            _presence_remove(email_id, user_id)
         
         # Notify remaining users in affected sessions
-        for email_id, remaining_users in sessions_to_clean:
-            room_name = f"email_{email_id}"
+        for email_id in sessions_to_clean:
+            room_name = _room_name(email_id)
             socketio.emit('user_left', {
                 'user_id': user_id,
-                'active_users': list(remaining_users.values())
+                'active_users': _presence_users(email_id)
             }, room=room_name)
         
     except Exception as e:
@@ -319,17 +579,18 @@ def has_team_access(user_id: str, team_id: str) -> bool:
     if not team_id:
         return False
     
-    from models import TeamMember
-    member = TeamMember.query.filter_by(
-        user_id=user_id,
-        team_id=team_id
-    ).first()
+    member_id = db.session.execute(
+        _sel_team_member, {'uid': user_id, 'tid': team_id}
+    ).scalar()
     
-    return member is not None
+    return member_id is not None
 
 # Periodic cleanup of stale sessions
 @socketio.on('ping')
 def handle_ping():
     """Handle ping for keeping connection alive"""
     if current_user.is_authenticated:
+        # A connected reader stays present even without edit activity
+        for email_id in _presence_rooms_for(current_user.id):
+            _presence_touch(email_id, current_user.id)
         emit('pong')